@@ -0,0 +1,9 @@
+import pytest
+
+
+@pytest.fixture(scope='session', autouse=True)
+def test_settings(django_test_environment):
+    """Настройки тестов из core.testing на весь прогон."""
+    from core.testing import test_settings
+    with test_settings():
+        yield
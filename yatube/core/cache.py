@@ -0,0 +1,301 @@
+"""Кэш на SQLite в локальном файле, общий для всех процессов.
+
+LocMemCache у каждого процесса свой: фрагменты и страницы собираются
+в каждом воркере заново, а сброс поколений в одном процессе не виден
+остальным. SQLiteCache хранит записи в одном файле БД в режиме WAL,
+поэтому воркеры читают параллельно и видят изменения друг друга без
+внешнего сервиса.
+
+Вытеснение — LRU: при превышении MAX_ENTRIES или OPTIONS['MAX_SIZE']
+(суммарный размер значений в байтах) удаляются сначала просроченные,
+затем давно не читавшиеся записи. Число записей и их размер ведут
+триггеры, поэтому проверка лимитов не сканирует таблицу.
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache.SQLiteCache',
+            'LOCATION': '/var/tmp/yatube-cache.sqlite3',
+            'OPTIONS': {'MAX_ENTRIES': 100_000, 'MAX_SIZE': 256 * 2 ** 20},
+        }
+    }
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    expires REAL,
+    accessed REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed);
+CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires);
+CREATE TABLE IF NOT EXISTS cache_stats (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    entries INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO cache_stats VALUES (0, 0, 0);
+CREATE TRIGGER IF NOT EXISTS cache_insert AFTER INSERT ON cache BEGIN
+    UPDATE cache_stats SET entries = entries + 1, size = size + NEW.size;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_delete AFTER DELETE ON cache BEGIN
+    UPDATE cache_stats SET entries = entries - 1, size = size - OLD.size;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_update AFTER UPDATE OF size ON cache
+BEGIN
+    UPDATE cache_stats SET size = size - OLD.size + NEW.size;
+END;
+'''
+
+UPSERT = '''
+INSERT INTO cache (key, value, size, expires, accessed)
+VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (key) DO UPDATE SET
+    value = excluded.value, size = excluded.size,
+    expires = excluded.expires, accessed = excluded.accessed
+'''
+
+# Время последнего чтения обновляется не чаще раза в секунду:
+# иначе каждое чтение было бы записью в БД.
+ACCESS_RESOLUTION = 1.0
+# SQLite ограничивает число параметров запроса.
+MAX_PARAMS = 500
+
+
+class SQLiteCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.location = location
+        options = params.get('OPTIONS', {})
+        self.max_size = options.get('MAX_SIZE')
+        self.busy_timeout = options.get('BUSY_TIMEOUT', 5.0)
+        self.local = threading.local()
+
+    @property
+    def connection(self):
+        # После fork соединение родителя использовать нельзя.
+        if getattr(self.local, 'pid', None) != os.getpid():
+            directory = os.path.dirname(self.location)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(
+                self.location, timeout=self.busy_timeout,
+                isolation_level=None,
+            )
+            connection.execute('PRAGMA journal_mode = WAL')
+            connection.execute('PRAGMA synchronous = NORMAL')
+            connection.executescript('BEGIN IMMEDIATE;' + SCHEMA + 'COMMIT;')
+            self.local.connection = connection
+            self.local.pid = os.getpid()
+        return self.local.connection
+
+    @staticmethod
+    def write(connection, func):
+        """Выполняет func в транзакции с блокировкой на запись."""
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            result = func()
+        except BaseException:
+            if connection.in_transaction:
+                connection.execute('ROLLBACK')
+            raise
+        if connection.in_transaction:
+            connection.execute('COMMIT')
+        return result
+
+    def keys(self, keys, version):
+        result = {}
+        for key in keys:
+            made = self.make_key(key, version=version)
+            self.validate_key(made)
+            result[made] = key
+        return result
+
+    def fetch(self, made_keys):
+        """Живые записи по готовым ключам с обновлением времени чтения."""
+        now = time.time()
+        found = {}
+        made_keys = list(made_keys)
+        for start in range(0, len(made_keys), MAX_PARAMS):
+            chunk = made_keys[start:start + MAX_PARAMS]
+            rows = self.connection.execute(
+                'SELECT key, value, accessed FROM cache WHERE key IN ({}) '
+                'AND (expires IS NULL OR expires > ?)'.format(
+                    ', '.join('?' * len(chunk))),
+                chunk + [now],
+            ).fetchall()
+            stale = []
+            for key, value, accessed in rows:
+                found[key] = pickle.loads(value)
+                if accessed < now - ACCESS_RESOLUTION:
+                    stale.append(key)
+            if stale:
+                self.connection.execute(
+                    'UPDATE cache SET accessed = ? WHERE key IN ({})'.format(
+                        ', '.join('?' * len(stale))),
+                    [now] + stale,
+                )
+        return found
+
+    def get(self, key, default=None, version=None):
+        made = self.make_key(key, version=version)
+        self.validate_key(made)
+        return self.fetch([made]).get(made, default)
+
+    def get_many(self, keys, version=None):
+        made_keys = self.keys(keys, version)
+        return {
+            made_keys[made]: value
+            for made, value in self.fetch(made_keys).items()
+        }
+
+    def has_key(self, key, version=None):
+        made = self.make_key(key, version=version)
+        self.validate_key(made)
+        return self.connection.execute(
+            'SELECT 1 FROM cache WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)', (made, time.time()),
+        ).fetchone() is not None
+
+    def row(self, made, value, timeout):
+        blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        return (
+            made, blob, len(blob), self.get_backend_timeout(timeout),
+            time.time(),
+        )
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        made_keys = self.keys(data, version)
+        rows = [
+            self.row(made, data[key], timeout)
+            for made, key in made_keys.items()
+        ]
+        connection = self.connection
+
+        def upsert():
+            connection.executemany(UPSERT, rows)
+            self.cull(connection)
+
+        self.write(connection, upsert)
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        made = self.make_key(key, version=version)
+        self.validate_key(made)
+        row = self.row(made, value, timeout)
+        connection = self.connection
+
+        def insert():
+            # Просроченная запись занимает ключ, но add её заменяет.
+            cursor = connection.execute(
+                UPSERT + ' WHERE cache.expires IS NOT NULL '
+                'AND cache.expires <= ?', row + (time.time(),),
+            )
+            added = cursor.rowcount > 0
+            if added:
+                self.cull(connection)
+            return added
+
+        return self.write(connection, insert)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        made = self.make_key(key, version=version)
+        self.validate_key(made)
+        cursor = self.connection.execute(
+            'UPDATE cache SET expires = ? WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (self.get_backend_timeout(timeout), made, time.time()),
+        )
+        return cursor.rowcount > 0
+
+    def incr(self, key, delta=1, version=None):
+        made = self.make_key(key, version=version)
+        self.validate_key(made)
+        connection = self.connection
+
+        def increment():
+            row = connection.execute(
+                'SELECT value FROM cache WHERE key = ? '
+                'AND (expires IS NULL OR expires > ?)', (made, time.time()),
+            ).fetchone()
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = pickle.loads(row[0]) + delta
+            blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            connection.execute(
+                'UPDATE cache SET value = ?, size = ? WHERE key = ?',
+                (blob, len(blob), made),
+            )
+            return value
+
+        return self.write(connection, increment)
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version)
+
+    def delete_many(self, keys, version=None):
+        made_keys = list(self.keys(keys, version))
+        for start in range(0, len(made_keys), MAX_PARAMS):
+            chunk = made_keys[start:start + MAX_PARAMS]
+            self.connection.execute(
+                'DELETE FROM cache WHERE key IN ({})'.format(
+                    ', '.join('?' * len(chunk))), chunk,
+            )
+
+    def clear(self):
+        self.connection.execute('DELETE FROM cache')
+
+    def stats(self):
+        """Число записей и их суммарный размер в байтах."""
+        return self.connection.execute(
+            'SELECT entries, size FROM cache_stats').fetchone()
+
+    def cull(self, connection):
+        entries, size = connection.execute(
+            'SELECT entries, size FROM cache_stats').fetchone()
+        over_size = self.max_size is not None and size > self.max_size
+        if entries <= self._max_entries and not over_size:
+            return
+        connection.execute(
+            'DELETE FROM cache WHERE expires <= ?', (time.time(),))
+        entries, size = connection.execute(
+            'SELECT entries, size FROM cache_stats').fetchone()
+        if entries > self._max_entries:
+            if self._cull_frequency == 0:
+                connection.execute('DELETE FROM cache')
+                return
+            connection.execute(
+                'DELETE FROM cache WHERE key IN (SELECT key FROM cache '
+                'ORDER BY accessed LIMIT ?)',
+                (max(entries // self._cull_frequency, 1),),
+            )
+        if self.max_size is not None:
+            # Удаляем самые старые записи, пока не уложимся в лимит
+            # с запасом в долю 1 / CULL_FREQUENCY.
+            target = self.max_size - self.max_size // max(
+                self._cull_frequency, 1)
+            connection.execute(
+                'DELETE FROM cache WHERE key IN ('
+                ' SELECT key FROM ('
+                '  SELECT key, SUM(size) OVER ('
+                '   ORDER BY accessed DESC, key'
+                '  ) AS kept FROM cache'
+                ' ) WHERE kept > ?'
+                ')', (target,),
+            )
+
+    def close(self, **kwargs):
+        # Соединение держится всё время жизни потока: открытие файла
+        # и PRAGMA на каждый запрос стоили бы дороже самого кэша.
+        pass
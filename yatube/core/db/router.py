@@ -0,0 +1,166 @@
+"""Чтение с реплики для view только на чтение.
+
+View, отмеченная декоратором replica_reads, читает из БД
+settings.REPLICA_DATABASE; всё остальное — чтение в прочих view и любая
+запись — идёт в основную БД. Реплика не используется, если:
+
+- посетитель сам писал, а реплика снята раньше: после запроса с
+  записью ReplicaMiddleware ставит cookie со временем записи, и автор
+  видит свои посты и комментарии сразу, а не после синхронизации;
+- в этом запросе уже была запись;
+- отставание реплики неизвестно или больше REPLICA_MAX_LAG;
+- области страницы (posts.generations) изменились позже, чем снята
+  реплика: иначе кэш страниц и ETag запомнили бы старое содержимое
+  под новым поколением.
+
+Отставание измеряет manage.py sync_replica: пишет метку времени
+Heartbeat в основную БД, читает её с реплики и кладёт в кэш. Заголовок
+X-Replica показывает, откуда читала страница: «replica; lag=0.8» или
+«primary; reason=pinned».
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+HEARTBEAT_KEY = 'replica:heartbeat'
+PIN_COOKIE = 'primary'
+HEADER = 'X-Replica'
+
+state = threading.local()
+
+
+def replica_reads(view_func):
+    """Отмечает view, которая только читает и может читать с реплики."""
+    view_func.replica_reads = True
+    return view_func
+
+
+def lag():
+    """Отставание реплики в секундах или None, если неизвестно."""
+    beat = cache.get(HEARTBEAT_KEY)
+    if beat is None:
+        return None
+    return max(time.time() - beat, 0.0)
+
+
+def on_replica():
+    """Читает ли текущий запрос с реплики."""
+    return getattr(state, 'alias', None) is not None
+
+
+def use_primary(reason):
+    """До конца запроса читать из основной БД."""
+    if on_replica():
+        state.alias = None
+        state.reason = reason
+
+
+def written():
+    """Запрос пишет: дочитывать из основной БД и закрепить посетителя."""
+    state.wrote = True
+    use_primary('written')
+
+
+def require_since(modified):
+    """Данные, изменённые в modified, должны быть видны в этом запросе."""
+    beat = getattr(state, 'beat', None)
+    if beat is not None and modified is not None:
+        if modified.timestamp() > beat:
+            use_primary('changed')
+
+
+class ReplicaRouter:
+    @property
+    def replica(self):
+        return getattr(settings, 'REPLICA_DATABASE', None)
+
+    def route(self, hints):
+        # Объект, прочитанный с реплики, пишется и дочитывается
+        # из основной БД.
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db == self.replica:
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def db_for_read(self, model, **hints):
+        if on_replica():
+            return state.alias
+        return self.route(hints)
+
+    def db_for_write(self, model, **hints):
+        written()
+        return self.route(hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        pair = {DEFAULT_DB_ALIAS, self.replica}
+        if {obj1._state.db, obj2._state.db} <= pair:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Реплика получает схему вместе с данными.
+        if db == self.replica:
+            return False
+        return None
+
+
+class ReplicaMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state.alias = None
+        state.beat = None
+        state.reason = None
+        state.wrote = False
+        try:
+            response = self.get_response(request)
+            if state.wrote:
+                # Дольше REPLICA_MAX_LAG cookie не нужна: такая реплика
+                # всё равно не используется.
+                response.set_cookie(
+                    PIN_COOKIE, f'{time.time():.3f}',
+                    max_age=settings.REPLICA_MAX_LAG,
+                    httponly=True, samesite='Lax',
+                )
+            if state.reason is not None:
+                response[HEADER] = self.describe()
+        finally:
+            state.alias = None
+            state.beat = None
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not getattr(view_func, 'replica_reads', False):
+            return
+        replica = getattr(settings, 'REPLICA_DATABASE', None)
+        state.lag = None if replica is None else lag()
+        if replica is None:
+            state.reason = 'none'
+        elif state.lag is None or state.lag > settings.REPLICA_MAX_LAG:
+            state.reason = 'lag'
+        elif state.wrote or self.written(request) > time.time() - state.lag:
+            state.reason = 'pinned'
+        else:
+            state.alias = replica
+            state.beat = time.time() - state.lag
+            state.reason = 'replica'
+
+    @staticmethod
+    def written(request):
+        """Время последней записи посетителя по cookie или 0."""
+        try:
+            return float(request.COOKIES.get(PIN_COOKIE, 0))
+        except ValueError:
+            return 0
+
+    @staticmethod
+    def describe():
+        if state.alias is not None:
+            return f'replica; lag={state.lag:.3f}'
+        if state.lag is None:
+            return f'primary; reason={state.reason}'
+        return f'primary; reason={state.reason}; lag={state.lag:.3f}'
@@ -0,0 +1,79 @@
+"""SQLite для нескольких воркеров: WAL, PRAGMA и транзакции на запись.
+
+Стандартный backend открывает файл с настройками по умолчанию: журнал
+отката блокирует чтение на время записи, а транзакция atomic начинается
+как DEFERRED. Два воркера, которые внутри atomic сначала читают, а
+потом пишут, не могут оба поднять блокировку до записи, и один сразу,
+без ожидания busy_timeout, получает «database is locked».
+
+Этот backend при каждом новом соединении включает WAL (читатели не ждут
+писателя) и PRAGMA из PRAGMAS, а atomic начинает с BEGIN IMMEDIATE:
+писатели встают в очередь по busy_timeout, а не падают. PRAGMA можно
+переопределить в OPTIONS:
+
+    DATABASES = {
+        'default': {
+            'ENGINE': 'core.db.sqlite3',
+            'NAME': 'db.sqlite3',
+            'CONN_MAX_AGE': None,
+            'OPTIONS': {'pragmas': {'cache_size': -128_000}},
+        }
+    }
+
+В OPTIONS['attach'] перечисляются другие БД, которые соединение
+присоединяет через ATTACH: {'схема': 'алиас'}. Так шард постов
+(posts.shards) видит таблицы основной БД и может их JOIN-ить. Внешние
+ключи проверяются как обычно, но только внутри одного файла: SQLite
+ищет родительскую таблицу в схеме дочерней. Ссылки из шарда на таблицы
+основной БД объявляются с db_constraint=False.
+"""
+from django.db import OperationalError, connections
+from django.db.backends.sqlite3 import base
+
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    # В WAL с NORMAL коммит не ждёт fsync; при сбое питания теряются
+    # последние транзакции, но файл остаётся целым.
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    # Отрицательное значение — в КиБ: 32 МБ страниц на соединение.
+    'cache_size': -32_000,
+    'mmap_size': 256 * 2 ** 20,
+    'temp_store': 'MEMORY',
+}
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    attach = {}
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        self.pragmas = {**PRAGMAS, **params.pop('pragmas', {})}
+        self.attach = params.pop('attach', {})
+        return params
+
+    def get_new_connection(self, conn_params):
+        connection = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            connection.execute(f'PRAGMA {name} = {value}')
+        for schema, alias in self.attach.items():
+            # Имя берётся при подключении: у тестовой БД оно другое.
+            name = connections[alias].settings_dict['NAME']
+            connection.execute(f'ATTACH DATABASE ? AS "{schema}"', [name])
+        return connection
+
+    def _start_transaction_under_autocommit(self):
+        # atomic начинает транзакцию здесь. С BEGIN (DEFERRED) первое
+        # чтение фиксирует снимок, и запись после записи другого
+        # воркера падает сразу, не дожидаясь busy_timeout.
+        if not self.attach:
+            self.cursor().execute('BEGIN IMMEDIATE')
+            return
+        # BEGIN IMMEDIATE заблокировал бы на запись и присоединённые БД.
+        # Пустой DELETE берёт блокировку только своего файла; до первой
+        # миграции sqlite_sequence нет, и транзакция остаётся DEFERRED.
+        self.cursor().execute('BEGIN')
+        try:
+            self.cursor().execute('DELETE FROM main.sqlite_sequence WHERE 0')
+        except OperationalError:
+            pass
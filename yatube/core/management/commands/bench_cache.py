@@ -0,0 +1,116 @@
+import multiprocessing
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import import_string
+
+BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'sqlite': 'core.cache.SQLiteCache',
+}
+
+
+def worker(args):
+    """Нагрузка одного процесса: чтение с дозаписью промахов и записи.
+
+    Возвращает задержки операций в микросекундах, число чтений
+    и попаданий.
+    """
+    backend, location, options, number = args
+    cache = import_string(BACKENDS[backend])(location, {
+        'OPTIONS': {'MAX_ENTRIES': options['keys'] * 2},
+    })
+    rng = random.Random(number)
+    value = os.urandom(options['value_size'])
+    batch = options['batch']
+    timings = []
+    reads = hits = 0
+    for _ in range(options['ops']):
+        keys = [
+            f'key{int(options["keys"] * rng.random() ** 2)}'
+            for _ in range(batch)
+        ]
+        start = time.perf_counter()
+        if rng.random() < options['reads']:
+            found = cache.get_many(keys) if batch > 1 else {
+                keys[0]: cache.get(keys[0])
+            }
+            missed = {
+                key: value for key in keys if found.get(key) is None
+            }
+            reads += len(keys)
+            hits += len(keys) - len(missed)
+            if missed:
+                cache.set_many(missed)
+        else:
+            cache.set_many(dict.fromkeys(keys, value))
+        timings.append((time.perf_counter() - start) * 1_000_000)
+    return timings, reads, hits
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает LocMemCache, FileBasedCache и SQLiteCache под '
+        'нагрузкой нескольких процессов: пропускная способность, '
+        'задержки и доля попаданий. У LocMemCache кэш в каждом '
+        'процессе свой, поэтому попаданий у него меньше.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'backends', nargs='*',
+            help=f'Что сравнить: {", ".join(BACKENDS)}; по умолчанию всё.'
+        )
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument(
+            '--ops', type=int, default=5000,
+            help='Операций на процесс.'
+        )
+        parser.add_argument('--keys', type=int, default=1000)
+        parser.add_argument('--value-size', type=int, default=1024)
+        parser.add_argument(
+            '--reads', type=float, default=0.9,
+            help='Доля операций чтения.'
+        )
+        parser.add_argument(
+            '--batch', type=int, default=1,
+            help='Ключей на операцию; больше 1 — get_many и set_many.'
+        )
+
+    def handle(self, *args, **options):
+        unknown = set(options['backends']) - set(BACKENDS)
+        if unknown:
+            raise CommandError(f'Неизвестные backend: {", ".join(unknown)}')
+        context = multiprocessing.get_context('fork')
+        self.stdout.write(
+            f'{"backend":<8} {"ops/s":>10} {"p50, мкс":>10} '
+            f'{"p99, мкс":>10} {"hits":>6}'
+        )
+        for backend in options['backends'] or BACKENDS:
+            with tempfile.TemporaryDirectory() as tmp:
+                location = (
+                    os.path.join(tmp, 'cache.sqlite3')
+                    if backend == 'sqlite' else tmp
+                )
+                jobs = [
+                    (backend, location, options, number)
+                    for number in range(options['workers'])
+                ]
+                start = time.perf_counter()
+                with context.Pool(options['workers']) as pool:
+                    results = pool.map(worker, jobs)
+                elapsed = time.perf_counter() - start
+            timings = [value for result in results for value in result[0]]
+            reads = sum(result[1] for result in results)
+            hits = sum(result[2] for result in results)
+            cuts = statistics.quantiles(timings, n=100)
+            self.stdout.write(
+                f'{backend:<8} {len(timings) / elapsed:>10.0f} '
+                f'{cuts[49]:>10.1f} {cuts[98]:>10.1f} '
+                f'{hits / max(reads, 1):>6.1%}'
+            )
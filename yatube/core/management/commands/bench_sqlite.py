@@ -0,0 +1,152 @@
+import multiprocessing
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections, transaction
+from django.db.models import F
+
+from posts.models import Comment, Post, PostStats
+from yatube.settings import PER_PAGE
+
+ALIAS = 'bench_sqlite'
+# Режим: (ENGINE, закрывать ли соединение после каждого запроса).
+MODES = {
+    'default': ('django.db.backends.sqlite3', True),
+    'persistent': ('django.db.backends.sqlite3', False),
+    'tuned': ('core.db.sqlite3', False),
+}
+
+
+def read(rng, ids):
+    """Первая страница ленты, как в index."""
+    list(
+        Post.objects.using(ALIAS).select_related('author', 'group')
+        .order_by('-pub_date', '-pk')[:PER_PAGE]
+    )
+
+
+def write(rng, ids):
+    """Комментарий со счётчиком в одной транзакции, как в add_comment.
+
+    bulk_create вместо create: сигналы счётчиков пишут в основную БД.
+    """
+    post_ids, author_ids = ids
+    with transaction.atomic(using=ALIAS):
+        post = Post.objects.using(ALIAS).only('pk').get(
+            pk=rng.choice(post_ids))
+        Comment.objects.using(ALIAS).bulk_create([Comment(
+            post=post, author_id=rng.choice(author_ids),
+            text='Комментарий из бенчмарка',
+        )])
+        PostStats.objects.using(ALIAS).filter(post_id=post.pk).update(
+            comments_count=F('comments_count') + 1)
+
+
+def worker(args):
+    """Нагрузка одного процесса: чтения ленты и записи комментариев.
+
+    Возвращает задержки удавшихся операций в микросекундах и число
+    ошибок «database is locked».
+    """
+    mode, name, options, ids, number = args
+    engine, reconnect = MODES[mode]
+    connections.databases[ALIAS] = {'ENGINE': engine, 'NAME': name}
+    rng = random.Random(number)
+    timings = []
+    errors = 0
+    for _ in range(options['ops']):
+        operation = read if rng.random() < options['reads'] else write
+        start = time.perf_counter()
+        try:
+            operation(rng, ids)
+        except OperationalError:
+            errors += 1
+        else:
+            timings.append((time.perf_counter() - start) * 1_000_000)
+        if reconnect:
+            # CONN_MAX_AGE = 0: соединение закрывается в конце запроса.
+            connections[ALIAS].close()
+    return timings, errors
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает настройки SQLite под нагрузкой нескольких '
+        'процессов на копии текущей БД: чтения первой страницы ленты '
+        'и записи комментариев. default — стандартный backend и новое '
+        'соединение на каждый запрос, persistent — стандартный backend '
+        'с постоянным соединением, tuned — core.db.sqlite3 (WAL, PRAGMA, '
+        'BEGIN IMMEDIATE) с постоянным соединением.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'modes', nargs='*',
+            help=f'Что сравнить: {", ".join(MODES)}; по умолчанию всё.'
+        )
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument(
+            '--ops', type=int, default=2000,
+            help='Операций на процесс.'
+        )
+        parser.add_argument(
+            '--reads', type=float, default=0.8,
+            help='Доля операций чтения.'
+        )
+
+    def handle(self, *args, **options):
+        unknown = set(options['modes']) - set(MODES)
+        if unknown:
+            raise CommandError(f'Неизвестные режимы: {", ".join(unknown)}')
+        if connection.vendor != 'sqlite':
+            raise CommandError('Бенчмарк только для SQLite.')
+        ids = (
+            list(Post.objects.values_list('pk', flat=True)),
+            list(Post.objects.values_list('author_id', flat=True).distinct()),
+        )
+        if not ids[0]:
+            raise CommandError('В БД нет постов; запустите seed.')
+        context = multiprocessing.get_context('fork')
+        self.stdout.write(
+            f'{"mode":<11} {"ops/s":>8} {"p50, мкс":>10} '
+            f'{"p99, мкс":>10} {"locked":>7}'
+        )
+        for mode in options['modes'] or MODES:
+            with tempfile.TemporaryDirectory() as tmp:
+                name = os.path.join(tmp, 'db.sqlite3')
+                self.copy(name)
+                jobs = [
+                    (mode, name, options, ids, number)
+                    for number in range(options['workers'])
+                ]
+                start = time.perf_counter()
+                with context.Pool(options['workers']) as pool:
+                    results = pool.map(worker, jobs)
+                elapsed = time.perf_counter() - start
+            timings = [value for result in results for value in result[0]]
+            errors = sum(result[1] for result in results)
+            cuts = statistics.quantiles(timings, n=100)
+            self.stdout.write(
+                f'{mode:<11} {len(timings) / elapsed:>8.0f} '
+                f'{cuts[49]:>10.1f} {cuts[98]:>10.1f} {errors:>7}'
+            )
+
+    @staticmethod
+    def copy(name):
+        """Копия текущей БД в режиме журнала по умолчанию.
+
+        WAL записывается в сам файл, поэтому копия переключается
+        обратно: режим выбирает backend, который меряется.
+        """
+        connection.ensure_connection()
+        target = sqlite3.connect(name)
+        try:
+            connection.connection.backup(target)
+            target.execute('PRAGMA journal_mode = DELETE')
+        finally:
+            target.close()
@@ -0,0 +1,71 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils import timezone
+
+from core.db import router
+from core.models import Heartbeat
+
+
+class Command(BaseCommand):
+    help = (
+        'Обновляет реплику для чтения и её отставание. Пишет метку '
+        'времени в основную БД, для SQLite-реплики копирует в неё '
+        'основную БД целиком (локальная замена настоящей реплики), '
+        'затем читает метку с реплики и кладёт в кэш для core.db.router. '
+        'С --interval повторяет это, пока не остановят.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help='Секунд между обновлениями; 0 — обновить один раз.'
+        )
+        parser.add_argument(
+            '--heartbeat-only', action='store_true',
+            help='Не копировать БД: реплику обновляет репликация.'
+        )
+
+    def handle(self, *args, **options):
+        replica = getattr(settings, 'REPLICA_DATABASE', None)
+        if replica not in connections.databases:
+            raise CommandError('Реплика не настроена: REPLICA_DATABASE.')
+        while True:
+            self.sync(replica, options['heartbeat_only'])
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def sync(self, replica, heartbeat_only):
+        Heartbeat.objects.update_or_create(
+            pk=1, defaults={'beat': timezone.now()})
+        if not heartbeat_only:
+            self.copy(replica)
+        beat = Heartbeat.objects.using(replica).filter(pk=1).values_list(
+            'beat', flat=True).first()
+        if beat is None:
+            self.stdout.write(self.style.WARNING('На реплике нет метки.'))
+            return
+        cache.set(router.HEARTBEAT_KEY, beat.timestamp(), None)
+        self.stdout.write(f'отставание реплики {router.lag():.3f} с')
+
+    @staticmethod
+    def copy(replica):
+        """Копирует основную БД в SQLite-реплику через backup API.
+
+        Читатели реплики в WAL видят прежний снимок, пока идёт копия.
+        """
+        source = connections[DEFAULT_DB_ALIAS]
+        target = connections[replica]
+        if source.vendor != 'sqlite' or target.vendor != 'sqlite':
+            raise CommandError(
+                'Копировать можно только SQLite; для настоящей реплики '
+                'запускайте с --heartbeat-only.')
+        if source.settings_dict['NAME'] == target.settings_dict['NAME']:
+            raise CommandError('Реплика указывает на основную БД.')
+        source.ensure_connection()
+        target.ensure_connection()
+        source.connection.backup(target.connection)
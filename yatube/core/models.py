@@ -2,10 +2,27 @@ from django.db import models
 
 
 class CreatedModel(models.Model):
-    """Добавляет дату создания."""
+    """Добавляет дату создания и дату последнего изменения."""
     pub_date = models.DateTimeField(
         auto_now_add=True
     )
+    updated_at = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True
+    )
 
     class Meta:
         abstract = True
+
+
+class Heartbeat(models.Model):
+    """Метка времени, которую sync_replica пишет в основную БД.
+
+    Та же строка, прочитанная с реплики, показывает, насколько реплика
+    отстаёт (core.db.router).
+    """
+    beat = models.DateTimeField('Время метки')
+
+    class Meta:
+        verbose_name = 'Метка реплики'
+        verbose_name_plural = 'Метки реплики'
@@ -0,0 +1,120 @@
+"""Учёт SQL-запросов запроса и бюджеты запросов для view.
+
+QueryBudgetMiddleware записывает все запросы, выполненные во время
+обработки запроса, и ищет повторяющиеся «формы» запросов, которые
+отличаются только параметрами (типичный N+1). View объявляет бюджет
+декоратором query_budget; при превышении бюджета или найденном N+1
+middleware пишет в лог, выдаёт предупреждение или бросает исключение
+в зависимости от QUERY_BUDGET_ACTION.
+"""
+import logging
+import re
+import time
+import warnings
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('yatube.queries')
+
+# Списки параметров разной длины в IN (...) дают одну форму запроса.
+PLACEHOLDERS_RE = re.compile(r'%s(?:\s*,\s*%s)+')
+
+
+class QueryBudgetExceeded(Exception):
+    """View выполнила больше запросов, чем объявлено в бюджете."""
+
+
+class QueryBudgetWarning(UserWarning):
+    pass
+
+
+def query_budget(limit):
+    """Объявляет максимальное число SQL-запросов для view."""
+    def decorator(view_func):
+        view_func.query_budget = limit
+        return view_func
+    return decorator
+
+
+def query_shape(sql):
+    return PLACEHOLDERS_RE.sub('%s...', sql)
+
+
+class QueryRecorder:
+    """Обёртка execute_wrapper, которая копит запросы по всем БД."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'alias': context['connection'].alias,
+                'sql': sql,
+                'time': time.perf_counter() - start,
+            })
+
+    def record(self):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(self))
+        return stack
+
+    def repeated(self, threshold):
+        """Формы запросов, повторённые не меньше threshold раз."""
+        shapes = Counter(
+            (query['alias'], query_shape(query['sql']))
+            for query in self.queries
+        )
+        return [
+            (sql, count) for (alias, sql), count in shapes.most_common()
+            if count >= threshold
+        ]
+
+
+class QueryBudgetMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        action = settings.QUERY_BUDGET_ACTION
+        if not action:
+            return self.get_response(request)
+        recorder = QueryRecorder()
+        request.query_recorder = recorder
+        with recorder.record():
+            response = self.get_response(request)
+        self.check(request, recorder, action)
+        if settings.DEBUG:
+            response['X-Query-Count'] = str(len(recorder.queries))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = getattr(
+            view_func, 'query_budget', settings.QUERY_BUDGET_DEFAULT
+        )
+
+    def check(self, request, recorder, action):
+        problems = []
+        budget = getattr(request, 'query_budget', None)
+        if budget is not None and len(recorder.queries) > budget:
+            problems.append(
+                f'{len(recorder.queries)} запросов при бюджете {budget}'
+            )
+        for sql, count in recorder.repeated(settings.QUERY_REPEAT_THRESHOLD):
+            problems.append(f'возможный N+1, {count} раз: {sql}')
+        if not problems:
+            return
+        message = f'{request.method} {request.path}: ' + '; '.join(problems)
+        if action == 'raise':
+            raise QueryBudgetExceeded(message)
+        if action == 'warn':
+            warnings.warn(message, QueryBudgetWarning)
+        else:
+            logger.warning(message)
@@ -0,0 +1,41 @@
+"""Настройки, которые меняются на время тестов.
+
+Тесты запускаются и через manage.py test (TestRunner ниже), и через
+pytest (conftest.py в корне репозитория); оба включают TEST_SETTINGS
+через override_settings на весь прогон. Отдельный тест может вернуть
+рабочее значение своим override_settings.
+"""
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+TEST_SETTINGS = {
+    # Кэш в памяти процесса: тесты не видят записей прошлых прогонов
+    # и не трогают файл кэша рабочей копии.
+    'CACHES': {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+    },
+    # Тестам нужен response.context, а в ответе из кэша его нет.
+    'PAGE_CACHE_ENABLED': False,
+    # Миниатюры создаются сразу: фоновый поток не должен писать
+    # во временный MEDIA_ROOT теста, который уже удаляется.
+    'THUMBNAIL_WORKERS': 0,
+    # Ленты тоже раскладываются сразу: тест проверяет их после запроса.
+    'TIMELINE_WORKERS': 0,
+}
+
+
+def test_settings():
+    return override_settings(**TEST_SETTINGS)
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.test_settings = test_settings()
+        self.test_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.test_settings.disable()
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,97 @@
+import os
+import shutil
+import tempfile
+import time
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import SimpleTestCase
+
+from core.cache import SQLiteCache
+
+
+class SQLiteCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.location = os.path.join(self.tmp, 'cache.sqlite3')
+        self.cache = self.make_cache()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def make_cache(self, **options):
+        return SQLiteCache(self.location, {'OPTIONS': options})
+
+    def test_get_set_delete(self):
+        self.cache.set('key', {'value': [1, 2]})
+        self.assertEqual(self.cache.get('key'), {'value': [1, 2]})
+        self.assertTrue(self.cache.has_key('key'))
+        self.cache.delete('key')
+        self.assertIsNone(self.cache.get('key'))
+        self.assertEqual(self.cache.get('key', 'default'), 'default')
+
+    def test_many(self):
+        self.cache.set_many({'a': 1, 'b': 2, 'c': 3})
+        self.assertEqual(
+            self.cache.get_many(['a', 'c', 'missing']), {'a': 1, 'c': 3})
+        self.cache.delete_many(['a', 'b'])
+        self.assertEqual(self.cache.get_many(['a', 'b', 'c']), {'c': 3})
+
+    def test_add_and_incr(self):
+        self.assertTrue(self.cache.add('counter', 1))
+        self.assertFalse(self.cache.add('counter', 10))
+        self.assertEqual(self.cache.incr('counter'), 2)
+        self.assertEqual(self.cache.decr('counter', 5), -3)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def test_expired_entries_are_invisible(self):
+        self.cache.set('key', 'value', timeout=10)
+        self.assertTrue(self.cache.add('forever', 'value', timeout=None))
+        with mock.patch('core.cache.time.time', return_value=time.time() + 60):
+            self.assertIsNone(self.cache.get('key'))
+            self.assertFalse(self.cache.has_key('key'))
+            self.assertTrue(self.cache.add('key', 'new'))
+            self.assertEqual(self.cache.get('forever'), 'value')
+
+    def test_instances_share_one_file(self):
+        other = self.make_cache()
+        self.cache.set('key', 'value')
+        self.assertEqual(other.get('key'), 'value')
+        other.clear()
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_max_entries_evicts_least_recently_used(self):
+        cache = self.make_cache(MAX_ENTRIES=4, CULL_FREQUENCY=2)
+        now = time.time()
+        for number in range(4):
+            with mock.patch('core.cache.time.time',
+                            return_value=now + number * 10):
+                cache.set(f'key{number}', number)
+        with mock.patch('core.cache.time.time', return_value=now + 50):
+            cache.get('key0')
+        with mock.patch('core.cache.time.time', return_value=now + 60):
+            cache.set('key4', 4)
+        self.assertEqual(
+            set(cache.get_many([f'key{number}' for number in range(5)])),
+            {'key0', 'key3', 'key4'})
+
+    def test_max_size_limits_stored_bytes(self):
+        cache = self.make_cache(MAX_SIZE=10_000)
+        for number in range(20):
+            cache.set(f'key{number}', b'x' * 1000)
+        entries, size = cache.stats()
+        self.assertLessEqual(size, 10_000)
+        self.assertEqual(entries, len(cache.get_many(
+            [f'key{number}' for number in range(20)])))
+        self.assertIsNotNone(cache.get('key19'))
+
+    def test_bench_cache_command(self):
+        stdout = StringIO()
+        call_command(
+            'bench_cache', 'locmem', 'sqlite', workers=2, ops=50,
+            stdout=stdout)
+        output = stdout.getvalue()
+        self.assertIn('locmem', output)
+        self.assertIn('sqlite', output)
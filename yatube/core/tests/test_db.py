@@ -0,0 +1,106 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.db.utils import load_backend
+from django.test import SimpleTestCase, TransactionTestCase
+
+from posts.models import Post
+
+User = get_user_model()
+
+
+class SQLiteBackendTest(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.name = os.path.join(self.tmp, 'db.sqlite3')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def make_connection(self, **options):
+        backend = load_backend('core.db.sqlite3')
+        wrapper = backend.DatabaseWrapper({
+            **connection.settings_dict, 'NAME': self.name,
+            'OPTIONS': options,
+        })
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    @staticmethod
+    def pragma(wrapper, name):
+        with wrapper.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas_are_set_on_connect(self):
+        wrapper = self.make_connection()
+        self.assertEqual(self.pragma(wrapper, 'journal_mode'), 'wal')
+        self.assertEqual(self.pragma(wrapper, 'synchronous'), 1)
+        self.assertEqual(self.pragma(wrapper, 'temp_store'), 2)
+        self.assertEqual(self.pragma(wrapper, 'busy_timeout'), 5000)
+        self.assertEqual(self.pragma(wrapper, 'cache_size'), -32_000)
+
+    def test_pragmas_from_options(self):
+        wrapper = self.make_connection(pragmas={'cache_size': -1000})
+        self.assertEqual(self.pragma(wrapper, 'cache_size'), -1000)
+        self.assertEqual(self.pragma(wrapper, 'synchronous'), 1)
+
+    def test_atomic_takes_write_lock_at_once(self):
+        """Транзакция atomic сразу блокирует запись другим соединениям"""
+        wrapper = self.make_connection()
+        self.pragma(wrapper, 'journal_mode')
+        other = sqlite3.connect(self.name, timeout=0, isolation_level=None)
+        self.addCleanup(other.close)
+        wrapper.set_autocommit(
+            False, force_begin_transaction_with_broken_autocommit=True)
+        try:
+            with self.assertRaisesMessage(
+                    sqlite3.OperationalError, 'database is locked'):
+                other.execute('BEGIN IMMEDIATE')
+        finally:
+            wrapper.rollback()
+            wrapper.set_autocommit(True)
+        other.execute('BEGIN IMMEDIATE')
+        other.execute('ROLLBACK')
+
+    def test_attach_from_options(self):
+        """OPTIONS['attach'] присоединяет БД, atomic блокирует только свою"""
+        wrapper = self.make_connection(attach={'primary': 'default'})
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM "primary".auth_user')
+            cursor.execute(
+                'CREATE TABLE item (id INTEGER PRIMARY KEY AUTOINCREMENT)')
+            cursor.execute('INSERT INTO item DEFAULT VALUES')
+        self.assertEqual(self.pragma(wrapper, 'foreign_keys'), 1)
+        other = sqlite3.connect(self.name, timeout=0, isolation_level=None)
+        self.addCleanup(other.close)
+        wrapper.set_autocommit(
+            False, force_begin_transaction_with_broken_autocommit=True)
+        try:
+            with self.assertRaisesMessage(
+                    sqlite3.OperationalError, 'database is locked'):
+                other.execute('BEGIN IMMEDIATE')
+        finally:
+            wrapper.rollback()
+            wrapper.set_autocommit(True)
+
+
+class BenchSQLiteCommandTest(TransactionTestCase):
+    # Бенчмарк копирует БД через backup: в транзакции TestCase копия
+    # ждала бы её конца.
+    def test_bench_sqlite_command(self):
+        author = User.objects.create_user(username='author')
+        Post.objects.create(author=author, text='Пост')
+        stdout = StringIO()
+        call_command(
+            'bench_sqlite', 'default', 'tuned', workers=2, ops=20,
+            stdout=stdout)
+        output = stdout.getvalue()
+        self.assertIn('default', output)
+        self.assertIn('tuned', output)
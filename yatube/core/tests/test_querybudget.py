@@ -0,0 +1,54 @@
+from django.contrib.auth import get_user_model
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+
+from core.querybudget import (QueryBudgetExceeded, QueryBudgetMiddleware,
+                              QueryRecorder, query_budget, query_shape)
+
+User = get_user_model()
+
+
+def users_one_by_one(request):
+    for pk in range(1, 7):
+        User.objects.filter(pk=pk).first()
+    return HttpResponse()
+
+
+class QueryBudgetTest(TestCase):
+    def setUp(self):
+        self.request = RequestFactory().get('/')
+
+    def run_view(self, view):
+        middleware = QueryBudgetMiddleware(view)
+        middleware.process_view(self.request, view, (), {})
+        return middleware(self.request)
+
+    def test_in_lists_have_one_shape(self):
+        """IN-списки разной длины дают одну форму запроса"""
+        self.assertEqual(
+            query_shape('SELECT 1 WHERE id IN (%s, %s, %s)'),
+            query_shape('SELECT 1 WHERE id IN (%s, %s)'))
+
+    def test_repeated_queries_are_found(self):
+        """Одинаковые по форме запросы попадают в подозрения на N+1"""
+        recorder = QueryRecorder()
+        with recorder.record():
+            users_one_by_one(self.request)
+        [(sql, count)] = recorder.repeated(5)
+        self.assertEqual(count, 6)
+        self.assertIn('auth_user', sql)
+
+    @override_settings(QUERY_BUDGET_ACTION='raise')
+    def test_n_plus_one_raises(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            self.run_view(users_one_by_one)
+
+    @override_settings(QUERY_BUDGET_ACTION='raise', QUERY_REPEAT_THRESHOLD=10)
+    def test_budget_exceeded_raises(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            self.run_view(query_budget(3)(users_one_by_one))
+
+    @override_settings(QUERY_BUDGET_ACTION='warn')
+    def test_warn_action(self):
+        with self.assertWarns(UserWarning):
+            self.run_view(users_one_by_one)
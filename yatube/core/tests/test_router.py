@@ -0,0 +1,114 @@
+import time
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import Client, TransactionTestCase
+from django.urls import reverse
+
+from core.db import router
+from core.querybudget import QueryRecorder
+from posts.models import Group, Post
+
+User = get_user_model()
+
+
+class ReplicaRouterTest(TransactionTestCase):
+    # Реплика в тестах — зеркало основной БД, отдельное соединение:
+    # данные должны быть закоммичены, поэтому не TestCase.
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+        self.post = Post.objects.create(
+            author=self.author, group=self.group, text='Пост')
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.author)
+
+    def sync(self, ago=0):
+        """Реплика снята ago секунд назад."""
+        cache.set(router.HEARTBEAT_KEY, time.time() - ago, None)
+
+    def get(self, client, url):
+        recorder = QueryRecorder()
+        with recorder.record():
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        aliases = {query['alias'] for query in recorder.queries}
+        return response.get(router.HEADER), aliases
+
+    def test_read_only_views_read_from_replica(self):
+        self.sync(ago=-1)
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_posts', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': self.author.username}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                header, aliases = self.get(self.client, url)
+                self.assertTrue(header.startswith('replica; lag='))
+                self.assertEqual(aliases, {'replica'})
+        header, aliases = self.get(
+            self.authorized_client, reverse('posts:follow_index'))
+        self.assertTrue(header.startswith('replica'))
+        self.assertEqual(aliases, {'replica'})
+
+    def test_unknown_or_large_lag_reads_from_primary(self):
+        header, aliases = self.get(self.client, reverse('posts:index'))
+        self.assertEqual(header, 'primary; reason=lag')
+        self.assertEqual(aliases, {'default'})
+        cache.clear()
+        self.sync(ago=settings.REPLICA_MAX_LAG + 1)
+        header, aliases = self.get(self.client, reverse('posts:index'))
+        self.assertTrue(header.startswith('primary; reason=lag; lag='))
+        self.assertEqual(aliases, {'default'})
+
+    def test_writer_reads_from_primary_until_replica_catches_up(self):
+        """Автор видит свой комментарий, пока реплика его не получила"""
+        self.sync(ago=1)
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        response = self.authorized_client.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.post.pk}),
+            {'text': 'Комментарий'},
+        )
+        self.assertIn(router.PIN_COOKIE, response.cookies)
+        header, aliases = self.get(self.authorized_client, url)
+        self.assertTrue(header.startswith('primary; reason=pinned'))
+        self.assertEqual(aliases, {'default'})
+        self.sync(ago=-2)
+        header, aliases = self.get(self.authorized_client, url)
+        self.assertTrue(header.startswith('replica'))
+
+    def test_page_changed_after_sync_reads_from_primary(self):
+        """Свежие изменения не попадают в кэш страниц со старой реплики"""
+        self.sync()
+        Post.objects.create(author=self.author, text='Новый пост')
+        header, aliases = self.get(self.client, reverse('posts:index'))
+        self.assertTrue(header.startswith('primary; reason=changed'))
+        self.assertIn('default', aliases)
+        header, _ = self.get(self.client, reverse(
+            'posts:group_posts', kwargs={'slug': self.group.slug}))
+        self.assertTrue(header.startswith('replica'))
+
+    def test_other_views_are_not_routed(self):
+        self.sync()
+        response = self.authorized_client.get(reverse('posts:post_create'))
+        self.assertNotIn(router.HEADER, response)
+
+    def test_sync_replica_command(self):
+        stdout = StringIO()
+        call_command('sync_replica', heartbeat_only=True, stdout=stdout)
+        self.assertIn('отставание реплики', stdout.getvalue())
+        self.assertLess(router.lag(), settings.REPLICA_MAX_LAG)
+        # В тестах реплика — та же БД: копировать её в себя нельзя.
+        with self.assertRaises(CommandError):
+            call_command('sync_replica', stdout=StringIO())
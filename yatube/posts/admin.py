@@ -1,14 +1,192 @@
+import itertools
+from functools import lru_cache
+
+from django import forms
 from django.contrib import admin
+from django.contrib.admin.views.main import ORDER_VAR, ChangeList
+from django.forms.utils import flatatt
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+
+from . import search, shards
 from .models import Post, Group, Comment
+from .utils import CountingPaginator, KeysetPaginator, count_key
+
+CURSOR_VARS = ('after', 'before')
+
+
+@lru_cache(maxsize=16)
+def render_options(choices):
+    """[(значение, <option>, <option selected>)] для набора choices."""
+    return [
+        (
+            str(value),
+            format_html('<option value="{}">{}</option>', value, label),
+            format_html(
+                '<option value="{}" selected>{}</option>', value, label),
+        )
+        for value, label in choices
+    ]
+
+
+class CachedSelect(forms.Select):
+    """<select>, у которого <option> рендерятся один раз на набор choices.
+
+    Шаблон на каждый <option> в каждой строке list_editable — основная
+    цена списка постов: 100 строк на все группы. Здесь строка
+    склеивается из готовых кусков, меняется только выбранный.
+    """
+
+    def render(self, name, value, attrs=None, renderer=None):
+        value = '' if value is None else str(value)
+        options = ''.join(
+            selected if option_value == value else option
+            for option_value, option, selected
+            in render_options(tuple(self.choices))
+        )
+        attrs = self.build_attrs(self.attrs, attrs)
+        attrs['name'] = name
+        return format_html(
+            '<select{}>{}</select>', flatatt(attrs), mark_safe(options))
+
+
+class PostList(list):
+    """Посты со всех шардов вместо queryset для formset list_editable."""
+    ordered = True
+
+
+class PostChangeList(ChangeList):
+    """Список постов без OFFSET и полного COUNT(*).
+
+    В порядке по умолчанию (новые сверху) страницы листаются курсором
+    ?after= / ?before=, как лента на сайте. При сортировке по другой
+    колонке остаются номера страниц, а число постов, как и в ленте,
+    считает CountingPaginator: из кэша или с ограничением сверху.
+    С шардами список, как и лента, сливается из всех шардов и только
+    в порядке по умолчанию.
+    """
+    keyset_page = None
+
+    def get_queryset(self, request):
+        # Курсор — не фильтр: он не попадает ни в запрос, ни в ссылки
+        # фильтров и сортировки.
+        for name in CURSOR_VARS:
+            self.params.pop(name, None)
+        if shards.sharded():
+            self.params.pop(ORDER_VAR, None)
+        return super().get_queryset(request)
+
+    def get_results(self, request):
+        ordering = tuple(self.queryset.query.order_by)
+        if ordering != KeysetPaginator.ordering:
+            super().get_results(request)
+            self.result_list = self.as_queryset(self.result_list)
+            return
+        paginator = KeysetPaginator(
+            shards.merged(self.queryset), self.list_per_page,
+            count_key=self.count_key())
+        page = paginator.get_page(
+            after=request.GET.get('after'),
+            before=request.GET.get('before'),
+        )
+        self.keyset_page = page
+        self.paginator = paginator
+        self.result_count = paginator.count
+        self.full_result_count = None
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.can_show_all = False
+        self.multi_page = page.has_other_pages()
+        self.result_list = self.as_queryset(page.object_list)
+
+    def count_key(self):
+        # Число всех постов уже кэширует лента; с фильтрами не кэшируем.
+        if self.queryset.query.where:
+            return None
+        return count_key('all')
+
+    def as_queryset(self, rows):
+        """Страница-список -> queryset для formset list_editable."""
+        if not isinstance(rows, list):
+            return rows
+        if shards.sharded():
+            return PostList(rows)
+        return self.queryset.filter(pk__in=[row.pk for row in rows])
 
 
 class PostAdmin(admin.ModelAdmin):
     list_display = ('pk', 'text', 'pub_date', 'author', 'group')
+    list_select_related = ('author', 'group')
     search_fields = ('text',)
     list_filter = ('pub_date',)
     list_editable = ('group',)
+    date_hierarchy = 'pub_date'
+    show_full_result_count = False
     empty_value_display = '-пусто-'
 
+    def get_changelist(self, request, **kwargs):
+        return PostChangeList
+
+    def get_sortable_by(self, request):
+        # Слить шарды можно только в порядке ленты.
+        if shards.sharded():
+            return ()
+        return super().get_sortable_by(request)
+
+    def get_actions(self, request):
+        # Действие получает один queryset, то есть одну БД, а выбранные
+        # посты могут лежать в разных шардах.
+        if shards.sharded():
+            return {}
+        return super().get_actions(request)
+
+    def get_object(self, request, object_id, from_field=None):
+        if not shards.sharded() or from_field is not None:
+            return super().get_object(request, object_id, from_field)
+        # Пост открывается из своего шарда.
+        try:
+            pk = int(object_id)
+        except ValueError:
+            return None
+        return self.get_queryset(request).using(
+            shards.for_post(pk)).filter(pk=pk).first()
+
+    def _get_list_editable_queryset(self, request, prefix):
+        queryset = super()._get_list_editable_queryset(request, prefix)
+        if not shards.sharded():
+            return queryset
+        return PostList(itertools.chain.from_iterable(
+            shards.spread(queryset)))
+
+    def get_paginator(self, request, queryset, per_page, orphans=0,
+                      allow_empty_first_page=True):
+        return CountingPaginator(
+            queryset, per_page, orphans=orphans,
+            allow_empty_first_page=allow_empty_first_page)
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'group':
+            kwargs['widget'] = CachedSelect
+        formfield = super().formfield_for_foreignkey(
+            db_field, request, **kwargs)
+        if db_field.name == 'group':
+            # Готовый список вместо queryset: иначе каждая строка
+            # list_editable заново читает все группы для <select>.
+            # Список один на запрос, а перебор, в отличие от list(),
+            # не делает лишний COUNT(*).
+            if not hasattr(request, 'group_choices'):
+                request.group_choices = [
+                    choice for choice in formfield.choices]
+            formfield.choices = request.group_choices
+        return formfield
+
+    def get_search_results(self, request, queryset, search_term):
+        """Поиск по индексу FTS5 вместо LIKE '%...%' по всей таблице."""
+        match = search.match_expression(search_term)
+        if not match:
+            return queryset, False
+        return search.filter_matching(queryset, match), False
+
 
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group)
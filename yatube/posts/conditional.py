@@ -0,0 +1,69 @@
+"""Условный GET (ETag / Last-Modified) для лент и страницы поста.
+
+Валидаторы строятся из поколений областей (posts.generations), из
+которых собрана страница, без рендера и без чтения постов: ETag — хэш
+поколений, адреса с параметрами и того, для кого страница собрана,
+Last-Modified — время последнего изменения этих областей. Если клиент
+прислал совпадающий валидатор, condition() отвечает 304.
+"""
+import hashlib
+
+from django.views.decorators.http import condition
+
+from core.db import router
+
+from . import generations
+
+
+def personal(request):
+    """Часть страницы, которая зависит от посетителя.
+
+    Авторизованный пользователь видит своё имя, кнопки подписки и
+    форму с CSRF-токеном; после нового входа токен меняется, поэтому
+    в ETag входит и секрет CSRF из cookie.
+    """
+    if not request.user.is_authenticated:
+        return 'anonymous'
+    return f'{request.user.pk}:{request.META.get("CSRF_COOKIE", "")}'
+
+
+def conditional(scopes_func):
+    """Оборачивает view в condition() с валидаторами из поколений.
+
+    scopes_func(request, *args, **kwargs) возвращает области страницы
+    или None, если объекта нет, — тогда view отвечает сама (404).
+    """
+    def scopes(request, *args, **kwargs):
+        if not hasattr(request, 'validator_scopes'):
+            request.validator_scopes = scopes_func(request, *args, **kwargs)
+            page_scopes = request.validator_scopes
+            if page_scopes is not None and router.on_replica():
+                # Страница, изменённая после снятия реплики, читается
+                # из основной БД: иначе её старая версия попала бы в кэш
+                # и ETag под новым поколением.
+                router.require_since(generations.changed_at(page_scopes))
+        return request.validator_scopes
+
+    def etag(request, *args, **kwargs):
+        page_scopes = scopes(request, *args, **kwargs)
+        if page_scopes is None:
+            return None
+        current = generations.current(page_scopes)
+        source = repr((
+            sorted(current.items()),
+            request.get_full_path(),
+            personal(request),
+        ))
+        return hashlib.md5(source.encode()).hexdigest()
+
+    def last_modified(request, *args, **kwargs):
+        # Время изменения не учитывает посетителя: персональным
+        # страницам хватает ETag.
+        if request.user.is_authenticated:
+            return None
+        page_scopes = scopes(request, *args, **kwargs)
+        if page_scopes is None:
+            return None
+        return generations.last_modified(page_scopes)
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
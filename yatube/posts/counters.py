@@ -0,0 +1,160 @@
+"""Денормализованные счётчики пользователей, групп и постов.
+
+Счётчики сдвигаются сигналами на сохранение и удаление Post, Comment
+и Follow. Строка статистики, которой ещё нет, создаётся пересчётом
+по данным из БД; расхождения чинит команда recount.
+
+Число постов по дням (DayStats) показывает иерархия дат в админке
+постов вместо SELECT DISTINCT по всей таблице.
+
+Счётчики лежат в основной БД; пересчёт постов и комментариев
+складывает числа всех шардов (posts.shards).
+"""
+import collections
+import datetime
+
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from . import shards
+from .models import (Comment, DayStats, Follow, GroupStats, Post, PostStats,
+                     UserStats)
+
+# Для каждого счётчика: модель, строки которой считаются, и поле,
+# ссылающееся на владельца строки статистики.
+COUNTERS = {
+    UserStats: {
+        'posts_count': (Post, 'author'),
+        'comments_count': (Comment, 'author'),
+        'followers_count': (Follow, 'author'),
+        'following_count': (Follow, 'user'),
+    },
+    GroupStats: {
+        'posts_count': (Post, 'group'),
+    },
+    PostStats: {
+        'comments_count': (Comment, 'post'),
+    },
+}
+
+
+def bump(stats_model, pk, **deltas):
+    """Атомарно сдвигает счётчики строки статистики."""
+    if pk is None:
+        return
+    updated = stats_model.objects.filter(pk=pk).update(**{
+        name: F(name) + delta for name, delta in deltas.items()
+    })
+    if not updated and any(delta > 0 for delta in deltas.values()):
+        # Строки нет: владелец только что создан или счётчики ещё
+        # не заполнялись. Пересчёт уже учтёт новую запись.
+        recount(stats_model, [pk])
+
+
+def recount(stats_model, pks):
+    """Пересчитывает счётчики пачки владельцев по данным из БД."""
+    pks = list(pks)
+    values = {pk: dict.fromkeys(COUNTERS[stats_model], 0) for pk in pks}
+    for name, (model, field) in COUNTERS[stats_model].items():
+        rows = model.objects.filter(
+            **{f'{field}__in': pks}
+        ).order_by().values(field).annotate(total=Count('pk'))
+        for part in shards.spread(rows):
+            for row in part:
+                values[row[field]][name] += row['total']
+    with transaction.atomic():
+        stats_model.objects.filter(pk__in=pks).delete()
+        stats_model.objects.bulk_create(
+            stats_model(pk=pk, **counts) for pk, counts in values.items()
+        )
+
+
+def stats_for(obj):
+    """Строка статистики пользователя, группы или поста."""
+    try:
+        return obj.stats
+    except AttributeError:
+        stats_model = obj._meta.get_field('stats').related_model
+        recount(stats_model, [obj.pk])
+        obj.stats = stats_model.objects.get(pk=obj.pk)
+        return obj.stats
+
+
+def day_of(post):
+    return timezone.localdate(post.pub_date)
+
+
+def start_of(day):
+    return timezone.make_aware(
+        datetime.datetime.combine(day, datetime.time.min))
+
+
+def bump_day(day, delta):
+    """Атомарно сдвигает число постов за день."""
+    updated = DayStats.objects.filter(pk=day).update(
+        posts_count=F('posts_count') + delta)
+    if not updated and delta > 0:
+        recount_days([day])
+
+
+def recount_days(days=None):
+    """Пересчитывает число постов за дни days, без days — за все.
+
+    Возвращает число дней, в которые есть посты.
+    """
+    posts = Post.objects.order_by()
+    stale = DayStats.objects.all()
+    if days is not None:
+        days = list(days)
+        stale = stale.filter(pk__in=days)
+        # Диапазоны pub_date, а не pub_date__date: так работает индекс.
+        ranges = Q()
+        for day in days:
+            ranges |= Q(
+                pub_date__gte=start_of(day),
+                pub_date__lt=start_of(day + datetime.timedelta(days=1)),
+            )
+        posts = posts.filter(ranges)
+    rows = posts.annotate(day=TruncDate('pub_date')).values_list(
+        'day').annotate(total=Count('pk'))
+    totals = collections.Counter()
+    for part in shards.spread(rows):
+        for day, total in part:
+            totals[day] += total
+    with transaction.atomic():
+        stale.delete()
+        created = DayStats.objects.bulk_create(
+            DayStats(day=day, posts_count=total)
+            for day, total in totals.items()
+        )
+    return len(created)
+
+
+def post_saved(post, created):
+    if created:
+        PostStats.objects.create(post=post)
+        bump(UserStats, post.author_id, posts_count=1)
+        bump(GroupStats, post.group_id, posts_count=1)
+        bump_day(day_of(post), 1)
+    elif post.group_id != post._loaded_group_id:
+        bump(GroupStats, post._loaded_group_id, posts_count=-1)
+        bump(GroupStats, post.group_id, posts_count=1)
+
+
+def post_deleted(post):
+    PostStats.objects.filter(pk=post.pk).delete()
+    bump(UserStats, post.author_id, posts_count=-1)
+    bump(GroupStats, post.group_id, posts_count=-1)
+    bump_day(day_of(post), -1)
+
+
+def comment_changed(comment, delta):
+    bump(PostStats, comment.post_id, comments_count=delta)
+    bump(UserStats, comment.author_id, comments_count=delta)
+
+
+def follow_changed(follow, delta):
+    bump(UserStats, follow.author_id, followers_count=delta)
+    bump(UserStats, follow.user_id, following_count=delta)
@@ -0,0 +1,96 @@
+"""Поколения содержимого для версионирования кэша страниц и фрагментов.
+
+Поколение — число в кэше, которое увеличивается при каждом изменении
+данных своей области: 'posts' — вся лента, 'group:<id>' — лента группы,
+'author:<id>' — лента и профиль автора, 'post:<id>' — страница поста.
+Номер поколения входит в ключ фрагмента в шаблоне и запоминается
+вместе с закэшированной страницей (posts.pagecache), поэтому после
+изменения старые записи просто перестают использоваться, и TTL можно
+держать большим. Вместе с поколением хранится время последнего
+изменения области — из него строится заголовок Last-Modified.
+"""
+import time
+from datetime import datetime
+
+from django.core.cache import cache
+from django.utils import timezone
+
+GENERATION_KEY = 'generation:{}'
+MODIFIED_KEY = 'generation:{}:modified'
+
+
+def scopes_for(post, group_id=None):
+    """Области, которые затрагивает изменение поста."""
+    scopes = ['posts', f'author:{post.author_id}', f'post:{post.pk}']
+    for pk in {post.group_id, group_id} - {None}:
+        scopes.append(f'group:{pk}')
+    return scopes
+
+
+def initial():
+    # Ключ мог быть вытеснен из кэша: новое поколение не должно
+    # совпасть с каким-либо из прежних, поэтому берём время в мс.
+    return time.time_ns() // 1_000_000
+
+
+def get(scope):
+    """Текущее поколение области."""
+    key = GENERATION_KEY.format(scope)
+    value = cache.get(key)
+    if value is None:
+        cache.add(key, initial(), None)
+        value = cache.get(key)
+    return value
+
+
+def get_many(scopes):
+    """Текущие поколения областей; вытесненных областей в ответе нет."""
+    keys = {GENERATION_KEY.format(scope): scope for scope in scopes}
+    return {
+        keys[key]: value for key, value in cache.get_many(keys).items()
+    }
+
+
+def current(scopes):
+    """Поколения областей; отсутствующие в кэше заводятся заново."""
+    generations = get_many(scopes)
+    for scope in scopes:
+        if scope not in generations:
+            generations[scope] = get(scope)
+    return generations
+
+
+def last_modified(scopes):
+    """Время последнего изменения областей или None, если неизвестно."""
+    keys = [MODIFIED_KEY.format(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    if len(found) < len(keys):
+        return None
+    return datetime.fromtimestamp(max(found.values()), timezone.utc)
+
+
+def changed_at(scopes):
+    """Время последнего известного изменения областей или None.
+
+    В отличие от last_modified, хватает одной области с отметкой.
+    """
+    found = cache.get_many([MODIFIED_KEY.format(scope) for scope in scopes])
+    if not found:
+        return None
+    return datetime.fromtimestamp(max(found.values()), timezone.utc)
+
+
+def bump(*scopes, modified=None):
+    """Сдвигает поколения областей, устаревая их фрагменты.
+
+    modified — время изменения, например updated_at сохранённого поста.
+    """
+    for scope in scopes:
+        key = GENERATION_KEY.format(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, initial(), None)
+    modified = (modified or timezone.now()).timestamp()
+    cache.set_many(
+        {MODIFIED_KEY.format(scope): modified for scope in scopes}, None)
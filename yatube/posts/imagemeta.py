@@ -0,0 +1,77 @@
+"""Сведения о картинке поста, которые считаются один раз при загрузке.
+
+Размеры, вес файла, преобладающий цвет и крошечное размытое превью
+(LQIP) хранятся в полях Post, поэтому шаблонам не нужно открывать файл
+картинки, а браузер знает пропорции и фон ещё до загрузки миниатюры.
+"""
+import base64
+import io
+import logging
+
+from django.core.exceptions import SuspiciousFileOperation
+from PIL import Image, ImageFilter
+
+logger = logging.getLogger('yatube.thumbnails')
+
+LQIP_WIDTH = 16
+LQIP_QUALITY = 40
+PALETTE = 8
+FIELDS = {
+    'image_width': None,
+    'image_height': None,
+    'image_size': None,
+    'image_color': '',
+    'image_lqip': '',
+}
+
+
+def dominant_color(image):
+    """Самый частый цвет уменьшенной картинки после квантования."""
+    small = image.convert('RGB')
+    small.thumbnail((64, 64))
+    quantized = small.quantize(PALETTE)
+    count, index = max(quantized.getcolors())
+    palette = quantized.getpalette()
+    red, green, blue = palette[index * 3:index * 3 + 3]
+    return f'#{red:02x}{green:02x}{blue:02x}'
+
+
+def lqip(image):
+    """Размытое превью шириной LQIP_WIDTH в виде data URI."""
+    small = image.convert('RGB')
+    height = max(round(LQIP_WIDTH * image.height / image.width), 1)
+    small = small.resize((LQIP_WIDTH, height), Image.BILINEAR)
+    small = small.filter(ImageFilter.GaussianBlur(1))
+    buffer = io.BytesIO()
+    small.save(buffer, 'JPEG', quality=LQIP_QUALITY)
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    return f'data:image/jpeg;base64,{encoded}'
+
+
+def describe(image):
+    """Значения полей сведений для картинки; пустые, если её не прочесть."""
+    if not image:
+        return dict(FIELDS)
+    try:
+        image.open('rb')
+        image.seek(0)
+        with Image.open(image) as source:
+            source.load()
+            values = {
+                'image_width': source.width,
+                'image_height': source.height,
+                'image_size': image.size,
+                'image_color': dominant_color(source),
+                'image_lqip': lqip(source),
+            }
+        image.seek(0)
+        return values
+    except (OSError, ValueError, SuspiciousFileOperation) as error:
+        logger.warning('Не удалось прочитать картинку %s: %s', image, error)
+        return dict(FIELDS)
+
+
+def fill(post):
+    """Заполняет сведения о картинке поста."""
+    for field, value in describe(post.image).items():
+        setattr(post, field, value)
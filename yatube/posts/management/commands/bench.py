@@ -0,0 +1,193 @@
+import json
+import math
+import time
+from contextlib import ExitStack
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client
+from django.urls import reverse
+
+from core.querybudget import QueryRecorder
+from posts import shards
+from posts.models import Group, Post
+
+User = get_user_model()
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(values, percent):
+    """Перцентиль по ближайшему рангу."""
+    ordered = sorted(values)
+    rank = max(math.ceil(len(ordered) * percent / 100), 1)
+    return ordered[rank - 1]
+
+
+class Command(BaseCommand):
+    help = (
+        'Измеряет время ответа основных страниц через тестовый клиент '
+        'на текущей БД: перцентили задержки, число запросов и размер '
+        'ответа. Результат пишется в JSON и сравнивается с базовым. '
+        'Запросы на запись выполняются в откатываемой транзакции.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument(
+            '--warmup', type=int, default=3,
+            help='Прогонов без замера перед каждым сценарием.'
+        )
+        parser.add_argument(
+            '--cold', action='store_true',
+            help='Очищать кеш перед каждым запросом.'
+        )
+        parser.add_argument('--output', help='Куда записать JSON.')
+        parser.add_argument(
+            '--baseline', help='JSON прошлого прогона для сравнения.'
+        )
+        parser.add_argument(
+            '--save-baseline', action='store_true',
+            help='Записать результат в файл --baseline.'
+        )
+        parser.add_argument(
+            '--tolerance', type=float, default=0.2,
+            help='Допустимый рост p95, доля от базового.'
+        )
+        parser.add_argument(
+            '--fail', action='store_true',
+            help='Завершиться с ошибкой при регрессии.'
+        )
+
+    def handle(self, *args, **options):
+        if options['save_baseline'] and not options['baseline']:
+            raise CommandError('--save-baseline требует --baseline.')
+        if options['iterations'] < 1:
+            raise CommandError('--iterations должно быть больше нуля.')
+        self.options = options
+        results = {
+            name: self.measure(method, url, data)
+            for name, method, url, data in self.scenarios()
+        }
+        self.report(results)
+        report = json.dumps(results, indent=2, ensure_ascii=False)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(report)
+
+        regressions = []
+        if options['baseline'] and not options['save_baseline']:
+            with open(options['baseline']) as file:
+                baseline = json.load(file)
+            regressions = self.compare(results, baseline)
+        if options['save_baseline']:
+            with open(options['baseline'], 'w') as file:
+                file.write(report)
+        if regressions and options['fail']:
+            raise CommandError(f'Регрессий: {len(regressions)}')
+
+    def scenarios(self):
+        """Сценарии на самых нагруженных объектах БД."""
+        post = next(iter(shards.merged(
+            Post.objects.order_by('-pub_date', '-pk'))[:1]), None)
+        if post is None:
+            raise CommandError('В БД нет постов; запустите seed.')
+        author = User.objects.order_by('-stats__posts_count', 'pk').first()
+        reader = User.objects.order_by(
+            '-stats__following_count', 'pk').first()
+        group = Group.objects.order_by('-stats__posts_count', 'pk').first()
+        self.client = Client(HTTP_HOST='localhost')
+        self.client.force_login(reader)
+        yield 'index', 'get', reverse('posts:index'), None
+        if group is not None:
+            yield 'group_posts', 'get', reverse(
+                'posts:group_posts', args=[group.slug]), None
+        yield 'profile', 'get', reverse(
+            'posts:profile', args=[author.username]), None
+        yield 'post_detail', 'get', reverse(
+            'posts:post_detail', args=[post.pk]), None
+        yield 'follow_index', 'get', reverse('posts:follow_index'), None
+        yield 'post_create', 'post', reverse('posts:post_create'), {
+            'text': 'Пост из бенчмарка',
+        }
+        yield 'add_comment', 'post', reverse(
+            'posts:add_comment', args=[post.pk]), {
+            'text': 'Комментарий из бенчмарка',
+        }
+
+    def request(self, method, url, data):
+        recorder = QueryRecorder()
+        if self.options['cold']:
+            cache.clear()
+        # Посты и комментарии пишутся в шард автора: транзакция
+        # открывается в каждом шарде.
+        with ExitStack() as stack:
+            for alias in shards.shards():
+                stack.enter_context(transaction.atomic(using=alias))
+            start = time.perf_counter()
+            with recorder.record():
+                response = getattr(self.client, method)(url, data)
+            elapsed = time.perf_counter() - start
+            # Записи бенчмарка не должны менять измеряемую БД.
+            for alias in shards.shards():
+                transaction.set_rollback(True, using=alias)
+        if response.status_code >= 400:
+            raise CommandError(f'{url}: ответ {response.status_code}')
+        return elapsed, len(recorder.queries), len(response.content)
+
+    def measure(self, method, url, data):
+        for _ in range(self.options['warmup']):
+            self.request(method, url, data)
+        timings = []
+        queries = []
+        sizes = []
+        for _ in range(self.options['iterations']):
+            elapsed, count, size = self.request(method, url, data)
+            timings.append(elapsed * 1000)
+            queries.append(count)
+            sizes.append(size)
+        result = {'url': url}
+        for percent in PERCENTILES:
+            result[f'p{percent}_ms'] = round(percentile(timings, percent), 3)
+        result['queries'] = max(queries)
+        result['bytes'] = max(sizes)
+        return result
+
+    def report(self, results):
+        self.stdout.write(
+            f'{"view":<14} {"p50, ms":>9} {"p95, ms":>9} {"p99, ms":>9} '
+            f'{"queries":>8} {"bytes":>9}'
+        )
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name:<14} {result["p50_ms"]:>9.2f} '
+                f'{result["p95_ms"]:>9.2f} {result["p99_ms"]:>9.2f} '
+                f'{result["queries"]:>8} {result["bytes"]:>9}'
+            )
+
+    def compare(self, results, baseline):
+        """Сравнивает с базовым прогоном и печатает регрессии."""
+        tolerance = self.options['tolerance']
+        regressions = []
+        for name, result in results.items():
+            base = baseline.get(name)
+            if base is None:
+                continue
+            before, after = base['p95_ms'], result['p95_ms']
+            if after > before * (1 + tolerance):
+                growth = f' ({after / before - 1:+.0%})' if before else ''
+                regressions.append(
+                    f'{name}: p95 {before:.2f} -> {after:.2f} мс{growth}'
+                )
+            if result['queries'] > base['queries']:
+                regressions.append(
+                    f'{name}: запросов {base["queries"]} -> '
+                    f'{result["queries"]}'
+                )
+        for regression in regressions:
+            self.stdout.write(self.style.ERROR(f'Регрессия {regression}'))
+        if not regressions:
+            self.stdout.write(self.style.SUCCESS('Регрессий нет.'))
+        return regressions
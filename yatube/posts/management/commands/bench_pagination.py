@@ -0,0 +1,86 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.core.paginator import Paginator
+from django.db import transaction
+
+from posts.models import Post
+from posts.utils import KeysetPaginator, encode_cursor
+from yatube.settings import PER_PAGE
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает время страницы ленты для OFFSET и keyset-пагинации '
+        'на разной глубине. Данные создаются во временной транзакции '
+        'и откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=100_000)
+        parser.add_argument(
+            '--depths', type=int, nargs='+',
+            default=[1, 10, 100, 1000, 5000],
+            help='Номера страниц, на которых измеряется время.'
+        )
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.fill(options['posts'])
+            queryset = Post.objects.all()
+            last_page = Paginator(queryset, PER_PAGE).num_pages
+            self.stdout.write(f'{"page":>8} {"offset, ms":>12} '
+                              f'{"keyset, ms":>12}')
+            for depth in options['depths']:
+                if depth > last_page:
+                    continue
+                offset_ms = self.measure(
+                    lambda: list(Paginator(queryset, PER_PAGE).page(depth)),
+                    options['repeat'],
+                )
+                token = self.cursor_for(queryset, depth)
+                keyset_ms = self.measure(
+                    lambda: list(
+                        KeysetPaginator(queryset, PER_PAGE)
+                        .get_page(after=token)
+                    ),
+                    options['repeat'],
+                )
+                self.stdout.write(
+                    f'{depth:>8} {offset_ms:>12.2f} {keyset_ms:>12.2f}'
+                )
+            transaction.set_rollback(True)
+
+    def fill(self, count):
+        author = User.objects.create(username='bench_pagination')
+        existing = Post.objects.count()
+        batch = []
+        for number in range(max(count - existing, 0)):
+            batch.append(Post(text=f'bench {number}', author=author))
+            if len(batch) == 5000:
+                Post.objects.bulk_create(batch)
+                batch = []
+        Post.objects.bulk_create(batch)
+
+    @staticmethod
+    def cursor_for(queryset, page):
+        if page == 1:
+            return None
+        previous = queryset.order_by(*KeysetPaginator.ordering)[
+            (page - 1) * PER_PAGE - 1
+        ]
+        return encode_cursor(previous)
+
+    @staticmethod
+    def measure(func, repeat):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            elapsed = (time.perf_counter() - start) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        return best
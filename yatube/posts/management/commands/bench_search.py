@@ -0,0 +1,98 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import search
+from posts.management.commands.bench import percentile
+from posts.models import Post
+from yatube.settings import PER_PAGE
+
+SAMPLE = 500
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает поиск по индексу FTS5 с LIKE по текущей БД: '
+        'первая страница результатов и число совпадений для слов '
+        'из случайных постов. Для замера на миллионе постов: '
+        'manage.py seed --users 10000 --posts 1000000.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', type=int, default=30)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument(
+            '--min-length', type=int, default=5,
+            help='Слова короче в запросы не берутся.'
+        )
+
+    def handle(self, *args, **options):
+        terms = self.terms(options)
+        if not terms:
+            raise CommandError('Нет постов: сначала manage.py seed.')
+        total = Post.objects.count()
+        self.stdout.write(
+            f'постов {total}, запросов {len(terms)}: первая страница '
+            f'({PER_PAGE} постов), страница без совпадений и число совпадений'
+        )
+        self.stdout.write(
+            f'{"способ":<12} {"p50, мс":>9} {"p95, мс":>9} {"max, мс":>9}'
+        )
+        # Слов, которых нет ни в одном посте: LIKE читает всю таблицу.
+        misses = [f'{term}ъъ' for term in terms]
+        scenarios = [
+            ('like page', self.like_page, terms),
+            ('fts page', self.fts_page, terms),
+            ('like miss', self.like_page, misses),
+            ('fts miss', self.fts_page, misses),
+            ('like count', self.like_count, terms),
+            ('fts count', self.fts_count, terms),
+        ]
+        for name, method, queries in scenarios:
+            timings = []
+            for term in queries:
+                start = time.perf_counter()
+                method(term)
+                timings.append((time.perf_counter() - start) * 1000)
+            self.stdout.write(
+                f'{name:<12} {percentile(timings, 50):>9.2f} '
+                f'{percentile(timings, 95):>9.2f} {max(timings):>9.2f}'
+            )
+
+    @staticmethod
+    def terms(options):
+        """Слова из случайных постов — то, что станут искать."""
+        rng = random.Random(options['seed'])
+        last = Post.objects.order_by('-pk').values_list(
+            'pk', flat=True).first()
+        if last is None:
+            return []
+        words = set()
+        for pk in rng.sample(range(1, last + 1), min(SAMPLE, last)):
+            text = Post.objects.filter(pk=pk).values_list(
+                'text', flat=True).first() or ''
+            words.update(
+                word for word in search.TERM.findall(text.lower())
+                if len(word) >= options['min_length']
+            )
+        words = sorted(words)
+        return rng.sample(words, min(options['queries'], len(words)))
+
+    @staticmethod
+    def like_page(term):
+        return list(Post.objects.filter(text__icontains=term).order_by(
+            '-pub_date').values_list('pk', flat=True)[:PER_PAGE])
+
+    @staticmethod
+    def fts_page(term):
+        return search.ranked_ids(search.match_expression(term), PER_PAGE)
+
+    @staticmethod
+    def like_count(term):
+        return Post.objects.filter(text__icontains=term).count()
+
+    @staticmethod
+    def fts_count(term):
+        return search.filter_matching(
+            Post.objects.all(), search.match_expression(term)).count()
@@ -0,0 +1,125 @@
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.files.uploadedfile import UploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image, ImageOps
+
+from posts import uploads
+
+MODES = ('naive', 'bounded')
+EXIF_ORIENTATION = 0x0112
+
+
+def peak_rss():
+    """Пиковый RSS процесса в байтах (ru_maxrss в Linux — в КБ)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def make_photo(path, width, height):
+    """JPEG «с телефона»: градиенты с шумом и поворот в EXIF."""
+    noise = Image.effect_noise((width, height), 20).convert('L')
+    channels = [
+        Image.blend(
+            Image.radial_gradient('L').rotate(angle).resize((width, height)),
+            noise, 0.3,
+        )
+        for angle in (0, 120, 240)
+    ]
+    exif = Image.Exif()
+    exif[EXIF_ORIENTATION] = 6
+    Image.merge('RGB', channels).save(
+        path, 'JPEG', quality=90, exif=exif.tobytes())
+
+
+def naive(path):
+    """Как без обработки: полный кадр в памяти и оригинал в полный рост."""
+    with Image.open(path) as image:
+        image = ImageOps.exif_transpose(image)
+        output = tempfile.SpooledTemporaryFile()
+        image.save(output, 'JPEG', quality=90)
+        return image.size, output.tell()
+
+
+def bounded(path):
+    with open(path, 'rb') as source:
+        upload = UploadedFile(
+            source, os.path.basename(path), 'image/jpeg',
+            os.path.getsize(path),
+        )
+        result = uploads.process(upload)
+        with Image.open(result) as image:
+            size = image.size
+        return size, result.size
+
+
+def worker(args):
+    """Обрабатывает uploads загрузок в threads потоков одного процесса.
+
+    Процесс свежий (fork), поэтому прирост его пикового RSS — память,
+    которую заняла обработка.
+    """
+    mode, path, uploads_count, threads = args
+    before = peak_rss()
+    process = naive if mode == 'naive' else bounded
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        results = list(executor.map(process, [path] * uploads_count))
+    elapsed = time.perf_counter() - start
+    return elapsed, peak_rss() - before, results[0]
+
+
+class Command(BaseCommand):
+    help = (
+        'Обрабатывает пачку одновременных загрузок большого фото без '
+        'ограничений (naive) и через posts.uploads (bounded) и сравнивает '
+        'время, пиковую память процесса и размер сохраняемого оригинала.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'modes', nargs='*',
+            help=f'Что сравнить: {", ".join(MODES)}; по умолчанию всё.'
+        )
+        parser.add_argument('--width', type=int, default=6000)
+        parser.add_argument('--height', type=int, default=4000)
+        parser.add_argument(
+            '--uploads', type=int, default=16,
+            help='Сколько загрузок обработать.'
+        )
+        parser.add_argument(
+            '--threads', type=int, default=8,
+            help='Потоков-обработчиков, как у многопоточного сервера.'
+        )
+
+    def handle(self, *args, **options):
+        unknown = set(options['modes']) - set(MODES)
+        if unknown:
+            raise CommandError(f'Неизвестные режимы: {", ".join(unknown)}')
+        context = multiprocessing.get_context('fork')
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'photo.jpg')
+            make_photo(path, options['width'], options['height'])
+            self.stdout.write(
+                f'исходник {options["width"]}x{options["height"]}, '
+                f'{os.path.getsize(path) / 1024:.0f} КБ; '
+                f'{options["uploads"]} загрузок в {options["threads"]} '
+                'потоков'
+            )
+            self.stdout.write(
+                f'{"mode":<8} {"сек":>7} {"пик, МБ":>9} '
+                f'{"оригинал":>11} {"КБ":>7}'
+            )
+            for mode in options['modes'] or MODES:
+                job = (mode, path, options['uploads'], options['threads'])
+                with context.Pool(1) as pool:
+                    elapsed, peak, result = pool.apply(worker, (job,))
+                (width, height), size = result
+                self.stdout.write(
+                    f'{mode:<8} {elapsed:>7.2f} {peak / 2 ** 20:>9.1f} '
+                    f'{f"{width}x{height}":>11} {size / 1024:>7.0f}'
+                )
@@ -0,0 +1,128 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile
+
+from posts import shards, storage, thumbnails
+from posts.models import MediaFile, Post
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет из MEDIA_ROOT картинки постов и миниатюры, на которые '
+        'не ссылается ни один пост, если они старше льготного периода. '
+        'Ссылки читаются потоком из БД в множества, файлы сравниваются '
+        'с ними без запроса на каждый файл.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace', type=float, default=24,
+            help='Льготный период в часах: более новые файлы не трогаются.'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только посчитать, ничего не удаляя.'
+        )
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        self.media = storage.media_storage
+        chunk_size = options['chunk_size']
+        originals = self.referenced(chunk_size)
+        expected = set(originals)
+        for name in originals:
+            expected.update(
+                thumbnail.name
+                for thumbnail in thumbnails.thumbnail_files(
+                    ImageFile(name, self.media)).values()
+            )
+        deadline = time.time() - options['grace'] * 60 * 60
+        scanned, garbage = self.scan(expected, deadline)
+        # Пока шёл обход, на старый файл могла сослаться новая
+        # загрузка того же содержимого: такие файлы остаются.
+        garbage = self.recheck(garbage, chunk_size)
+        size = sum(garbage.values())
+        if not options['dry_run']:
+            self.delete(sorted(garbage), chunk_size)
+        verb = 'можно освободить' if options['dry_run'] else 'освобождено'
+        self.stdout.write(
+            f'файлов просмотрено {scanned}, нужных {len(expected)}, '
+            f'лишних {len(garbage)}; {verb} {size / 2 ** 20:.1f} МБ'
+        )
+
+    def referenced(self, chunk_size):
+        """Имена картинок, на которые ссылаются посты или MediaFile."""
+        names = set()
+        for posts in shards.spread(Post.objects.exclude(image='')):
+            names.update(posts.values_list(
+                'image', flat=True).iterator(chunk_size=chunk_size))
+        names.update(MediaFile.objects.filter(refs__gt=0).values_list(
+            'name', flat=True).iterator(chunk_size=chunk_size))
+        return names
+
+    def roots(self):
+        upload_to = Post._meta.get_field('image').upload_to
+        return [upload_to, thumbnail_settings.THUMBNAIL_PREFIX]
+
+    def scan(self, expected, deadline):
+        """Обходит каталоги картинок и миниатюр.
+
+        Возвращает число файлов и {имя: размер} лишних файлов старше
+        deadline.
+        """
+        scanned = 0
+        garbage = {}
+        for root in self.roots():
+            top = self.media.path(root)
+            for directory, _, files in os.walk(top):
+                for filename in files:
+                    path = os.path.join(directory, filename)
+                    name = os.path.relpath(path, self.media.location).replace(
+                        os.sep, '/')
+                    scanned += 1
+                    if name in expected:
+                        continue
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    if stat.st_mtime < deadline:
+                        garbage[name] = stat.st_size
+        return scanned, garbage
+
+    @staticmethod
+    def recheck(garbage, chunk_size):
+        names = list(garbage)
+        for start in range(0, len(names), chunk_size):
+            chunk = names[start:start + chunk_size]
+            for posts in shards.spread(Post.objects.filter(image__in=chunk)):
+                for name in posts.values_list('image', flat=True):
+                    garbage.pop(name, None)
+            for name in MediaFile.objects.filter(
+                name__in=chunk, refs__gt=0
+            ).values_list('name', flat=True):
+                garbage.pop(name, None)
+        return garbage
+
+    def delete(self, names, chunk_size):
+        """Удаляет файлы, их записи в хранилище ключей sorl и MediaFile."""
+        for name in names:
+            self.media.delete(name)
+            image = ImageFile(name, self.media)
+            default.kvstore.delete(image)
+            thumbnails.forget(image)
+        for start in range(0, len(names), chunk_size):
+            chunk = names[start:start + chunk_size]
+            MediaFile.objects.filter(name__in=chunk).delete()
+        for root in self.roots():
+            self.remove_empty_directories(self.media.path(root))
+
+    @staticmethod
+    def remove_empty_directories(top):
+        for directory, subdirectories, files in os.walk(top, topdown=False):
+            if directory != top and not os.listdir(directory):
+                os.rmdir(directory)
@@ -0,0 +1,91 @@
+import os
+import re
+import shutil
+
+from django.core.files import File
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from sorl.thumbnail.images import ImageFile
+
+from posts import generations, shards, storage, thumbnails
+from posts.models import Post
+
+HASHED = re.compile(r'(^|/)(?P<prefix>[0-9a-f]{2})/(?P=prefix)[0-9a-f]{62}\.')
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит картинки постов в хранилище по хэшу содержимого: '
+        'одинаковые файлы остаются в одном экземпляре, посты '
+        'переключаются на него, старые миниатюры удаляются, ссылки '
+        'на файлы пересчитываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только посчитать, ничего не меняя.'
+        )
+
+    def handle(self, *args, **options):
+        self.media = storage.media_storage
+        self.scopes = set()
+        moved = duplicates = missing = freed = 0
+        names = set()
+        for posts in shards.spread(Post.objects.exclude(image='')):
+            names.update(posts.order_by().values_list(
+                'image', flat=True).distinct())
+        for name in sorted(names):
+            if HASHED.search(name):
+                continue
+            try:
+                with self.media.open(name) as file:
+                    target = storage.hashed_name(name, File(file))
+                size = self.media.size(name)
+            except OSError:
+                missing += 1
+                continue
+            duplicate = self.media.exists(target)
+            if duplicate:
+                duplicates += 1
+                freed += size
+            else:
+                moved += 1
+            if not options['dry_run']:
+                self.move(name, target, duplicate)
+        if not options['dry_run']:
+            files = storage.recount()
+            generations.bump(*self.scopes)
+            self.stdout.write(f'файлов в хранилище: {files}')
+        self.stdout.write(
+            f'перенесено {moved}, дубликатов {duplicates} '
+            f'({freed / 2 ** 20:.1f} МБ), не найдено {missing}'
+        )
+        if moved and not options['dry_run']:
+            self.stdout.write(
+                'Миниатюры для новых имён создаст pregenerate_thumbnails.')
+
+    def move(self, name, target, duplicate):
+        """Переключает посты всех шардов на target и удаляет name.
+
+        Файл под новым именем появляется до переключения, а старый
+        удаляется после него: посты, которые ещё не переключены,
+        не остаются без картинки.
+        """
+        if not duplicate:
+            path = self.media.path(target)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                os.link(self.media.path(name), path)
+            except OSError:
+                shutil.copyfile(self.media.path(name), path)
+        for posts in shards.spread(Post.objects.filter(image=name)):
+            with transaction.atomic(using=posts.db):
+                for post in posts.only('pk', 'author_id', 'group_id'):
+                    self.scopes.update(generations.scopes_for(post))
+                posts.update(image=target)
+        # На старое имя больше никто не ссылается: удаляются файл
+        # и его миниатюры.
+        image = ImageFile(name, self.media)
+        thumbnails.backend.delete(image)
+        thumbnails.forget(image)
@@ -0,0 +1,108 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from sorl.thumbnail import default
+
+from posts import shards, thumbnails
+from posts.models import Post
+from yatube.settings import PER_PAGE
+
+# Единственная миниатюра, которую шаблоны отдавали до вариантов.
+BASELINE = ('JPEG', 960)
+
+
+class Command(BaseCommand):
+    help = (
+        'Считает, сколько байт картинок скачивает клиент на страницах '
+        'главной ленты с вариантами srcset и сколько экономится '
+        'по сравнению с одной миниатюрой 960px JPEG.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, default=10)
+        parser.add_argument(
+            '--viewport', type=int, default=375,
+            help='Ширина экрана клиента в CSS-пикселях.'
+        )
+        parser.add_argument(
+            '--dpr', type=float, default=2.0,
+            help='Плотность пикселей экрана.'
+        )
+        parser.add_argument(
+            '--formats', nargs='+', default=None,
+            help='Форматы, которые понимает клиент; по умолчанию все.'
+        )
+
+    def handle(self, *args, **options):
+        formats = options['formats'] or settings.THUMBNAIL_FORMATS
+        if settings.THUMBNAIL_FORMATS[-1] not in formats:
+            raise CommandError(
+                f'Клиент должен понимать {settings.THUMBNAIL_FORMATS[-1]}.')
+        self.sizes = {}
+        wanted = min(
+            options['viewport'] * options['dpr'],
+            max(settings.THUMBNAIL_WIDTHS),
+        )
+        self.stdout.write(
+            f'{"page":>5} {"images":>7} {"960px JPEG, KB":>15} '
+            f'{"srcset, KB":>11} {"saved":>7}'
+        )
+        total_before = total_after = missing = 0
+        posts = shards.merged(
+            Post.objects.exclude(image='').order_by('-pub_date', '-pk'))
+        for number in range(options['pages']):
+            page = list(posts[number * PER_PAGE:(number + 1) * PER_PAGE])
+            if not page:
+                break
+            found = thumbnails.ready_many(
+                (post.image for post in page), lookup=True)
+            before = after = 0
+            for post in page:
+                ready = found.get(post.image.name, {})
+                chosen = self.choose(ready, formats, wanted)
+                if BASELINE not in ready or chosen is None:
+                    missing += 1
+                    continue
+                before += self.size(ready[BASELINE])
+                after += self.size(chosen)
+            total_before += before
+            total_after += after
+            self.stdout.write(
+                f'{number + 1:>5} {len(page):>7} {before / 1024:>15.1f} '
+                f'{after / 1024:>11.1f} {self.saved(before, after):>7}'
+            )
+        self.stdout.write(
+            f'{"итого":>5} {"":>7} {total_before / 1024:>15.1f} '
+            f'{total_after / 1024:>11.1f} '
+            f'{self.saved(total_before, total_after):>7}'
+        )
+        if missing:
+            self.stdout.write(self.style.WARNING(
+                f'Без готовых миниатюр: {missing}; запустите '
+                'pregenerate_thumbnails.'
+            ))
+
+    @staticmethod
+    def choose(ready, formats, wanted):
+        """Вариант, который браузер выберет по srcset и sizes."""
+        for format_ in settings.THUMBNAIL_FORMATS:
+            if format_ not in formats:
+                continue
+            widths = sorted(
+                width for fmt, width in ready if fmt == format_)
+            if not widths:
+                continue
+            width = next(
+                (width for width in widths if width >= wanted), widths[-1])
+            return ready[format_, width]
+        return None
+
+    def size(self, thumbnail):
+        if thumbnail.name not in self.sizes:
+            self.sizes[thumbnail.name] = default.storage.size(thumbnail.name)
+        return self.sizes[thumbnail.name]
+
+    @staticmethod
+    def saved(before, after):
+        if not before:
+            return '-'
+        return f'{1 - after / before:.0%}'
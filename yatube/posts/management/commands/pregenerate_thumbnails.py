@@ -0,0 +1,104 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts import generations, imagemeta, shards, thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = (
+        'Создаёт недостающие миниатюры картинок существующих постов '
+        'и заполняет сведения о картинках (размеры, цвет, превью). '
+        'Готовое пропускается, посты читаются пачками. Картинки, '
+        'миниатюры которых недавно не удалось создать, пропускаются '
+        'без --retry-failed.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=max(settings.THUMBNAIL_WORKERS, 1),
+            help='Потоков генерации; 1 — в текущем потоке.'
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--retry-failed', action='store_true')
+
+    def handle(self, *args, **options):
+        created = skipped = described = broken = 0
+        workers = options['workers']
+        executor = ThreadPoolExecutor(workers) if workers > 1 else None
+        for posts in self.batches(options['batch_size']):
+            described += self.describe(posts)
+            ready = thumbnails.ready_many(
+                (post.image for post in posts), lookup=True)
+            expected = len(thumbnails.variants())
+            missing = [
+                post for post in posts
+                if len(ready.get(post.image.name, {})) < expected
+            ]
+            skipped += len(posts) - len(missing)
+            if not options['retry_failed']:
+                names = thumbnails.failed(post.image.name for post in missing)
+                broken += len(names)
+                missing = [
+                    post for post in missing if post.image.name not in names
+                ]
+            if executor is None:
+                results = map(self.generate, missing)
+            else:
+                results = executor.map(self.generate, missing)
+            created += sum(1 for result in results if result)
+            self.stdout.write(
+                f'создано {created}, уже было {skipped}', ending='\r')
+        if executor is not None:
+            executor.shutdown()
+        self.stdout.write(f'создано {created}, уже было {skipped}')
+        if broken:
+            self.stdout.write(
+                f'пропущено после неудачи: {broken} (см. --retry-failed)')
+        self.stdout.write(f'сведения о картинках заполнены: {described}')
+
+    @staticmethod
+    def describe(posts):
+        """Заполняет сведения о картинках там, где их ещё нет."""
+        described = 0
+        for post in posts:
+            if post.image_width is not None:
+                continue
+            values = imagemeta.describe(post.image)
+            if values['image_width'] is None:
+                continue
+            Post.objects.using(post._state.db).filter(
+                pk=post.pk).update(**values)
+            described += 1
+        return described
+
+    def generate(self, post):
+        try:
+            return thumbnails.generate(
+                post.image, generations.scopes_for(post))
+        except Exception as error:
+            self.stderr.write(f'{post.image.name}: {error}')
+        finally:
+            if threading.current_thread() is not threading.main_thread():
+                connections.close_all()
+
+    @staticmethod
+    def batches(size):
+        """Посты с картинками пачками по возрастанию pk, без OFFSET.
+
+        Шарды обходятся по очереди.
+        """
+        queryset = Post.objects.exclude(image='').order_by('pk').only(
+            'pk', 'image', 'image_width', 'author_id', 'group_id')
+        for part in shards.spread(queryset):
+            last = 0
+            while True:
+                posts = list(part.filter(pk__gt=last)[:size])
+                if not posts:
+                    break
+                yield posts
+                last = posts[-1].pk
@@ -0,0 +1,199 @@
+import datetime
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+
+from posts import shards
+from posts.models import Comment, Post
+
+User = get_user_model()
+# Запись, начатая до копирования, может закоммититься после него:
+# при догонке берутся строки, изменённые с запасом до старта.
+CLOCK_MARGIN = datetime.timedelta(minutes=1)
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит посты авторов и комментарии к ним в другой шард, не '
+        'останавливая сайт. Строки копируются пачками, пока автор пишет '
+        'в старый шард; затем запись автора замораживается (запросы '
+        'ждут, см. SHARD_MOVE_WAIT), догоняются изменения и удаления, '
+        'карта шардов переключается, и строки удаляются из старого '
+        'шарда. Id строк сохраняются. Прерванный перенос можно '
+        'запустить заново.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='+')
+        parser.add_argument(
+            '--to', dest='target',
+            help='Шард назначения; по умолчанию — шард с наименьшим '
+                 'числом постов.'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--grace', type=float, default=1.0,
+            help='Секунд после заморозки: записи, начатые до неё, '
+                 'успевают закончиться.'
+        )
+
+    def handle(self, *args, **options):
+        if not shards.sharded():
+            raise CommandError(
+                'Шардирование выключено: в POST_SHARDS одна БД.')
+        target = options['target']
+        if target is not None and target not in shards.shards():
+            raise CommandError(f'Шарда {target} нет в POST_SHARDS.')
+        authors = dict(User.objects.filter(
+            username__in=options['usernames']
+        ).values_list('username', 'pk'))
+        missing = set(options['usernames']) - set(authors)
+        if missing:
+            raise CommandError(
+                f'Нет пользователей: {", ".join(sorted(missing))}')
+        self.batch_size = options['batch_size']
+        for username in options['usernames']:
+            author_id = authors[username]
+            source = shards.location(author_id)[0] or DEFAULT_DB_ALIAS
+            destination = target or self.least_loaded(source)
+            if destination == source:
+                self.stdout.write(f'{username}: уже в {source}')
+                continue
+            posts, comments = self.move(
+                author_id, source, destination, options['grace'])
+            self.stdout.write(
+                f'{username}: {source} -> {destination}, '
+                f'постов {posts}, комментариев {comments}'
+            )
+
+    @staticmethod
+    def least_loaded(source):
+        return min(
+            (alias for alias in shards.shards() if alias != source),
+            key=lambda alias: Post.objects.using(alias).count(),
+        )
+
+    def move(self, author_id, source, target, grace):
+        started = timezone.now() - CLOCK_MARGIN
+        try:
+            self.copy(author_id, source, target)
+            # Новые записи автора ждут разморозки (shards.writable).
+            shards.assign(author_id, source, frozen=True)
+            time.sleep(grace)
+            self.copy(author_id, source, target, since=started)
+            counts = self.drop_deleted(author_id, source, target)
+        except BaseException:
+            self.purge(author_id, target)
+            shards.assign(author_id, source)
+            raise
+        shards.assign(author_id, target)
+        self.purge(author_id, source)
+        return counts
+
+    @staticmethod
+    def scope(model, author_id):
+        """Условие WHERE на строки автора в таблице model."""
+        if model is Post:
+            return 'author_id = %s', [author_id]
+        return (
+            f'post_id IN (SELECT id FROM {Post._meta.db_table} '
+            f'WHERE author_id = %s)', [author_id]
+        )
+
+    def copy(self, author_id, source, target, since=None):
+        """Копирует посты автора и комментарии; с since — изменённые."""
+        for model in (Post, Comment):
+            where, params = self.scope(model, author_id)
+            if since is not None:
+                where += ' AND updated_at >= %s'
+                params.append(
+                    connections[source].ops.adapt_datetimefield_value(since))
+            self.copy_rows(model, source, target, where, params)
+
+    def copy_rows(self, model, source, target, where, params):
+        table = model._meta.db_table
+        quote = connections[target].ops.quote_name
+        columns = [field.column for field in model._meta.concrete_fields]
+        names = ', '.join(quote(column) for column in columns)
+        updates = ', '.join(
+            f'{quote(column)} = excluded.{quote(column)}'
+            for column in columns if column != 'id'
+        )
+        select = (
+            f'SELECT {names} FROM {table} WHERE {where} AND id > %s '
+            f'ORDER BY id LIMIT %s'
+        )
+        # UPSERT, а не INSERT OR REPLACE: REPLACE удаляет строку без
+        # триггеров, и индекс поиска разошёлся бы с постами.
+        insert = (
+            f'INSERT INTO {table} ({names}) '
+            f'VALUES ({", ".join(["%s"] * len(columns))}) '
+            f'ON CONFLICT (id) DO UPDATE SET {updates}'
+        )
+        position = columns.index('id')
+        last = 0
+        while True:
+            with connections[source].cursor() as cursor:
+                cursor.execute(select, [*params, last, self.batch_size])
+                rows = cursor.fetchall()
+            if not rows:
+                return
+            with transaction.atomic(using=target), \
+                    connections[target].cursor() as cursor:
+                cursor.execute(
+                    'SELECT seq FROM main.sqlite_sequence WHERE name = %s',
+                    [table])
+                sequence = cursor.fetchone()
+                cursor.executemany(insert, rows)
+                # Чужие id не должны сдвигать счётчик AUTOINCREMENT:
+                # новые строки шарда остаются в его диапазоне id.
+                cursor.execute(
+                    'UPDATE main.sqlite_sequence SET seq = %s '
+                    'WHERE name = %s',
+                    [sequence[0] if sequence else
+                     shards.number(target) * shards.ID_SPAN, table])
+            last = rows[-1][position]
+
+    def ids(self, model, author_id, alias):
+        where, params = self.scope(model, author_id)
+        with connections[alias].cursor() as cursor:
+            cursor.execute(
+                f'SELECT id FROM {model._meta.db_table} WHERE {where}',
+                params)
+            return {row[0] for row in cursor.fetchall()}
+
+    def drop_deleted(self, author_id, source, target):
+        """Удаляет из target строки, удалённые в source за время копии.
+
+        Возвращает число постов и комментариев автора.
+        """
+        counts = {}
+        for model in (Comment, Post):
+            kept = self.ids(model, author_id, source)
+            gone = sorted(self.ids(model, author_id, target) - kept)
+            table = model._meta.db_table
+            for start in range(0, len(gone), self.batch_size):
+                chunk = gone[start:start + self.batch_size]
+                with connections[target].cursor() as cursor:
+                    cursor.execute(
+                        f'DELETE FROM {table} WHERE id IN '
+                        f'({", ".join(["%s"] * len(chunk))})', chunk)
+            counts[model] = len(kept)
+        return counts[Post], counts[Comment]
+
+    def purge(self, author_id, alias):
+        """Удаляет строки автора из шарда пачками, без сигналов."""
+        for model in (Comment, Post):
+            where, params = self.scope(model, author_id)
+            table = model._meta.db_table
+            deleted = self.batch_size
+            while deleted == self.batch_size:
+                with connections[alias].cursor() as cursor:
+                    cursor.execute(
+                        f'DELETE FROM {table} WHERE id IN ('
+                        f'SELECT id FROM {table} WHERE {where} LIMIT %s)',
+                        [*params, self.batch_size])
+                    deleted = cursor.rowcount
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from posts import search
+
+
+class Command(BaseCommand):
+    help = (
+        'Создаёт недостающие индекс FTS5 и триггеры поиска и '
+        'перестраивает индекс по текущим постам.'
+    )
+
+    def handle(self, *args, **options):
+        search.install()
+        search.rebuild()
+        self.stdout.write('Индекс поиска перестроен.')
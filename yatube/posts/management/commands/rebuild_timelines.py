@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from posts import timeline
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересобирает материализованные ленты подписок. Счётчики '
+        'подписчиков должны быть актуальны (manage.py recount).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, dest='user_id',
+            help='Пересобрать ленту только одного пользователя (id).'
+        )
+        parser.add_argument(
+            '--author', type=int, dest='author_id',
+            help='Пересобрать записи постов только одного автора (id).'
+        )
+
+    def handle(self, *args, **options):
+        created = timeline.rebuild(options['user_id'], options['author_id'])
+        self.stdout.write(f'Записей в лентах: {created}')
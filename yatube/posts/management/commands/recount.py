@@ -0,0 +1,67 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import counters, shards, storage
+from posts.models import Group, GroupStats, Post, PostStats, UserStats
+
+User = get_user_model()
+
+OWNERS = {
+    'users': (User, UserStats),
+    'groups': (Group, GroupStats),
+    'posts': (Post, PostStats),
+}
+# Ссылки на файлы картинок (posts.storage) и посты по дням считаются
+# по постам целиком.
+KINDS = sorted([*OWNERS, 'days', 'media'])
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает денормализованные счётчики пользователей, групп, '
+        'постов и дней пачками и исправляет расхождения с данными.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'kinds', nargs='*',
+            help=f'Что пересчитать: {", ".join(KINDS)}; '
+                 'по умолчанию всё.'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        unknown = set(options['kinds']) - set(KINDS)
+        if unknown:
+            raise CommandError(f'Неизвестные счётчики: {", ".join(unknown)}')
+        for kind in options['kinds'] or KINDS:
+            if kind == 'media':
+                self.stdout.write(f'media: пересчитано {storage.recount()}')
+                continue
+            if kind == 'days':
+                self.stdout.write(
+                    f'days: пересчитано {counters.recount_days()}')
+                continue
+            owner_model, stats_model = OWNERS[kind]
+            done = 0
+            for pks in self.batches(owner_model, options['batch_size']):
+                counters.recount(stats_model, pks)
+                done += len(pks)
+            self.stdout.write(f'{kind}: пересчитано {done}')
+
+    @staticmethod
+    def batches(model, size):
+        """Первичные ключи пачками по возрастанию, без OFFSET.
+
+        Посты — по каждому шарду отдельно.
+        """
+        for objects in shards.spread(model.objects.all()):
+            last = 0
+            while True:
+                pks = list(objects.filter(
+                    pk__gt=last
+                ).order_by('pk').values_list('pk', flat=True)[:size])
+                if not pks:
+                    break
+                yield pks
+                last = pks[-1]
@@ -0,0 +1,268 @@
+import io
+import random
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from faker import Faker
+from PIL import Image
+
+from posts import imagemeta, storage
+from posts.models import Comment, Follow, Group, Post
+from posts.storage import media_storage
+
+User = get_user_model()
+
+# Набор фраз, из которых собираются тексты: Faker на каждый пост
+# слишком медленный для миллионов строк.
+PHRASES = 2000
+IMAGES = 20
+IMAGE_FIELDS = list(imagemeta.FIELDS)
+NO_IMAGE = ('', *imagemeta.FIELDS.values())
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет БД пользователями, группами, постами, комментариями '
+        'и подписками. Активность авторов и число подписчиков '
+        'распределены по степенному закону; при одинаковом --seed '
+        'данные совпадают.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=50)
+        parser.add_argument('--posts', type=int, default=100_000)
+        parser.add_argument('--comments', type=int, default=200_000)
+        parser.add_argument('--follows', type=int, default=20_000)
+        parser.add_argument(
+            '--images', type=float, default=0.0,
+            help='Доля постов с картинкой, от 0 до 1.'
+        )
+        parser.add_argument(
+            '--skew', type=float, default=3.0,
+            help='Крутизна степенного распределения активности.'
+        )
+        parser.add_argument('--days', type=int, default=365)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Строк в одном bulk_create; ограничивает память.'
+        )
+        parser.add_argument(
+            '--skip-derived', action='store_true',
+            help='Не пересчитывать счётчики и ленты подписок.'
+        )
+
+    def handle(self, *args, **options):
+        if not options['users'] and (
+            options['posts'] or options['comments'] or options['follows']
+        ):
+            raise CommandError('Для постов и подписок нужны пользователи.')
+        self.rng = random.Random(options['seed'])
+        self.skew = options['skew']
+        self.batch_size = options['batch_size']
+        faker = Faker('ru_RU')
+        faker.seed_instance(options['seed'])
+        self.phrases = [faker.sentence() for _ in range(PHRASES)]
+        self.names = [
+            (faker.first_name(), faker.last_name()) for _ in range(PHRASES)
+        ]
+        self.end = timezone.now()
+        self.start = self.end - timedelta(days=options['days'])
+
+        users = self.create_users(options['users'])
+        groups = self.create_groups(options['groups'])
+        images = self.create_images(options['images'])
+        posts = self.create_posts(
+            options['posts'], users, groups, images, options['images'])
+        if images:
+            # Каждая картинка сохранена один раз, а ссылаются на неё
+            # многие посты: без пересчёта release() у одного из них
+            # удалил бы файл остальных.
+            storage.recount()
+        self.create_comments(options['comments'], posts, users)
+        self.create_follows(options['follows'], users)
+
+        if not options['skip_derived']:
+            call_command('recount', stdout=self.stdout)
+            call_command('rebuild_timelines', stdout=self.stdout)
+        cache.clear()
+
+    def rank(self, size):
+        """Номер от 0 до size - 1; малые номера выпадают чаще."""
+        return int(size * self.rng.random() ** self.skew)
+
+    def text(self, words=3):
+        return ' '.join(self.rng.choice(self.phrases) for _ in range(words))
+
+    def insert(self, model, columns, rows, total):
+        """Вставляет кортежи значений пачками через executemany.
+
+        Модели не создаются: на миллионах строк ORM в разы медленнее.
+        """
+        quote = connection.ops.quote_name
+        sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+            quote(model._meta.db_table),
+            ', '.join(quote(column) for column in columns),
+            ', '.join(['%s'] * len(columns)),
+        )
+        name = model._meta.verbose_name_plural
+        batch = []
+        created = 0
+        for row in rows:
+            batch.append(row)
+            if len(batch) == self.batch_size:
+                self.flush(sql, batch)
+                created += len(batch)
+                batch = []
+                self.stdout.write(f'{name}: {created}/{total}', ending='\r')
+        self.flush(sql, batch)
+        created += len(batch)
+        self.stdout.write(f'{name}: {created}')
+
+    @staticmethod
+    def flush(sql, batch):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(sql, batch)
+
+    @staticmethod
+    def db_datetime(value):
+        return connection.ops.adapt_datetimefield_value(value)
+
+    @staticmethod
+    def next_pk(model):
+        return (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+    def create_users(self, count):
+        first = self.next_pk(User)
+        joined = self.db_datetime(self.start)
+        rows = (
+            (pk, f'user{pk}', self.rng.choice(self.names)[0],
+             self.rng.choice(self.names)[1], '', '!',
+             False, False, True, joined)
+            for pk in range(first, first + count)
+        )
+        self.insert(User, [
+            'id', 'username', 'first_name', 'last_name', 'email',
+            'password', 'is_superuser', 'is_staff', 'is_active',
+            'date_joined',
+        ], rows, count)
+        return range(first, first + count)
+
+    def create_groups(self, count):
+        first = self.next_pk(Group)
+        rows = (
+            (pk, self.rng.choice(self.phrases)[:200], f'group-{pk}',
+             self.text())
+            for pk in range(first, first + count)
+        )
+        self.insert(
+            Group, ['id', 'title', 'slug', 'description'], rows, count)
+        return range(first, first + count)
+
+    def create_images(self, share):
+        """Картинки и их сведения: (имя, *значения полей imagemeta)."""
+        if not share:
+            return []
+        images = []
+        for number in range(IMAGES):
+            color = tuple(self.rng.randrange(256) for _ in range(3))
+            buffer = io.BytesIO()
+            Image.new('RGB', (960, 640), color).save(buffer, 'JPEG')
+            name = media_storage.save(
+                f'posts/seed_{number}.jpg', ContentFile(buffer.getvalue())
+            )
+            with media_storage.open(name) as file:
+                meta = imagemeta.describe(file)
+            images.append((name, *(meta[field] for field in IMAGE_FIELDS)))
+        return images
+
+    def post_date(self, index, total):
+        return self.start + (self.end - self.start) * (index / total)
+
+    def create_posts(self, count, users, groups, images, image_share):
+        first = self.next_pk(Post)
+
+        def rows():
+            for index in range(count):
+                image = NO_IMAGE
+                if images and self.rng.random() < image_share:
+                    image = self.rng.choice(images)
+                group = None
+                if groups and self.rng.random() < 0.7:
+                    group = groups[self.rank(len(groups))]
+                published = self.db_datetime(self.post_date(index, count))
+                yield (
+                    first + index,
+                    self.text(),
+                    users[self.rank(len(users))],
+                    group,
+                    *image,
+                    published,
+                    published,
+                )
+
+        self.insert(Post, [
+            'id', 'text', 'author_id', 'group_id', 'image', *IMAGE_FIELDS,
+            'pub_date', 'updated_at',
+        ], rows(), count)
+        return first, count
+
+    def create_comments(self, count, posts, users):
+        first_post, posts_count = posts
+        if not posts_count:
+            return
+
+        def rows():
+            for _ in range(count):
+                # Свежие посты комментируют чаще.
+                index = posts_count - 1 - self.rank(posts_count)
+                posted = self.post_date(index, posts_count)
+                commented = self.db_datetime(
+                    posted + (self.end - posted) * self.rng.random())
+                yield (
+                    self.text(1),
+                    first_post + index,
+                    self.rng.choice(users),
+                    commented,
+                    commented,
+                )
+
+        self.insert(Comment, [
+            'text', 'post_id', 'author_id', 'pub_date', 'updated_at',
+        ], rows(), count)
+
+    def create_follows(self, count, users):
+        if len(users) < 2:
+            return
+        mean = count / len(users)
+
+        def rows():
+            created = 0
+            for user in users:
+                wanted = min(
+                    int(self.rng.paretovariate(2) * mean / 2),
+                    len(users) - 1,
+                    count - created,
+                )
+                authors = set()
+                for _ in range(wanted * 2):
+                    if len(authors) == wanted:
+                        break
+                    author = users[self.rank(len(users))]
+                    if author != user:
+                        authors.add(author)
+                for author in sorted(authors):
+                    yield user, author
+                created += len(authors)
+                if created >= count:
+                    return
+
+        self.insert(Follow, ['user_id', 'author_id'], rows(), count)
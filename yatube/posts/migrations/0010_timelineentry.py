@@ -0,0 +1,67 @@
+# Generated by Django 2.2.16 on 2026-10-17 06:28
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_timelines(apps, schema_editor):
+    """Раскладывает последние посты авторов по лентам одним INSERT.
+
+    Как timeline.rebuild: TIMELINE_BACKFILL постов каждого автора
+    выбираются оконной функцией, авторы с числом подписчиков выше
+    TIMELINE_FANOUT_LIMIT пропускаются — их посты подмешивает чтение.
+    """
+    Follow = apps.get_model('posts', 'Follow')
+    Post = apps.get_model('posts', 'Post')
+    TimelineEntry = apps.get_model('posts', 'TimelineEntry')
+    quote = schema_editor.connection.ops.quote_name
+    entry = quote(TimelineEntry._meta.db_table)
+    follow = quote(Follow._meta.db_table)
+    post = quote(Post._meta.db_table)
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'''
+            INSERT OR IGNORE INTO {entry} (user_id, post_id)
+            SELECT f.user_id, p.id
+            FROM {follow} f
+            JOIN (
+                SELECT id, author_id, ROW_NUMBER() OVER (
+                    PARTITION BY author_id ORDER BY pub_date DESC, id DESC
+                ) AS position
+                FROM {post}
+            ) p ON p.author_id = f.author_id
+            JOIN (
+                SELECT author_id, COUNT(*) AS followers
+                FROM {follow}
+                GROUP BY author_id
+            ) c ON c.author_id = f.author_id
+            WHERE p.position <= %s AND c.followers <= %s
+        ''', [settings.TIMELINE_BACKFILL, settings.TIMELINE_FANOUT_LIMIT])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0009_post_pub_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='posts.Post', verbose_name='Пост')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to=settings.AUTH_USER_MODEL, verbose_name='Читатель')),
+            ],
+            options={
+                'verbose_name': 'Запись ленты',
+                'verbose_name_plural': 'Записи ленты',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='timelineentry',
+            constraint=models.UniqueConstraint(fields=('user', 'post'), name='unique_timeline_user_post'),
+        ),
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
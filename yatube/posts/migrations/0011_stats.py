@@ -0,0 +1,99 @@
+# Generated by Django 2.2.16 on 2026-10-17 06:31
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count
+
+# Как posts.counters.COUNTERS: модель, строки которой считаются,
+# и поле, ссылающееся на владельца строки статистики.
+COUNTERS = {
+    'UserStats': {
+        'posts_count': ('Post', 'author'),
+        'comments_count': ('Comment', 'author'),
+        'followers_count': ('Follow', 'author'),
+        'following_count': ('Follow', 'user'),
+    },
+    'GroupStats': {
+        'posts_count': ('Post', 'group'),
+    },
+    'PostStats': {
+        'comments_count': ('Comment', 'post'),
+    },
+}
+OWNERS = {
+    'UserStats': (settings.AUTH_USER_MODEL, 'user'),
+    'GroupStats': ('posts.Group', 'group'),
+    'PostStats': ('posts.Post', 'post'),
+}
+
+
+def fill_stats(apps, schema_editor):
+    """Заполняет счётчики по данным из БД, как counters.recount."""
+    for stats_name, counters in COUNTERS.items():
+        stats_model = apps.get_model('posts', stats_name)
+        owner, field = OWNERS[stats_name]
+        values = {
+            pk: dict.fromkeys(counters, 0)
+            for pk in apps.get_model(owner).objects.values_list(
+                'pk', flat=True).iterator()
+        }
+        for name, (model_name, related) in counters.items():
+            rows = apps.get_model('posts', model_name).objects.order_by(
+            ).values_list(related).annotate(total=Count('pk'))
+            for pk, total in rows:
+                if pk in values:
+                    values[pk][name] = total
+        stats_model.objects.bulk_create(
+            (stats_model(**{f'{field}_id': pk}, **counts)
+             for pk, counts in values.items()),
+            batch_size=500,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0011_update_proxy_permissions'),
+        ('posts', '0010_timelineentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GroupStats',
+            fields=[
+                ('group', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='posts.Group', verbose_name='Группа')),
+                ('posts_count', models.IntegerField(default=0, verbose_name='Постов')),
+            ],
+            options={
+                'verbose_name': 'Счётчики группы',
+                'verbose_name_plural': 'Счётчики групп',
+            },
+        ),
+        migrations.CreateModel(
+            name='PostStats',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='posts.Post', verbose_name='Пост')),
+                ('comments_count', models.IntegerField(default=0, verbose_name='Комментариев')),
+            ],
+            options={
+                'verbose_name': 'Счётчики поста',
+                'verbose_name_plural': 'Счётчики постов',
+            },
+        ),
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('posts_count', models.IntegerField(default=0, verbose_name='Постов')),
+                ('comments_count', models.IntegerField(default=0, verbose_name='Комментариев')),
+                ('followers_count', models.IntegerField(default=0, verbose_name='Подписчиков')),
+                ('following_count', models.IntegerField(default=0, verbose_name='Подписок')),
+            ],
+            options={
+                'verbose_name': 'Счётчики пользователя',
+                'verbose_name_plural': 'Счётчики пользователей',
+            },
+        ),
+        migrations.RunPython(fill_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 2.2.16 on 2026-10-17 07:38
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+
+def fill_day_stats(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    DayStats = apps.get_model('posts', 'DayStats')
+    totals = Post.objects.annotate(day=TruncDate('pub_date')).order_by(
+    ).values_list('day').annotate(total=Count('pk'))
+    DayStats.objects.bulk_create(
+        DayStats(day=day, posts_count=total) for day, total in totals
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0014_media_file'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DayStats',
+            fields=[
+                ('day', models.DateField(primary_key=True, serialize=False, verbose_name='День')),
+                ('posts_count', models.IntegerField(default=0, verbose_name='Постов')),
+            ],
+            options={
+                'verbose_name': 'Счётчики дня',
+                'verbose_name_plural': 'Счётчики дней',
+            },
+        ),
+        migrations.RunPython(fill_day_stats, migrations.RunPython.noop),
+    ]
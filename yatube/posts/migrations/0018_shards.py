@@ -0,0 +1,38 @@
+# Generated by Django 2.2.16 on 2026-10-17 08:22
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0011_update_proxy_permissions'),
+        ('posts', '0017_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthorShard',
+            fields=[
+                ('author', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='shard', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+                ('shard', models.CharField(max_length=100, verbose_name='Шард')),
+                ('frozen', models.BooleanField(default=False, verbose_name='Переносится')),
+            ],
+            options={
+                'verbose_name': 'Шард автора',
+                'verbose_name_plural': 'Шарды авторов',
+            },
+        ),
+        migrations.AlterField(
+            model_name='poststats',
+            name='post',
+            field=models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='stats', serialize=False, to='posts.Post', verbose_name='Пост'),
+        ),
+        migrations.AlterField(
+            model_name='timelineentry',
+            name='post',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='timeline_entries', to='posts.Post', verbose_name='Пост'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 2.2.16 on 2026-10-17 09:12
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_pub_dates(apps, schema_editor):
+    """Копирует в записи ленты даты постов из всех шардов.
+
+    Записи, чьих постов уже нет, удаляются.
+    """
+    Post = apps.get_model('posts', 'Post')
+    TimelineEntry = apps.get_model('posts', 'TimelineEntry')
+    post_ids = list(TimelineEntry.objects.filter(
+        pub_date__isnull=True).values_list('post_id', flat=True).distinct())
+    for start in range(0, len(post_ids), 500):
+        chunk = post_ids[start:start + 500]
+        for alias in settings.POST_SHARDS:
+            dates = Post.objects.using(alias).filter(
+                pk__in=chunk).values_list('pk', 'pub_date')
+            for pk, pub_date in dates:
+                TimelineEntry.objects.filter(post_id=pk).update(
+                    pub_date=pub_date)
+    TimelineEntry.objects.filter(pub_date__isnull=True).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0018_shards'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='timelineentry',
+            name='pub_date',
+            field=models.DateTimeField(null=True, verbose_name='Дата поста'),
+        ),
+        migrations.RunPython(fill_pub_dates, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='timelineentry',
+            name='pub_date',
+            field=models.DateTimeField(verbose_name='Дата поста'),
+        ),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['user', 'pub_date', 'post'], name='timeline_user_pub_date_idx'),
+        ),
+    ]
@@ -2,6 +2,8 @@ from django.db import models
 from django.contrib.auth import get_user_model
 from core.models import CreatedModel
 
+from .storage import media_storage
+
 
 User = get_user_model()
 
@@ -19,30 +21,82 @@ class Group(models.Model):
         verbose_name_plural = 'Группы'
 
 
+class RoutedQuerySet(models.QuerySet):
+    """create() без using оставляет выбор БД роутеру по самому объекту.
+
+    Стандартный create() сохраняет в БД, которую роутер выбрал без
+    объекта, а шард поста и комментария зависит от автора
+    (posts.shards).
+    """
+
+    def create(self, **kwargs):
+        if self._db is not None:
+            return super().create(**kwargs)
+        obj = self.model(**kwargs)
+        self._for_write = True
+        obj.save(force_insert=True)
+        return obj
+
+
 class Post(CreatedModel):
     text = models.TextField(
         'Текст поста',
         help_text='Введите текст поста'
     )
+    # Отдельные индексы внешних ключей не нужны: их заменяют составные
+    # индексы из Meta, которые начинаются с этих полей.
+    # Пользователи и группы — в основной БД, а пост может лежать
+    # в шарде (posts.shards): ограничение в БД было бы между файлами.
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
+        db_constraint=False,
         verbose_name='Автор',
-        related_name='posts'
+        related_name='posts',
+        db_index=False
     )
     group = models.ForeignKey(
         Group,
         on_delete=models.SET_NULL,
+        db_constraint=False,
         blank=True,
         null=True,
         verbose_name='Группа',
-        help_text='Группа, к которой будет относиться пост'
+        help_text='Группа, к которой будет относиться пост',
+        db_index=False
     )
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=media_storage,
         blank=True
     )
+    # Сведения о картинке считаются при сохранении (posts.imagemeta),
+    # чтобы при показе поста не читать файл.
+    image_width = models.PositiveIntegerField(
+        'Ширина картинки', null=True, blank=True, editable=False)
+    image_height = models.PositiveIntegerField(
+        'Высота картинки', null=True, blank=True, editable=False)
+    image_size = models.PositiveIntegerField(
+        'Размер файла, байт', null=True, blank=True, editable=False)
+    image_color = models.CharField(
+        'Преобладающий цвет', max_length=7, blank=True, editable=False)
+    image_lqip = models.TextField(
+        'Размытое превью', blank=True, editable=False)
+    # Группа и картинка на момент загрузки из БД: при смене группы
+    # сбрасываются агрегаты и старой, и новой группы, а для новой
+    # картинки заранее создаётся миниатюра.
+    _loaded_group_id = None
+    _loaded_image = None
+
+    objects = RoutedQuerySet.as_manager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_group_id = instance.__dict__.get('group_id')
+        instance._loaded_image = instance.__dict__.get('image')
+        return instance
 
     def __str__(self):
         return self.text[:15]
@@ -51,6 +105,35 @@ class Post(CreatedModel):
         verbose_name = 'Статья'
         verbose_name_plural = 'Статьи'
         ordering = ['-pub_date']
+        # Ленты читаются по (pub_date, id) целиком, у автора и у группы:
+        # индекс сразу отдаёт строки в порядке ленты, без сортировки.
+        indexes = [
+            models.Index(
+                fields=['pub_date', 'id'], name='post_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=['author', 'pub_date', 'id'],
+                name='post_author_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=['group', 'pub_date', 'id'],
+                name='post_group_pub_date_id_idx'
+            ),
+        ]
+
+
+class MediaFile(models.Model):
+    """Файл картинки в хранилище по хэшу и число постов с ним."""
+    name = models.CharField('Имя файла', max_length=255, unique=True)
+    size = models.PositiveIntegerField('Размер, байт', default=0)
+    refs = models.PositiveIntegerField('Ссылок', default=0)
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        verbose_name = 'Файл'
+        verbose_name_plural = 'Файлы'
 
 
 class Comment(CreatedModel):
@@ -63,16 +146,21 @@ class Comment(CreatedModel):
         on_delete=models.CASCADE,
         verbose_name='Пост',
         help_text='Пост, к которому относится комментарий',
-        related_name='comments'
+        related_name='comments',
+        db_index=False
     )
+    # Комментарий лежит в шарде поста, а пользователь — в основной БД.
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
+        db_constraint=False,
         verbose_name='Автор',
         help_text='Автор, написавший комментарий',
         related_name='comments'
     )
 
+    objects = RoutedQuerySet.as_manager()
+
     def __str__(self):
         return self.text[:15]
 
@@ -80,6 +168,12 @@ class Comment(CreatedModel):
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
         ordering = ['-pub_date']
+        indexes = [
+            models.Index(
+                fields=['post', 'pub_date', 'id'],
+                name='comment_post_pub_date_id_idx'
+            ),
+        ]
 
 
 class Follow(models.Model):
@@ -87,7 +181,8 @@ class Follow(models.Model):
         User,
         on_delete=models.CASCADE,
         verbose_name='Подписчик',
-        related_name='follower'
+        related_name='follower',
+        db_index=False
     )
     author = models.ForeignKey(
         User,
@@ -99,8 +194,150 @@ class Follow(models.Model):
     def __str__(self):
         return f'{self.user.username} follow {self.author.username}'
 
-    constraints = [
-        models.UniqueConstraint(
-            fields=['user', 'author'], name='unique_author_user_following'
-        )
-    ]
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'author'],
+                name='unique_author_user_following'
+            )
+        ]
+
+
+class TimelineEntry(models.Model):
+    """Пост в материализованной ленте подписок пользователя."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Читатель',
+        related_name='timeline'
+    )
+    # Пост может лежать в другом шарде (posts.shards): без ограничения
+    # в БД, записи удаляет сигнал удаления поста.
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        verbose_name='Пост',
+        related_name='timeline_entries'
+    )
+    # Копия даты поста: страница ленты берётся из индекса записей
+    # в порядке ленты, а посты читаются по id.
+    pub_date = models.DateTimeField('Дата поста')
+
+    def __str__(self):
+        return f'{self.user_id} <- {self.post_id}'
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'], name='unique_timeline_user_post'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', 'pub_date', 'post'],
+                name='timeline_user_pub_date_idx'
+            ),
+        ]
+
+
+class UserStats(models.Model):
+    """Денормализованные счётчики пользователя."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        verbose_name='Пользователь',
+        related_name='stats'
+    )
+    posts_count = models.IntegerField('Постов', default=0)
+    comments_count = models.IntegerField('Комментариев', default=0)
+    followers_count = models.IntegerField('Подписчиков', default=0)
+    following_count = models.IntegerField('Подписок', default=0)
+
+    def __str__(self):
+        return f'Счётчики пользователя {self.user_id}'
+
+    class Meta:
+        verbose_name = 'Счётчики пользователя'
+        verbose_name_plural = 'Счётчики пользователей'
+
+
+class GroupStats(models.Model):
+    """Денормализованные счётчики группы."""
+    group = models.OneToOneField(
+        Group,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        verbose_name='Группа',
+        related_name='stats'
+    )
+    posts_count = models.IntegerField('Постов', default=0)
+
+    def __str__(self):
+        return f'Счётчики группы {self.group_id}'
+
+    class Meta:
+        verbose_name = 'Счётчики группы'
+        verbose_name_plural = 'Счётчики групп'
+
+
+class DayStats(models.Model):
+    """Денормализованное число постов за день (по местному времени)."""
+    day = models.DateField('День', primary_key=True)
+    posts_count = models.IntegerField('Постов', default=0)
+
+    def __str__(self):
+        return f'Счётчики дня {self.day}'
+
+    class Meta:
+        verbose_name = 'Счётчики дня'
+        verbose_name_plural = 'Счётчики дней'
+
+
+class PostStats(models.Model):
+    """Денормализованные счётчики поста."""
+    # Как у TimelineEntry: пост может лежать в другом шарде.
+    post = models.OneToOneField(
+        Post,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        primary_key=True,
+        verbose_name='Пост',
+        related_name='stats'
+    )
+    comments_count = models.IntegerField('Комментариев', default=0)
+
+    def __str__(self):
+        return f'Счётчики поста {self.post_id}'
+
+    class Meta:
+        verbose_name = 'Счётчики поста'
+        verbose_name_plural = 'Счётчики постов'
+
+
+class AuthorShard(models.Model):
+    """Шард, в котором лежат посты автора и комментарии к ним.
+
+    Карта шардов posts.shards; автор без строки живёт в 'default'.
+    """
+    author = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        verbose_name='Автор',
+        related_name='shard'
+    )
+    shard = models.CharField('Шард', max_length=100)
+    # Пока посты переносятся в другой шард (rebalance), запись
+    # автора ждёт.
+    frozen = models.BooleanField('Переносится', default=False)
+
+    def __str__(self):
+        return f'{self.author_id} -> {self.shard}'
+
+    class Meta:
+        verbose_name = 'Шард автора'
+        verbose_name_plural = 'Шарды авторов'
@@ -0,0 +1,80 @@
+"""Кэш целых страниц для анонимных посетителей.
+
+View, обёрнутая декоратором page_cache, отмечает тегами области
+(posts.generations), из данных которых собрана страница. Ответ
+хранится вместе с поколениями этих тегов на момент сборки; если хотя
+бы одно поколение с тех пор сдвинулось, запись считается устаревшей.
+Заголовок X-Page-Cache показывает HIT, MISS или BYPASS.
+"""
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import generations
+
+PAGE_KEY = 'page:{}'
+HEADER = 'X-Page-Cache'
+
+
+def page_key(request):
+    url = request.build_absolute_uri().encode()
+    return PAGE_KEY.format(hashlib.md5(url).hexdigest())
+
+
+def cacheable(request):
+    return (
+        settings.PAGE_CACHE_ENABLED
+        and request.method in ('GET', 'HEAD')
+        and not request.user.is_authenticated
+    )
+
+
+def tag(request, *scopes):
+    """Отмечает страницу тегами; вызывать до чтения данных из БД."""
+    tags = getattr(request, 'cache_tags', None)
+    if tags is None:
+        return
+    for scope in scopes:
+        tags[scope] = generations.get(scope)
+
+
+def fresh(entry):
+    tags = entry['tags']
+    return generations.get_many(tags) == tags
+
+
+def page_cache(view_func):
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if not cacheable(request):
+            response = view_func(request, *args, **kwargs)
+            if settings.PAGE_CACHE_ENABLED:
+                response[HEADER] = 'BYPASS'
+            return response
+        key = page_key(request)
+        entry = cache.get(key)
+        if entry is not None and fresh(entry):
+            response = entry['response']
+            response[HEADER] = 'HIT'
+            return response
+        request.cache_tags = {}
+        response = view_func(request, *args, **kwargs)
+        if (
+            response.status_code == 200
+            and request.cache_tags
+            and not response.cookies
+            and not response.streaming
+        ):
+            if hasattr(response, 'render'):
+                response.render()
+            response[HEADER] = 'MISS'
+            cache.set(key, {
+                'response': response,
+                'tags': request.cache_tags,
+            }, settings.PAGE_CACHE_TIMEOUT)
+        else:
+            response[HEADER] = 'BYPASS'
+        return response
+    return wrapper
@@ -0,0 +1,202 @@
+"""Полнотекстовый поиск по постам на SQLite FTS5.
+
+Индекс — внешняя таблица FTS5 над posts_post (content=posts_post):
+текст хранится один раз, в индексе только словарь и позиции. Его
+держат в актуальном состоянии триггеры на posts_post, поэтому в индекс
+попадают и массовые вставки в обход ORM (seed). Таблица и триггеры
+создаются после migrate (post_migrate): SQLite пересоздаёт таблицу при
+изменении полей и теряет триггеры, а здесь они ставятся заново.
+
+Результаты упорядочены по релевантности bm25 и листаются курсором
+(ранг, id) без OFFSET. С шардированием (posts.shards) у каждого шарда
+свой индекс, и совпадения шардов сливаются по рангу; bm25 считается
+по статистике слов своего шарда, поэтому ранги шардов сравнимы лишь
+приближённо.
+"""
+import base64
+import binascii
+import heapq
+import itertools
+import re
+
+from django.db import connections
+
+from . import shards
+from .models import Post
+from .utils import KeysetPage
+
+TABLE = 'posts_post_fts'
+TERM = re.compile(r'\w+')
+MAX_TERMS = 8
+CREATE_TABLE = (
+    f'CREATE VIRTUAL TABLE {TABLE} USING fts5('
+    "text, content='posts_post', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+)
+TRIGGERS = [
+    f'''CREATE TRIGGER IF NOT EXISTS {TABLE}_insert
+    AFTER INSERT ON posts_post BEGIN
+        INSERT INTO {TABLE} (rowid, text) VALUES (new.id, new.text);
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS {TABLE}_delete
+    AFTER DELETE ON posts_post BEGIN
+        INSERT INTO {TABLE} ({TABLE}, rowid, text)
+        VALUES ('delete', old.id, old.text);
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS {TABLE}_update
+    AFTER UPDATE OF text ON posts_post BEGIN
+        INSERT INTO {TABLE} ({TABLE}, rowid, text)
+        VALUES ('delete', old.id, old.text);
+        INSERT INTO {TABLE} (rowid, text) VALUES (new.id, new.text);
+    END''',
+]
+
+
+def install(using='default', **kwargs):
+    """Создаёт индекс, если его нет, и недостающие триггеры.
+
+    Обработчик post_migrate; новый индекс сразу заполняется.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s",
+            [TABLE],
+        )
+        created = cursor.fetchone() is None
+        if created:
+            cursor.execute(CREATE_TABLE)
+        for trigger in TRIGGERS:
+            cursor.execute(trigger)
+    if created:
+        rebuild(using)
+
+
+def rebuild(using='default'):
+    """Перестраивает индекс по текущему содержимому posts_post."""
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"INSERT INTO {TABLE} ({TABLE}) VALUES ('rebuild')")
+
+
+def match_expression(query):
+    """Запрос посетителя в выражение MATCH.
+
+    Синтаксис FTS5 посетителю не доступен: из запроса берутся только
+    слова, каждое ищется по префиксу, все слова обязательны.
+    """
+    terms = TERM.findall(query.lower())[:MAX_TERMS]
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def encode_cursor(rank, pk):
+    raw = f'{rank!r}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Возвращает (ранг, id) или ValueError для битого токена."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        rank, pk = raw.decode().split('|')
+        return float(rank), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as error:
+        raise ValueError('Некорректный курсор') from error
+
+
+def ranked_ids(match, limit, group_id=None, author_id=None, after=None,
+               using='default'):
+    """[(id, ранг)] лучших совпадений после курсора after.
+
+    Чем меньше bm25, тем выше пост; при равном ранге новее — выше.
+    """
+    sql = [f'SELECT {TABLE}.rowid, {TABLE}.rank FROM {TABLE}']
+    where = [f'{TABLE} MATCH %s']
+    params = [match]
+    if group_id is not None or author_id is not None:
+        sql.append(f'JOIN posts_post p ON p.id = {TABLE}.rowid')
+    if group_id is not None:
+        where.append('p.group_id = %s')
+        params.append(group_id)
+    if author_id is not None:
+        where.append('p.author_id = %s')
+        params.append(author_id)
+    if after is not None:
+        rank, pk = after
+        where.append(
+            f'({TABLE}.rank > %s OR '
+            f'({TABLE}.rank = %s AND {TABLE}.rowid < %s))'
+        )
+        params += [rank, rank, pk]
+    sql.append('WHERE ' + ' AND '.join(where))
+    sql.append(f'ORDER BY {TABLE}.rank, {TABLE}.rowid DESC LIMIT %s')
+    params.append(limit)
+    with connections[using].cursor() as cursor:
+        cursor.execute(' '.join(sql), params)
+        return cursor.fetchall()
+
+
+def ranked(match, limit, group_id=None, author_id=None, after=None):
+    """[(id, ранг, шард)] лучших совпадений со всех шардов.
+
+    Без шардирования шард — None: посты читаются как обычно.
+    """
+    if not shards.sharded():
+        rows = ranked_ids(match, limit, group_id, author_id, after)
+        return [(pk, rank, None) for pk, rank in rows]
+    aliases = shards.shards()
+    if author_id:
+        aliases = [shards.for_author(author_id)]
+    rows = heapq.merge(*(
+        [(pk, rank, alias) for pk, rank in ranked_ids(
+            match, limit, group_id, author_id, after, using=alias)]
+        for alias in aliases
+    ), key=lambda row: (row[1], -row[0]))
+    return list(itertools.islice(rows, limit))
+
+
+def filter_matching(queryset, match):
+    """Оставляет в queryset постов только подходящие под match.
+
+    Не pk__in=RawSQL(...): Django берёт подзапрос в двойные скобки,
+    и SQLite возвращает из него только первую строку.
+    """
+    return queryset.extra(
+        where=[
+            f'posts_post.id IN '
+            f'(SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s)'
+        ],
+        params=[match],
+    )
+
+
+def search_page(query, per_page, group_id=None, author_id=None, after=''):
+    """Страница результатов поиска: KeysetPage в порядке ранга."""
+    cursor = None
+    if after:
+        try:
+            cursor = decode_cursor(after)
+        except ValueError:
+            after = ''
+    match = match_expression(query)
+    rows = []
+    if match:
+        rows = ranked(match, per_page + 1, group_id, author_id, cursor)
+    found = rows[:per_page]
+    posts = {}
+    for alias in {alias for _, _, alias in found}:
+        posts.update(Post.objects.using(alias).select_related(
+            'author', 'group').in_bulk(
+                [pk for pk, _, shard in found if shard == alias]))
+    next_cursor = None
+    if len(rows) > per_page:
+        pk, rank, _ = found[-1]
+        next_cursor = encode_cursor(rank, pk)
+    return KeysetPage(
+        [posts[pk] for pk, _, _ in found if pk in posts], None,
+        next_cursor=next_cursor,
+        # Назад — только к первой странице: курсоры ведут вперёд.
+        previous_cursor='' if cursor else None,
+        cursor=after,
+    )
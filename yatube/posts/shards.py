@@ -0,0 +1,325 @@
+"""Шардирование постов и комментариев по автору.
+
+Посты автора и комментарии к ним лежат в одной БД — шарде. Шарды
+перечислены в settings.POST_SHARDS, первый — 'default'; пока шард один,
+маршрутизация не меняется. В шарде только таблицы posts_post
+и posts_comment (и индекс поиска над ними), остальные таблицы шард
+видит через ATTACH основной БД (OPTIONS['attach'] в core.db.sqlite3),
+поэтому select_related к автору, группе и счётчикам работает как раньше.
+
+Карта шардов — AuthorShard в основной БД, закэшированная навсегда:
+автор без строки живёт в 'default', новому автору шард назначается
+при первой записи. Номер шарда (SHARD в настройках БД) задаёт диапазон
+id: у шарда k id начинаются с k * ID_SPAN. По id видно, где пост
+создан; при переносе автора (manage.py rebalance) строки сохраняют id,
+а автора поста можно закэшировать навсегда.
+
+Профиль и страница поста читают один шард. Общие ленты (главная,
+группы, подписки) читают все шарды и сливают упорядоченные выборки:
+merged() возвращает MergedQuerySet.
+"""
+import heapq
+import itertools
+import time
+from operator import attrgetter
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from core.db import router
+
+from .models import AuthorShard, Comment, Post
+
+User = get_user_model()
+
+AUTHOR_KEY = 'shards:author:{}'
+POST_KEY = 'shards:post:{}'
+ID_SPAN = 2 ** 40
+SHARDED = (Post, Comment)
+
+
+class AuthorMoving(Exception):
+    """Посты автора переносятся дольше SHARD_MOVE_WAIT секунд."""
+
+
+def shards():
+    """Алиасы шардов, между которыми распределены авторы."""
+    return settings.POST_SHARDS
+
+
+def sharded():
+    return len(shards()) > 1
+
+
+def databases():
+    """Алиасы БД-шардов из настроек, кроме основной."""
+    return [
+        alias for alias, options in settings.DATABASES.items()
+        if options.get('SHARD')
+    ]
+
+
+def is_shard(alias):
+    return alias in databases()
+
+
+def number(alias):
+    """Номер шарда: от него зависит диапазон id."""
+    return settings.DATABASES[alias].get('SHARD', 0)
+
+
+def home(post_id):
+    """Шард, в котором пост создан."""
+    for alias in shards():
+        if number(alias) == post_id // ID_SPAN:
+            return alias
+    return DEFAULT_DB_ALIAS
+
+
+def location(author_id):
+    """(шард, переносится ли) автора; шард None — строки в карте нет."""
+    key = AUTHOR_KEY.format(author_id)
+    entry = cache.get(key)
+    if entry is None:
+        entry = AuthorShard.objects.using(DEFAULT_DB_ALIAS).filter(
+            author_id=author_id).values_list('shard', 'frozen').first()
+        entry = tuple(entry) if entry else (None, False)
+        # add, а не set: карту меняет rebalance, и его запись не должна
+        # затереться строкой, прочитанной до неё.
+        cache.add(key, entry, None)
+    return entry
+
+
+def assign(author_id, alias, frozen=False):
+    """Записывает шард автора в карту."""
+    AuthorShard.objects.using(DEFAULT_DB_ALIAS).update_or_create(
+        author_id=author_id, defaults={'shard': alias, 'frozen': frozen})
+    cache.set(AUTHOR_KEY.format(author_id), (alias, frozen), None)
+
+
+def place(author_id):
+    """Назначает шард автору, которого нет в карте.
+
+    Посты, написанные до шардирования, остаются в 'default'; новые
+    авторы распределяются по шардам по id.
+    """
+    if Post.objects.using(DEFAULT_DB_ALIAS).filter(
+        author_id=author_id
+    ).exists():
+        alias = DEFAULT_DB_ALIAS
+    else:
+        alias = shards()[author_id % len(shards())]
+    entry, _ = AuthorShard.objects.using(DEFAULT_DB_ALIAS).get_or_create(
+        author_id=author_id, defaults={'shard': alias})
+    cache.set(
+        AUTHOR_KEY.format(author_id), (entry.shard, entry.frozen), None)
+    return entry.shard
+
+
+def for_author(author_id):
+    """Шард автора или None без шардирования."""
+    if not sharded():
+        return None
+    return location(author_id)[0] or DEFAULT_DB_ALIAS
+
+
+def writable(author_id):
+    """Шард для записи автора; пока его переносят, ждёт конца переноса."""
+    deadline = time.monotonic() + settings.SHARD_MOVE_WAIT
+    while True:
+        alias, frozen = location(author_id)
+        if alias is None:
+            return place(author_id)
+        if not frozen:
+            return alias
+        if time.monotonic() >= deadline:
+            raise AuthorMoving(
+                f'Посты автора {author_id} переносятся в другой шард.')
+        time.sleep(0.05)
+
+
+def author_of(post_id):
+    """id автора поста или None, если поста нет."""
+    authors = Post.objects.filter(pk=post_id).values_list(
+        'author_id', flat=True)
+    if not sharded():
+        return authors.first()
+    key = POST_KEY.format(post_id)
+    author_id = cache.get(key)
+    if author_id is None:
+        start = home(post_id)
+        # Сначала шард, где пост создан: туда же ведёт большинство id.
+        for alias in sorted(shards(), key=lambda alias: alias != start):
+            author_id = authors.using(alias).first()
+            if author_id is not None:
+                cache.set(key, author_id, None)
+                break
+    return author_id
+
+
+def for_post(post_id):
+    """Шард поста и его комментариев или None без шардирования."""
+    if not sharded():
+        return None
+    author_id = author_of(post_id)
+    if author_id is None:
+        return home(post_id)
+    return for_author(author_id)
+
+
+def merged(queryset):
+    """Выборка со всех шардов; без шардирования — сама queryset."""
+    if not sharded():
+        return queryset
+    return MergedQuerySet([queryset.using(alias) for alias in shards()])
+
+
+def spread(queryset):
+    """queryset по каждому шарду, если модель шардирована, иначе [queryset].
+
+    Для агрегатов, которые складываются по шардам.
+    """
+    if not sharded() or queryset.model not in SHARDED:
+        return [queryset]
+    return [queryset.using(alias) for alias in shards()]
+
+
+def reserve(using=DEFAULT_DB_ALIAS, **kwargs):
+    """Сдвигает счётчики AUTOINCREMENT шарда в начало его диапазона id.
+
+    Обработчик post_migrate.
+    """
+    if not is_shard(using):
+        return
+    low = number(using) * ID_SPAN
+    with connections[using].cursor() as cursor:
+        for model in SHARDED:
+            table = model._meta.db_table
+            cursor.execute(
+                'UPDATE main.sqlite_sequence SET seq = %s '
+                'WHERE name = %s AND seq < %s', [low, table, low])
+            cursor.execute(
+                'INSERT INTO main.sqlite_sequence (name, seq) '
+                'SELECT %s, %s WHERE NOT EXISTS ('
+                'SELECT 1 FROM main.sqlite_sequence WHERE name = %s)',
+                [table, low, table])
+
+
+class MergedQuerySet:
+    """Выборка постов или комментариев со всех шардов.
+
+    Каждый шард отдаёт строки в порядке выборки, heapq.merge сливает их.
+    Срез [a:b] читает до b строк из каждого шарда, поэтому глубокие
+    страницы дороже, чем без шардирования; курсоры (KeysetPaginator)
+    читают per_page + 1 строк из шарда на любой глубине.
+    """
+    ordered = True
+
+    def __init__(self, parts):
+        self.parts = parts
+        self.model = parts[0].model
+
+    def _chain(self, method, *args, **kwargs):
+        return MergedQuerySet([
+            getattr(part, method)(*args, **kwargs) for part in self.parts
+        ])
+
+    def filter(self, *args, **kwargs):
+        return self._chain('filter', *args, **kwargs)
+
+    def exclude(self, *args, **kwargs):
+        return self._chain('exclude', *args, **kwargs)
+
+    def select_related(self, *fields):
+        return self._chain('select_related', *fields)
+
+    def order_by(self, *fields):
+        return self._chain('order_by', *fields)
+
+    def count(self):
+        return sum(part.count() for part in self.parts)
+
+    def ordering(self):
+        """Поля сортировки и направление: по убыванию ли."""
+        query = self.parts[0].query
+        ordering = list(query.order_by)
+        if not ordering and query.default_ordering:
+            ordering = list(self.model._meta.ordering)
+        descending = {name.startswith('-') for name in ordering}
+        if len(descending) != 1:
+            raise ValueError(
+                'Слияние шардов требует сортировки в одном направлении.')
+        return [name.lstrip('-') for name in ordering], descending.pop()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice) or key.step is not None:
+            raise TypeError('Выборку со всех шардов можно только срезать.')
+        fields, descending = self.ordering()
+        parts = self.parts
+        if key.stop is not None:
+            parts = [part[:key.stop] for part in parts]
+        rows = heapq.merge(
+            *parts, key=attrgetter(*fields), reverse=descending)
+        return list(itertools.islice(rows, key.start or 0, key.stop))
+
+
+class ShardRouter:
+    """Посты и комментарии — в шард автора, остальное — в основную БД.
+
+    Без шардирования ничего не решает и оставляет выбор ReplicaRouter.
+    Запросы без объекта-подсказки (Post.objects.filter(...)) идут
+    в 'default'; выборки по всем шардам строят merged() и spread().
+    """
+
+    def db_for_read(self, model, **hints):
+        return self.route(model, hints.get('instance'), write=False)
+
+    def db_for_write(self, model, **hints):
+        alias = self.route(model, hints.get('instance'), write=True)
+        if alias is not None:
+            router.written()
+        return alias
+
+    def route(self, model, instance, write):
+        if model not in SHARDED:
+            # Автор, группа и счётчики поста из шарда — в основной БД.
+            if instance is not None and is_shard(instance._state.db):
+                return DEFAULT_DB_ALIAS
+            return None
+        if instance is None or not sharded():
+            return None
+        if not write and isinstance(instance, SHARDED) and instance._state.db:
+            return instance._state.db
+        author_id = self.author_id(model, instance)
+        if author_id is None:
+            return None
+        return writable(author_id) if write else for_author(author_id)
+
+    @staticmethod
+    def author_id(model, instance):
+        if isinstance(instance, Post):
+            return instance.author_id
+        if isinstance(instance, Comment):
+            if instance.post_id is None:
+                return None
+            return author_of(instance.post_id)
+        # Комментарии пользователя разбросаны по шардам их постов.
+        if model is Post and isinstance(instance, User):
+            return instance.pk
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Шард присоединяет основную БД, связи между ними работают.
+        if {obj1._state.db, obj2._state.db} <= {
+            DEFAULT_DB_ALIAS, *databases()
+        }:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if not is_shard(db):
+            return None
+        # Миграции данных (RunPython, RunSQL) в шардах не выполняются.
+        return app_label == 'posts' and model_name in ('post', 'comment')
@@ -0,0 +1,146 @@
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from . import (counters, generations, imagemeta, shards, storage, thumbnails,
+               timeline)
+from .models import Comment, Follow, Group, GroupStats, Post, UserStats
+from .utils import invalidate_counts
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        UserStats.objects.get_or_create(user=instance)
+        return
+    # Вход сохраняет только last_login, которого нет на страницах.
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    # Имя автора есть на карточках его постов во всех лентах.
+    groups = set()
+    for posts in shards.spread(Post.objects.filter(author=instance)):
+        groups.update(posts.exclude(group=None).order_by().values_list(
+            'group_id', flat=True).distinct())
+    generations.bump(
+        'posts', f'author:{instance.pk}', *(f'group:{pk}' for pk in groups))
+
+
+@receiver(pre_delete, sender=User)
+def user_deleting(sender, instance, **kwargs):
+    # Collector удаляет связанные строки только в основной БД, а посты
+    # автора и его комментарии к чужим постам лежат и в шардах.
+    # Удаляются через delete(): сигналы поправят счётчики, ленты
+    # и ссылки на файлы.
+    for queryset in (
+        Comment.objects.filter(author=instance),
+        Post.objects.filter(author=instance),
+    ):
+        for part in shards.spread(queryset):
+            if part.db != DEFAULT_DB_ALIAS:
+                part.delete()
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, created, **kwargs):
+    if created:
+        GroupStats.objects.get_or_create(group=instance)
+        return
+    # Название группы есть на карточках её постов: в общей ленте,
+    # в профилях авторов и на страницах постов (область автора).
+    authors = set()
+    for posts in shards.spread(Post.objects.filter(group=instance)):
+        authors.update(posts.order_by().values_list(
+            'author_id', flat=True).distinct())
+    generations.bump(
+        'posts', f'group:{instance.pk}', *(f'author:{pk}' for pk in authors))
+
+
+@receiver(pre_delete, sender=Group)
+def group_deleting(sender, instance, **kwargs):
+    # Как и Collector в основной БД, группа снимается с постов шардов.
+    for posts in shards.spread(Post.objects.filter(group=instance)):
+        if posts.db != DEFAULT_DB_ALIAS:
+            posts.update(group=None)
+
+
+@receiver(pre_save, sender=Post)
+def post_saving(sender, instance, **kwargs):
+    image = instance.image
+    # Загрузка прибавит ссылку файлу, даже если содержимое то же.
+    instance._image_uploaded = bool(image) and not image._committed
+    if image.name != instance._loaded_image or instance._image_uploaded:
+        imagemeta.fill(instance)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    if created:
+        timeline.push(instance)
+        invalidate_counts(instance)
+    counters.post_saved(instance, created)
+    generations.bump(
+        *generations.scopes_for(instance, instance._loaded_group_id),
+        modified=instance.updated_at)
+    if instance.image and instance.image.name != instance._loaded_image:
+        thumbnails.schedule(instance.image)
+    if instance._loaded_image and (
+        instance._image_uploaded
+        or instance.image.name != instance._loaded_image
+    ):
+        storage.release(instance._loaded_image)
+    instance._loaded_group_id = instance.group_id
+    instance._loaded_image = instance.image.name
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    invalidate_counts(instance)
+    counters.post_deleted(instance)
+    timeline.remove(instance)
+    generations.bump(*generations.scopes_for(instance))
+    storage.release(instance.image.name)
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.comment_changed(instance, 1)
+    comment_touched(instance, modified=instance.updated_at)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    counters.comment_changed(instance, -1)
+    comment_touched(instance)
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.follow_changed(instance, 1)
+        timeline.followers_changed(instance.author_id, 1)
+        timeline.backfill(instance.user_id, instance.author_id)
+        follow_touched(instance)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    counters.follow_changed(instance, -1)
+    timeline.followers_changed(instance.author_id, -1)
+    timeline.prune(instance.user_id, instance.author_id)
+    follow_touched(instance)
+
+
+def comment_touched(comment, modified=None):
+    # Счётчик комментариев автора виден в его профиле.
+    generations.bump(
+        f'post:{comment.post_id}', f'author:{comment.author_id}',
+        modified=modified)
+
+
+def follow_touched(follow):
+    generations.bump(f'author:{follow.author_id}', f'author:{follow.user_id}')
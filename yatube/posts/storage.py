@@ -0,0 +1,143 @@
+"""Хранилище картинок постов с именами по хэшу содержимого.
+
+Файл называется SHA-256 своего содержимого (posts/ab/abcd….jpg),
+поэтому одинаковые загрузки попадают в один файл, а у него — один
+набор миниатюр: имя миниатюры sorl-thumbnail зависит от имени
+исходника. Сколько постов ссылается на файл, хранится в MediaFile:
+save() прибавляет ссылку, release() убирает, и файл с миниатюрами
+удаляется, когда ссылок не осталось.
+"""
+import collections
+import hashlib
+import os
+import posixpath
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.utils.deconstruct import deconstructible
+
+
+def content_hash(content):
+    digest = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+def hashed_name(name, content):
+    """posts/photo.JPG -> posts/ab/ab….jpg"""
+    directory, filename = posixpath.split(name)
+    extension = os.path.splitext(filename)[1].lower()
+    digest = content_hash(content)
+    return posixpath.join(directory, digest[:2], digest + extension)
+
+
+@deconstructible
+class HashedStorage(FileSystemStorage):
+    def save(self, name, content, max_length=None):
+        """Сохраняет файл под именем по хэшу и прибавляет ему ссылку.
+
+        Ссылка прибавляется до проверки файла: удаление последней
+        ссылки (collect) ждёт транзакцию загрузки и не удалит файл,
+        на который она уже сослалась.
+        """
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = hashed_name(name, content)
+        acquire(name, content.size)
+        if not self.exists(name):
+            # Пишется во временный файл и атомарно переименовывается:
+            # одновременная загрузка того же содержимого заменит файл
+            # таким же.
+            partial = super().save(f'{name}.part', content, max_length)
+            os.replace(self.path(partial), self.path(name))
+        else:
+            # Свежее время изменения: сборщик мусора (collect_media)
+            # не тронет файл в льготный период, пока пост сохраняется.
+            os.utime(self.path(name))
+        return name
+
+
+def acquire(name, size=0):
+    """Прибавляет файлу ссылку; запись о файле создаётся при первой."""
+    from .models import MediaFile
+    if MediaFile.objects.filter(name=name).update(refs=F('refs') + 1):
+        return
+    try:
+        with transaction.atomic():
+            MediaFile.objects.create(name=name, size=size, refs=1)
+    except IntegrityError:
+        MediaFile.objects.filter(name=name).update(refs=F('refs') + 1)
+
+
+def release(name):
+    """Убирает ссылку; без ссылок файл удаляется после коммита."""
+    from .models import MediaFile
+    if not name:
+        return
+    if MediaFile.objects.filter(name=name, refs__gt=0).update(
+        refs=F('refs') - 1
+    ):
+        transaction.on_commit(lambda: collect(name))
+
+
+def collect(name):
+    """Удаляет файл и его миниатюры, если на него никто не ссылается.
+
+    Файл удаляется внутри транзакции, удалившей запись: загрузка того
+    же содержимого ждёт её и записывает файл заново.
+    """
+    from sorl.thumbnail.images import ImageFile
+
+    from .models import MediaFile
+    from .thumbnails import backend, forget
+    with transaction.atomic():
+        deleted, _ = MediaFile.objects.filter(name=name, refs=0).delete()
+        if deleted:
+            image = ImageFile(name, media_storage)
+            backend.delete(image)
+            forget(image)
+    return bool(deleted)
+
+
+def recount():
+    """Пересчитывает ссылки по постам; возвращает число файлов.
+
+    Нужен после массовых изменений в обход save() и release():
+    seed, dedupe_media.
+    """
+    from . import shards
+    from .models import MediaFile, Post
+    rows = Post.objects.exclude(image='').values_list('image').annotate(
+        refs=Count('pk')
+    ).order_by()
+    refs = collections.Counter()
+    for part in shards.spread(rows):
+        refs.update(dict(part))
+    with transaction.atomic():
+        MediaFile.objects.update(refs=0)
+        existing = set(MediaFile.objects.values_list('name', flat=True))
+        for name in existing & set(refs):
+            MediaFile.objects.filter(name=name).update(refs=refs[name])
+        MediaFile.objects.bulk_create([
+            MediaFile(name=name, refs=count, size=size_of(name))
+            for name, count in refs.items() if name not in existing
+        ])
+    return len(refs)
+
+
+def size_of(name):
+    try:
+        return media_storage.size(name)
+    except (OSError, SuspiciousFileOperation):
+        return 0
+
+
+media_storage = HashedStorage()
@@ -0,0 +1,100 @@
+import datetime
+
+from django import template
+from django.db.models import Max, Min
+from django.utils import formats
+from django.utils.text import capfirst
+from django.utils.translation import gettext as _
+
+from posts.models import DayStats
+
+register = template.Library()
+
+
+@register.inclusion_tag('admin/date_hierarchy.html')
+def post_date_hierarchy(cl):
+    """Иерархия дат списка постов по счётчикам DayStats.
+
+    То же, что тег date_hierarchy админки, но годы, месяцы и дни
+    берутся из таблицы дней, а не SELECT DISTINCT по всем постам.
+    Ссылки строятся по всем постам, без учёта фильтров списка.
+    """
+    field_name = cl.date_hierarchy
+    year_field = f'{field_name}__year'
+    month_field = f'{field_name}__month'
+    day_field = f'{field_name}__day'
+    year = cl.params.get(year_field)
+    month = cl.params.get(month_field)
+    day = cl.params.get(day_field)
+    days = DayStats.objects.filter(posts_count__gt=0)
+
+    def link(filters):
+        return cl.get_query_string(filters, [f'{field_name}__'])
+
+    if not (year or month or day):
+        bounds = days.aggregate(first=Min('day'), last=Max('day'))
+        first, last = bounds['first'], bounds['last']
+        if first and last and first.year == last.year:
+            year = first.year
+            if first.month == last.month:
+                month = first.month
+
+    if year and month and day:
+        date = datetime.date(int(year), int(month), int(day))
+        return {
+            'show': True,
+            'back': {
+                'link': link({year_field: year, month_field: month}),
+                'title': capfirst(formats.date_format(
+                    date, 'YEAR_MONTH_FORMAT')),
+            },
+            'choices': [{'title': capfirst(formats.date_format(
+                date, 'MONTH_DAY_FORMAT'))}],
+        }
+    if year and month:
+        dates = days.filter(day__year=year, day__month=month).dates(
+            'day', 'day')
+        return {
+            'show': True,
+            'back': {'link': link({year_field: year}), 'title': str(year)},
+            'choices': [{
+                'link': link({
+                    year_field: year, month_field: month, day_field: date.day,
+                }),
+                'title': capfirst(formats.date_format(
+                    date, 'MONTH_DAY_FORMAT')),
+            } for date in dates],
+        }
+    if year:
+        dates = days.filter(day__year=year).dates('day', 'month')
+        return {
+            'show': True,
+            'back': {'link': link({}), 'title': _('All dates')},
+            'choices': [{
+                'link': link({year_field: year, month_field: date.month}),
+                'title': capfirst(formats.date_format(
+                    date, 'YEAR_MONTH_FORMAT')),
+            } for date in dates],
+        }
+    return {
+        'show': True,
+        'back': None,
+        'choices': [{
+            'link': link({year_field: str(date.year)}),
+            'title': str(date.year),
+        } for date in days.dates('day', 'year')],
+    }
+
+
+@register.inclusion_tag('admin/posts/post/keyset_pagination.html')
+def keyset_pagination(cl):
+    """Ссылки «Первая / Назад / Вперёд» для страниц по курсору."""
+    page = cl.keyset_page
+    return {
+        'cl': cl,
+        'page': page,
+        'first_url': cl.get_query_string(),
+        'previous_url': cl.get_query_string(
+            {'before': page.previous_cursor}),
+        'next_url': cl.get_query_string({'after': page.next_cursor}),
+    }
@@ -0,0 +1,69 @@
+from django import template
+from django.conf import settings
+from django.templatetags.static import static
+
+from posts import thumbnails
+
+register = template.Library()
+
+PLACEHOLDER = 'img/thumbnail-placeholder.svg'
+MIME_TYPES = {
+    'JPEG': 'image/jpeg',
+    'PNG': 'image/png',
+    'WEBP': 'image/webp',
+}
+# Карточка поста занимает всю ширину экрана, но не больше 960px.
+SIZES = '(max-width: 960px) 100vw, 960px'
+
+
+def srcset(files):
+    return ', '.join(
+        f'{files[width].url} {width}w' for width in sorted(files)
+    )
+
+
+@register.inclusion_tag('posts/includes/picture.html')
+def post_picture(image):
+    """<picture> с вариантами миниатюры; пока их нет — размытое превью.
+
+    Всё берётся из полей поста и хранилища ключей: файлы картинок
+    не открываются, недостающие миниатюры не создаются.
+    """
+    post = image.instance
+    width = max(settings.THUMBNAIL_WIDTHS)
+    context = {
+        'width': width,
+        'height': round(width * thumbnails.ASPECT),
+        'color': post.image_color,
+        'lqip': post.image_lqip,
+        'src': post.image_lqip or static(PLACEHOLDER),
+    }
+    ready = thumbnails.ready(image)
+    by_format = {}
+    for (format_, variant_width), thumbnail in ready.items():
+        by_format.setdefault(format_, {})[variant_width] = thumbnail
+    formats = [
+        format_ for format_ in settings.THUMBNAIL_FORMATS
+        if format_ in by_format
+    ]
+    if not formats or formats[-1] != settings.THUMBNAIL_FORMATS[-1]:
+        return context
+    *sources, fallback = formats
+    files = by_format[fallback]
+    context.update({
+        'sources': [
+            {'type': MIME_TYPES[format_], 'srcset': srcset(by_format[format_])}
+            for format_ in sources
+        ],
+        'src': files[max(files)].url,
+        'srcset': srcset(files),
+        'sizes': SIZES,
+    })
+    return context
+
+
+@register.simple_tag
+def prefetch_thumbnails(posts):
+    """Берёт миниатюры всех постов страницы одним обращением."""
+    thumbnails.prefetch(posts)
+    return ''
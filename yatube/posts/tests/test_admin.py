@@ -0,0 +1,131 @@
+import datetime
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from posts import counters
+from posts.models import Group, Post
+
+User = get_user_model()
+CHANGELIST = reverse('admin:posts_post_changelist')
+
+
+class PostAdminTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password')
+        cls.groups = [
+            Group.objects.create(
+                title=f'Группа {number}', slug=f'group-{number}',
+                description='Описание')
+            for number in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(PostAdminTest.admin)
+
+    def create_posts(self, count):
+        authors = [
+            User.objects.create_user(username=f'author-{number}')
+            for number in range(User.objects.count(), User.objects.count() + 3)
+        ]
+        Post.objects.bulk_create([
+            Post(
+                author=authors[number % len(authors)],
+                group=self.groups[number % len(self.groups)],
+                text=f'Пост {number}',
+            )
+            for number in range(count)
+        ])
+
+    def changelist(self, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(CHANGELIST, params or {})
+        self.assertEqual(response.status_code, 200)
+        return response, [query['sql'] for query in queries]
+
+    def test_query_count_does_not_grow_with_rows(self):
+        """Число запросов списка не зависит от числа строк"""
+        self.create_posts(5)
+        response, few = self.changelist()
+        post = Post.objects.first()
+        self.assertContains(
+            response, f'<option value="{post.group_id}" selected>')
+        self.create_posts(60)
+        cache.clear()
+        _, many = self.changelist()
+        self.assertEqual(len(few), len(many))
+
+    def test_default_order_is_paged_by_cursor(self):
+        """Страницы в порядке по умолчанию листаются без OFFSET"""
+        self.create_posts(105)
+        response, queries = self.changelist()
+        first = response.context['cl']
+        self.assertTrue(first.keyset_page.has_next())
+        self.assertEqual(len(first.result_list), 100)
+        self.assertContains(
+            response, f'after={first.keyset_page.next_cursor}')
+        response, queries = self.changelist(
+            {'after': first.keyset_page.next_cursor})
+        second = response.context['cl']
+        self.assertFalse(second.keyset_page.has_next())
+        self.assertEqual(len(second.result_list), 5)
+        self.assertEqual(
+            {post.pk for post in [*first.result_list, *second.result_list]},
+            set(Post.objects.values_list('pk', flat=True)),
+        )
+        self.assertFalse(any('OFFSET' in sql for sql in queries))
+        self.assertNotIn('after=', second.get_query_string())
+
+    def test_other_order_is_paged_by_number(self):
+        """Сортировка по колонке листается номерами страниц"""
+        self.create_posts(3)
+        response, _ = self.changelist({'o': '2'})
+        cl = response.context['cl']
+        self.assertIsNone(cl.keyset_page)
+        self.assertEqual(len(cl.result_list), 3)
+
+    def test_date_hierarchy_reads_day_stats(self):
+        """Иерархия дат строится по счётчикам дней, а не по постам"""
+        self.create_posts(2)
+        first, second = Post.objects.order_by('pk')
+        Post.objects.filter(pk=first.pk).update(pub_date=timezone.make_aware(
+            datetime.datetime(2021, 3, 5, 12)))
+        counters.recount_days()
+        response, queries = self.changelist()
+        self.assertContains(response, '?pub_date__year=2021')
+        self.assertContains(
+            response, f'?pub_date__year={second.pub_date.year}')
+        self.assertFalse(any(
+            'DISTINCT' in sql and 'posts_post' in sql for sql in queries))
+        response, _ = self.changelist({
+            'pub_date__year': '2021', 'pub_date__month': '3'})
+        self.assertContains(response, 'pub_date__day=5')
+        self.assertEqual(
+            [post.pk for post in response.context['cl'].result_list],
+            [first.pk],
+        )
+
+    def test_group_is_editable_from_list(self):
+        """Группа поста меняется прямо в списке"""
+        self.create_posts(1)
+        post = Post.objects.get()
+        response = self.client.post(CHANGELIST, {
+            'form-TOTAL_FORMS': 1,
+            'form-INITIAL_FORMS': 1,
+            'form-0-id': post.pk,
+            'form-0-group': self.groups[2].pk,
+            '_save': 'Сохранить',
+        })
+        self.assertRedirects(response, CHANGELIST)
+        post.refresh_from_db()
+        self.assertEqual(post.group, self.groups[2])
@@ -0,0 +1,68 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from posts.models import Comment, Group, Post
+
+User = get_user_model()
+
+VIEWS = {
+    'index', 'group_posts', 'profile', 'post_detail', 'follow_index',
+    'post_create', 'add_comment',
+}
+
+
+class BenchCommandTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+        Post.objects.create(author=cls.author, group=cls.group, text='Пост')
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.output = os.path.join(self.tmp, 'bench.json')
+        self.baseline = os.path.join(self.tmp, 'baseline.json')
+
+    def tearDown(self):
+        for name in os.listdir(self.tmp):
+            os.remove(os.path.join(self.tmp, name))
+        os.rmdir(self.tmp)
+
+    def bench(self, **options):
+        stdout = StringIO()
+        call_command(
+            'bench', iterations=3, warmup=0, stdout=stdout, **options)
+        return stdout.getvalue()
+
+    def test_bench_writes_results_and_rolls_back_writes(self):
+        self.bench(output=self.output)
+        with open(self.output) as file:
+            results = json.load(file)
+        self.assertEqual(set(results), VIEWS)
+        for result in results.values():
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+            self.assertGreater(result['queries'], 0)
+        self.assertGreater(results['index']['bytes'], 0)
+        self.assertEqual(Post.objects.count(), 1)
+        self.assertFalse(Comment.objects.exists())
+
+    def test_bench_reports_regressions_against_baseline(self):
+        self.bench(baseline=self.baseline, save_baseline=True)
+        with open(self.baseline) as file:
+            baseline = json.load(file)
+        baseline['index']['queries'] = 0
+        with open(self.baseline, 'w') as file:
+            json.dump(baseline, file)
+        output = self.bench(baseline=self.baseline, tolerance=100)
+        self.assertIn('Регрессия index: запросов 0 ->', output)
+        with self.assertRaises(CommandError):
+            self.bench(baseline=self.baseline, tolerance=100, fail=True)
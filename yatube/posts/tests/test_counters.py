@@ -0,0 +1,91 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+
+from posts.models import (Comment, DayStats, Follow, Group, GroupStats,
+                          Post, PostStats, UserStats)
+
+User = get_user_model()
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.other_group = Group.objects.create(
+            title='Другая группа',
+            slug='other-slug',
+            description='Другое описание',
+        )
+
+    def test_counters_follow_creates_and_deletes(self):
+        """Счётчики следуют за созданием и удалением объектов"""
+        post = Post.objects.create(
+            author=self.author, text='Пост', group=self.group)
+        comment = Comment.objects.create(
+            post=post, author=self.reader, text='Комментарий')
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        author_stats = UserStats.objects.get(user=self.author)
+        reader_stats = UserStats.objects.get(user=self.reader)
+        self.assertEqual(author_stats.posts_count, 1)
+        self.assertEqual(author_stats.followers_count, 1)
+        self.assertEqual(reader_stats.comments_count, 1)
+        self.assertEqual(reader_stats.following_count, 1)
+        self.assertEqual(GroupStats.objects.get(group=self.group)
+                         .posts_count, 1)
+        self.assertEqual(PostStats.objects.get(post=post).comments_count, 1)
+
+        comment.delete()
+        follow.delete()
+        post.delete()
+        author_stats.refresh_from_db()
+        reader_stats.refresh_from_db()
+        self.assertEqual(author_stats.posts_count, 0)
+        self.assertEqual(author_stats.followers_count, 0)
+        self.assertEqual(reader_stats.comments_count, 0)
+        self.assertEqual(reader_stats.following_count, 0)
+        self.assertEqual(GroupStats.objects.get(group=self.group)
+                         .posts_count, 0)
+
+    def test_group_change_moves_post_count(self):
+        """Смена группы поста переносит его в счётчик новой группы"""
+        Post.objects.create(author=self.author, text='Пост', group=self.group)
+        post = Post.objects.get(author=self.author)
+        post.group = self.other_group
+        post.save()
+        self.assertEqual(GroupStats.objects.get(group=self.group)
+                         .posts_count, 0)
+        self.assertEqual(GroupStats.objects.get(group=self.other_group)
+                         .posts_count, 1)
+
+    def test_day_counter_follows_posts(self):
+        """Число постов за день следует за созданием и удалением"""
+        first = Post.objects.create(author=self.author, text='Первый')
+        Post.objects.create(author=self.author, text='Второй')
+        day = DayStats.objects.get()
+        self.assertEqual(day.posts_count, 2)
+        first.delete()
+        day.refresh_from_db()
+        self.assertEqual(day.posts_count, 1)
+
+    def test_recount_repairs_drift(self):
+        """Команда recount чинит счётчики после bulk_create"""
+        Post.objects.bulk_create(
+            [Post(author=self.author, text=f'Пост {i}', group=self.group)
+             for i in range(3)])
+        call_command('recount', '--batch-size', '1', stdout=StringIO())
+        self.assertEqual(UserStats.objects.get(user=self.author)
+                         .posts_count, 3)
+        self.assertEqual(GroupStats.objects.get(group=self.group)
+                         .posts_count, 3)
+        self.assertEqual(PostStats.objects.count(), 3)
+        self.assertEqual(DayStats.objects.get().posts_count, 3)
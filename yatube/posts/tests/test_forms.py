@@ -1,3 +1,4 @@
+import hashlib
 import tempfile
 import shutil
 
@@ -71,6 +72,8 @@ class PostFormsTests(TestCase):
             follow=True
         )
 
+        # Картинка хранится под именем по хэшу содержимого.
+        digest = hashlib.sha256(small_gif).hexdigest()
         if response.status_code == HTTPStatus.OK:
             self.assertRedirects(response, reverse(
                 'posts:profile', kwargs={'username': PostFormsTests.user}))
@@ -79,7 +82,7 @@ class PostFormsTests(TestCase):
                 Post.objects.filter(
                     text='Тестовый текст',
                     author=PostFormsTests.user,
-                    image='posts/small.gif'
+                    image=f'posts/{digest[:2]}/{digest}.gif'
                 ).exists())
 
     def test_post_edit(self):
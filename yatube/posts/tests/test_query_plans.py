@@ -0,0 +1,165 @@
+import re
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+# Проход таблицы или индекса целиком: «SCAN posts_post» или
+# «SCAN posts_post USING INDEX ...» без условий на индекс.
+SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS (\w+))?(.*)$')
+ALIAS = re.compile(r'"(\w+)" ([A-Z]\d+)\b')
+TEMP_SORT = 'USE TEMP B-TREE'
+
+
+class ExplainRecorder:
+    """execute_wrapper: копит SELECT вместе с параметрами."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql.lstrip().upper().startswith('SELECT'):
+            self.queries.append((sql, params))
+        return execute(sql, params, many, context)
+
+
+class QueryPlanTest(TestCase):
+    """Запросы страниц идут по индексам.
+
+    Каждая страница открывается на засеянной БД, и для каждого её SELECT
+    выполняется EXPLAIN QUERY PLAN. Тест падает, если таблица читается
+    целиком, отбор по равенству идёт обходом индекса вместо поиска
+    или строки сортируются во временном B-дереве.
+    """
+    # Запросы, в которых сортировка неизбежна; сортируется не таблица,
+    # а небольшая выборка: совпадения поиска по релевантности bm25,
+    # которой нет в индексах.
+    ALLOWED = [
+        'posts_post_fts MATCH',
+    ]
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        call_command(
+            'seed', users=40, groups=4, posts=600, comments=600,
+            follows=150, seed=3, batch_size=200, stdout=StringIO(),
+        )
+        with connection.cursor() as cursor:
+            # Статистика для планировщика, как на живой БД.
+            cursor.execute('ANALYZE')
+        cls.tables = set(connection.introspection.table_names())
+        cls.post = Post.objects.filter(
+            pk__in=Comment.objects.values('post_id')).first()
+        cls.group = Group.objects.first()
+        follow = Follow.objects.first()
+        cls.reader = follow.user
+        cls.author = follow.author
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(QueryPlanTest.reader)
+
+    def get(self, client, url, params=None):
+        recorder = ExplainRecorder()
+        with connection.execute_wrapper(recorder):
+            response = client.get(url, params or {})
+        self.assertIn(response.status_code, (200, 302), url)
+        return response, recorder.queries
+
+    def problems(self, sql, params):
+        if any(allowed in sql for allowed in self.ALLOWED):
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            details = [row[-1] for row in cursor.fetchall()]
+        aliases = {alias: table for table, alias in ALIAS.findall(sql)}
+        found = []
+        for detail in details:
+            if TEMP_SORT in detail:
+                found.append(detail)
+                continue
+            scan = SCAN.match(detail)
+            if scan is None:
+                continue
+            name = scan.group(2) or scan.group(1)
+            if aliases.get(name, name) not in self.tables:
+                continue
+            # Обход индекса по порядку без фильтра — начало ленты под
+            # LIMIT; с условием на равенство нужен поиск по индексу.
+            if 'INDEX' not in scan.group(3) or self.filtered(sql, name):
+                found.append(detail)
+        return found
+
+    @staticmethod
+    def filtered(sql, name):
+        return re.search(
+            rf'(?:"{name}"|\b{name})\."\w+" (?:= %s|IN \()', sql
+        ) is not None
+
+    def assertIndexedPlans(self, client, url, params=None):
+        response, queries = self.get(client, url, params)
+        for sql, query_params in queries:
+            with self.subTest(url=url, params=params, sql=sql):
+                self.assertEqual(self.problems(sql, query_params), [])
+        return response
+
+    def urls(self):
+        post = {'post_id': self.post.pk}
+        return [
+            reverse('posts:index'),
+            reverse('posts:group_posts', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': self.author.username}),
+            reverse('posts:post_detail', kwargs=post),
+            reverse('posts:post_comments', kwargs=post),
+        ]
+
+    @staticmethod
+    def page(response):
+        page = response.context.get('page_obj')
+        return response.context['comments'] if page is None else page
+
+    def test_pages_use_indexes(self):
+        for url in self.urls():
+            for client in (self.client, self.authorized_client):
+                page = self.page(self.assertIndexedPlans(client, url))
+                if page.has_next() and not getattr(page, 'is_keyset', False):
+                    self.assertIndexedPlans(client, url, {'page': 2})
+
+    def test_cursor_pages_use_indexes(self):
+        for url in self.urls():
+            page = self.page(self.get(self.client, url, {'after': ''})[0])
+            if not page.has_next():
+                continue
+            page = self.page(self.assertIndexedPlans(
+                self.client, url, {'after': page.next_cursor}))
+            self.assertIndexedPlans(
+                self.client, url, {'before': page.previous_cursor})
+
+    def test_follow_pages_use_indexes(self):
+        self.assertIndexedPlans(
+            self.authorized_client, reverse('posts:follow_index'))
+        username = {'username': self.author.username}
+        self.assertIndexedPlans(
+            self.authorized_client,
+            reverse('posts:profile_unfollow', kwargs=username))
+        self.assertIndexedPlans(
+            self.authorized_client,
+            reverse('posts:profile_follow', kwargs=username))
+
+    def test_search_uses_index(self):
+        word = Post.objects.first().text.split()[0]
+        self.assertIndexedPlans(
+            self.client, reverse('posts:post_search'), {'q': word})
+        self.assertIndexedPlans(
+            self.client, reverse('posts:post_search'),
+            {'q': word, 'group': self.group.slug})
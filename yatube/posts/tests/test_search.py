@@ -0,0 +1,100 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts import search
+from posts.models import Group, Post
+
+User = get_user_model()
+
+
+class SearchTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.other = User.objects.create_user(username='other')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+        cls.exact = Post.objects.create(
+            author=cls.author, group=cls.group,
+            text='Ёжик в тумане. Ёжик искал лошадку.')
+        cls.weak = Post.objects.create(
+            author=cls.other,
+            text='Длинный рассказ про лес, туман, реку и ежевику; '
+                 'ёжиков там не было, зато был туман.')
+        cls.unrelated = Post.objects.create(
+            author=cls.other, text='Совсем о другом')
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def found(self, **params):
+        response = self.client.get(reverse('posts:post_search'), params)
+        return [post.pk for post in response.context['page_obj']]
+
+    def test_prefix_search_is_ranked(self):
+        self.assertEqual(
+            self.found(q='ЁЖИК'), [self.exact.pk, self.weak.pk])
+        self.assertEqual(self.found(q='лошадк'), [self.exact.pk])
+        self.assertEqual(self.found(q='туман ёжик ежевик'), [self.weak.pk])
+        self.assertEqual(self.found(q=''), [])
+
+    def test_filters_by_group_and_author(self):
+        self.assertEqual(self.found(q='туман', group='group'), [self.exact.pk])
+        self.assertEqual(self.found(q='туман', author='other'), [self.weak.pk])
+        self.assertEqual(self.found(q='туман', group='missing'), [])
+
+    def test_fts_syntax_is_not_exposed(self):
+        for query in ('"', 'туман OR', 'NEAR(туман', '*', 'a:b'):
+            response = self.client.get(
+                reverse('posts:post_search'), {'q': query})
+            self.assertEqual(response.status_code, 200)
+
+    def test_index_follows_edits_and_deletes(self):
+        post = Post.objects.create(author=self.author, text='Слон')
+        self.assertEqual(self.found(q='слон'), [post.pk])
+        post.text = 'Жираф'
+        post.save()
+        self.assertEqual(self.found(q='слон'), [])
+        self.assertEqual(self.found(q='жираф'), [post.pk])
+        post.delete()
+        self.assertEqual(self.found(q='жираф'), [])
+
+    def test_results_are_paginated_by_cursor(self):
+        posts = Post.objects.bulk_create([
+            Post(author=self.author, text=f'Кот номер {number}')
+            for number in range(15)
+        ])
+        response = self.client.get(
+            reverse('posts:post_search'), {'q': 'кот'})
+        first = response.context['page_obj']
+        self.assertTrue(first.has_next())
+        self.assertFalse(first.has_previous())
+        second = self.client.get(reverse('posts:post_search'), {
+            'q': 'кот', 'after': first.next_cursor,
+        }).context['page_obj']
+        self.assertFalse(second.has_next())
+        self.assertEqual(
+            len({post.pk for post in [*first, *second]}), len(posts))
+        self.assertContains(
+            response, f'?q=%D0%BA%D0%BE%D1%82&after={first.next_cursor}')
+
+    def test_admin_search_uses_index(self):
+        admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password')
+        self.client.force_login(admin)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse('admin:posts_post_changelist'), {'q': 'ёжик'})
+        self.assertEqual(
+            {post.pk for post in response.context['cl'].result_list},
+            {self.exact.pk, self.weak.pk},
+        )
+        sql = ' '.join(query['sql'] for query in queries.captured_queries)
+        self.assertIn(search.TABLE, sql)
+        self.assertNotIn('LIKE', sql)
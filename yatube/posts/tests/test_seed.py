@@ -0,0 +1,62 @@
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db.models import Count, F, Sum
+from django.test import TestCase, override_settings
+
+from posts.models import (Comment, Follow, Group, MediaFile, Post,
+                          UserStats)
+
+User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class SeedCommandTest(TestCase):
+    options = {
+        'users': 30, 'groups': 3, 'posts': 200, 'comments': 100,
+        'follows': 60, 'seed': 7, 'batch_size': 50, 'stdout': StringIO(),
+    }
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def snapshot(self):
+        return list(Post.objects.order_by('pk').values_list(
+            'pk', 'text', 'author_id', 'group_id'))
+
+    def test_seed_creates_data_and_derived_rows(self):
+        call_command('seed', **self.options)
+        self.assertEqual(User.objects.count(), 30)
+        self.assertEqual(Group.objects.count(), 3)
+        self.assertEqual(Post.objects.count(), 200)
+        self.assertEqual(Comment.objects.count(), 100)
+        self.assertTrue(Follow.objects.exists())
+        self.assertFalse(
+            Follow.objects.filter(user_id=F('author_id')).exists())
+        self.assertEqual(
+            UserStats.objects.aggregate(total=Sum('posts_count'))['total'],
+            200)
+
+    def test_seed_images_are_counted_without_derived(self):
+        call_command(
+            'seed', **self.options, images=0.5, skip_derived=True)
+        refs = dict(Post.objects.exclude(image='').values_list(
+            'image').annotate(refs=Count('pk')).order_by())
+        self.assertGreater(sum(refs.values()), len(refs))
+        self.assertEqual(
+            dict(MediaFile.objects.values_list('name', 'refs')), refs)
+
+    def test_seed_is_deterministic(self):
+        call_command('seed', **self.options)
+        first = self.snapshot()
+        for model in (Follow, Comment, Post, Group, User):
+            model.objects.all().delete()
+        call_command('seed', **self.options)
+        self.assertEqual(self.snapshot(), first)
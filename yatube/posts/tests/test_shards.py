@@ -0,0 +1,262 @@
+import hashlib
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import IntegrityError, connections
+from django.test import Client, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from posts import search, shards, thumbnails, timeline
+from posts.models import (AuthorShard, Comment, Follow, Group, Post,
+                          PostStats, TimelineEntry)
+
+User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+DIGEST = hashlib.sha256(SMALL_GIF).hexdigest()
+HASHED_NAME = f'posts/{DIGEST[:2]}/{DIGEST}.gif'
+
+
+@override_settings(
+    POST_SHARDS=['default', 'shard_1'], QUERY_BUDGET_ACTION=None,
+    MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ShardsTest(TransactionTestCase):
+    # Шард — отдельное соединение, которое присоединяет основную БД:
+    # данные должны быть закоммичены, поэтому не TestCase.
+    databases = {'default', 'shard_1'}
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+        self.local = User.objects.create_user(username='local')
+        self.remote = User.objects.create_user(username='remote')
+        self.reader = User.objects.create_user(username='reader')
+        shards.assign(self.local.pk, 'default')
+        shards.assign(self.remote.pk, 'shard_1')
+        self.posts = [
+            Post.objects.create(
+                author=author, group=self.group, text=f'Пост номер {number}')
+            for number, author in enumerate(
+                [self.local, self.remote, self.local, self.remote])
+        ]
+        self.comment = Comment.objects.create(
+            post=self.posts[1], author=self.reader, text='Комментарий')
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.reader)
+
+    def test_shard_holds_only_posts_and_comments(self):
+        tables = set(connections['shard_1'].introspection.table_names())
+        self.assertIn('posts_post', tables)
+        self.assertIn('posts_comment', tables)
+        self.assertNotIn('auth_user', tables)
+        self.assertNotIn('posts_poststats', tables)
+
+    def test_shard_enforces_comment_post_key(self):
+        """Комментарий к посту, которого нет в шарде, не сохраняется"""
+        with self.assertRaises(IntegrityError):
+            Comment.objects.using('shard_1').create(
+                post_id=self.posts[0].pk, author=self.reader, text='Сирота')
+
+    def test_posts_and_comments_are_written_to_author_shard(self):
+        remote_post = self.posts[1]
+        self.assertEqual(remote_post._state.db, 'shard_1')
+        self.assertGreaterEqual(remote_post.pk, shards.ID_SPAN)
+        self.assertLess(self.posts[0].pk, shards.ID_SPAN)
+        self.assertFalse(Post.objects.using('default').filter(
+            author=self.remote).exists())
+        self.assertTrue(Comment.objects.using('shard_1').filter(
+            pk=self.comment.pk).exists())
+        self.assertEqual(
+            PostStats.objects.get(pk=remote_post.pk).comments_count, 1)
+        self.assertEqual(shards.author_of(remote_post.pk), self.remote.pk)
+
+    def test_new_author_is_placed_by_id(self):
+        author = User.objects.create_user(username='new')
+        post = Post.objects.create(author=author, text='Первый пост')
+        expected = ['default', 'shard_1'][author.pk % 2]
+        self.assertEqual(post._state.db, expected)
+        self.assertEqual(
+            AuthorShard.objects.get(author=author).shard, expected)
+
+    def test_deleting_post_cleans_up_main_database(self):
+        remote_post = self.posts[1]
+        Follow.objects.create(user=self.reader, author=self.remote)
+        self.assertTrue(
+            TimelineEntry.objects.filter(post_id=remote_post.pk).exists())
+        remote_post.delete()
+        self.assertFalse(Comment.objects.using('shard_1').filter(
+            post_id=remote_post.pk).exists())
+        self.assertFalse(PostStats.objects.filter(pk=remote_post.pk).exists())
+        self.assertFalse(
+            TimelineEntry.objects.filter(post_id=remote_post.pk).exists())
+
+    def test_deleting_user_cleans_up_shards(self):
+        remote_posts = [self.posts[1].pk, self.posts[3].pk]
+        Comment.objects.create(
+            post=self.posts[0], author=self.remote, text='Чужой пост')
+        self.reader.delete()
+        self.assertFalse(Comment.objects.using('shard_1').exists())
+        self.assertEqual(
+            PostStats.objects.get(pk=self.posts[1].pk).comments_count, 0)
+        self.group.delete()
+        self.assertFalse(Post.objects.using('shard_1').filter(
+            group__isnull=False).exists())
+        self.remote.delete()
+        self.assertFalse(Post.objects.using('shard_1').exists())
+        self.assertFalse(Comment.objects.using('default').exists())
+        self.assertFalse(
+            PostStats.objects.filter(pk__in=remote_posts).exists())
+
+    def test_global_feeds_merge_shards_in_order(self):
+        expected = self.posts[::-1]
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_posts', kwargs={'slug': self.group.slug}),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(
+                    list(response.context['page_obj']), expected)
+                self.assertEqual(
+                    response.context['page_obj'].paginator.count, 4)
+                cache.clear()
+        response = self.client.get(reverse('posts:index'), {'after': ''})
+        self.assertEqual(list(response.context['page_obj']), expected)
+
+    @override_settings(PER_PAGE=3)
+    def test_merged_pages_do_not_skip_posts(self):
+        posts = shards.merged(Post.objects.all())
+        self.assertEqual(posts[1:3], self.posts[::-1][1:3])
+        self.assertEqual(posts.count(), 4)
+
+    def test_follow_index_merges_shards(self):
+        Follow.objects.create(user=self.reader, author=self.local)
+        Follow.objects.create(user=self.reader, author=self.remote)
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            list(response.context['page_obj']), self.posts[::-1])
+        Follow.objects.filter(author=self.remote).delete()
+        self.assertEqual(
+            list(timeline.feed(self.reader)[:10]), self.posts[2::-2])
+
+    def test_profile_and_post_pages_read_one_shard(self):
+        response = self.client.get(
+            reverse('posts:profile', kwargs={'username': 'remote'}))
+        self.assertEqual(
+            list(response.context['page_obj']), self.posts[3::-2])
+        response = self.client.get(reverse(
+            'posts:post_detail', kwargs={'post_id': self.posts[1].pk}))
+        self.assertEqual(response.context['post'], self.posts[1])
+        self.assertEqual(list(response.context['comments']), [self.comment])
+
+    def test_comment_form_writes_to_post_shard(self):
+        post = self.posts[3]
+        self.authorized_client.post(
+            reverse('posts:add_comment', kwargs={'post_id': post.pk}),
+            data={'text': 'Новый комментарий'})
+        self.assertTrue(Comment.objects.using('shard_1').filter(
+            post_id=post.pk, text='Новый комментарий').exists())
+
+    def test_search_merges_shards(self):
+        page = search.search_page('пост', 10)
+        self.assertEqual(set(page), set(self.posts))
+        page = search.search_page('пост', 10, author_id=self.remote.pk)
+        self.assertEqual(set(page), {self.posts[1], self.posts[3]})
+
+    @override_settings(SHARD_MOVE_WAIT=0)
+    def test_frozen_author_cannot_write(self):
+        shards.assign(self.remote.pk, 'shard_1', frozen=True)
+        with self.assertRaises(shards.AuthorMoving):
+            Post.objects.create(author=self.remote, text='Во время переноса')
+
+    def test_rebalance_moves_author_with_comments(self):
+        local_posts = {self.posts[0].pk, self.posts[2].pk}
+        comment = Comment.objects.create(
+            post=self.posts[0], author=self.reader, text='Под постом')
+        call_command(
+            'rebalance', 'local', to='shard_1', grace=0, stdout=StringIO())
+        self.assertFalse(Post.objects.using('default').exists())
+        self.assertFalse(Comment.objects.using('default').exists())
+        self.assertEqual(
+            set(Post.objects.using('shard_1').filter(
+                author=self.local).values_list('pk', flat=True)),
+            local_posts)
+        self.assertTrue(
+            Comment.objects.using('shard_1').filter(pk=comment.pk).exists())
+        self.assertEqual(shards.for_author(self.local.pk), 'shard_1')
+        self.assertFalse(AuthorShard.objects.get(author=self.local).frozen)
+        response = self.client.get(reverse(
+            'posts:post_detail', kwargs={'post_id': self.posts[0].pk}))
+        self.assertEqual(list(response.context['comments']), [comment])
+        page = search.search_page('номер 0', 10)
+        self.assertEqual(list(page), [self.posts[0]])
+        # Новые посты шарда не занимают id перенесённых.
+        post = Post.objects.create(author=self.remote, text='После переноса')
+        self.assertGreater(post.pk, self.posts[3].pk)
+        self.assertNotIn(post.pk, local_posts)
+
+    def test_admin_lists_and_edits_posts_of_all_shards(self):
+        admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password')
+        self.client.force_login(admin)
+        changelist = reverse('admin:posts_post_changelist')
+        response = self.client.get(changelist, {'o': '2'})
+        self.assertEqual(
+            list(response.context['cl'].result_list), self.posts[::-1])
+        remote_post = self.posts[1]
+        response = self.client.post(changelist, {
+            'form-TOTAL_FORMS': 1,
+            'form-INITIAL_FORMS': 1,
+            'form-0-id': remote_post.pk,
+            'form-0-group': '',
+            '_save': 'Сохранить',
+        })
+        self.assertRedirects(response, changelist)
+        remote_post.refresh_from_db()
+        self.assertIsNone(remote_post.group)
+        response = self.client.get(
+            reverse('admin:posts_post_change', args=[remote_post.pk]))
+        self.assertEqual(response.context['original'], remote_post)
+
+    def test_media_commands_cover_all_shards(self):
+        names = [
+            default_storage.save(name, ContentFile(SMALL_GIF))
+            for name in ('posts/a.gif', 'posts/b.gif')
+        ]
+        posts = [
+            Post.objects.create(author=author, text='С картинкой', image=name)
+            for author, name in zip(
+                [self.local, self.remote, self.remote], names + names[:1])
+        ]
+        call_command('dedupe_media', stdout=StringIO())
+        for post in posts:
+            post.refresh_from_db()
+            self.assertEqual(post.image.name, HASHED_NAME)
+        for name in names:
+            self.assertFalse(default_storage.exists(name))
+        stdout = StringIO()
+        call_command('pregenerate_thumbnails', workers=1, stdout=stdout)
+        self.assertIn('создано 1, уже было 2', stdout.getvalue())
+        self.assertEqual(
+            set(thumbnails.ready(posts[1].image)), set(thumbnails.variants()))
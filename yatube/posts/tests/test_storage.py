@@ -0,0 +1,180 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from posts import storage, thumbnails
+from posts.models import MediaFile, Post
+
+User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+DIGEST = hashlib.sha256(SMALL_GIF).hexdigest()
+HASHED_NAME = f'posts/{DIGEST[:2]}/{DIGEST}.gif'
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class HashedStorageTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(HashedStorageTest.user)
+
+    def create_post(self, text, filename='small.gif'):
+        self.authorized_client.post(reverse('posts:post_create'), {
+            'text': text,
+            'image': SimpleUploadedFile(
+                filename, SMALL_GIF, content_type='image/gif'),
+        })
+        return Post.objects.get(text=text)
+
+    def refs(self, name=HASHED_NAME):
+        return MediaFile.objects.get(name=name).refs
+
+    def test_identical_uploads_share_one_file(self):
+        first = self.create_post('Первый', 'one.gif')
+        second = self.create_post('Второй', 'two.GIF')
+        self.assertEqual(first.image.name, HASHED_NAME)
+        self.assertEqual(second.image.name, HASHED_NAME)
+        self.assertEqual(self.refs(), 2)
+        self.assertEqual(
+            default_storage.listdir(f'posts/{DIGEST[:2]}')[1],
+            [f'{DIGEST}.gif'],
+        )
+
+    def test_file_is_removed_with_its_last_reference(self):
+        first = self.create_post('Первый')
+        second = self.create_post('Второй')
+        thumbnail = thumbnails.ready(first.image)['JPEG', 320]
+        first.delete()
+        self.assertFalse(storage.collect(HASHED_NAME))
+        self.assertTrue(default_storage.exists(HASHED_NAME))
+        second.delete()
+        self.assertTrue(storage.collect(HASHED_NAME))
+        self.assertFalse(default_storage.exists(HASHED_NAME))
+        self.assertFalse(default_storage.exists(thumbnail.name))
+        self.assertFalse(MediaFile.objects.exists())
+
+    def test_reuploading_same_image_keeps_one_reference(self):
+        post = self.create_post('Пост')
+        self.authorized_client.post(
+            reverse('posts:post_edit', kwargs={'post_id': post.pk}), {
+                'text': 'Пост',
+                'image': SimpleUploadedFile(
+                    'again.gif', SMALL_GIF, content_type='image/gif'),
+            })
+        self.assertEqual(self.refs(), 1)
+
+    def test_dedupe_command_merges_existing_files(self):
+        names = [
+            default_storage.save(name, ContentFile(SMALL_GIF))
+            for name in ('posts/a.gif', 'posts/b.gif')
+        ]
+        for number, name in enumerate(names):
+            Post.objects.create(
+                author=self.user, text=f'Старый {number}', image=name)
+        stdout = StringIO()
+        call_command('dedupe_media', stdout=stdout)
+        self.assertIn('перенесено 1, дубликатов 1', stdout.getvalue())
+        self.assertEqual(
+            set(Post.objects.values_list('image', flat=True)), {HASHED_NAME})
+        self.assertEqual(self.refs(), 2)
+        for name in names:
+            self.assertFalse(default_storage.exists(name))
+        self.assertTrue(default_storage.exists(HASHED_NAME))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class CollectMediaTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        self.post = Post.objects.create(
+            author=self.user, text='Пост',
+            image=SimpleUploadedFile('kept.gif', SMALL_GIF))
+        self.orphan = Post.objects.create(
+            author=self.user, text='Сирота',
+            image=SimpleUploadedFile('gone.gif', SMALL_GIF + b'\x00'))
+        self.orphan_thumbnails = [
+            thumbnail.name
+            for thumbnail in thumbnails.ready(self.orphan.image).values()
+        ]
+        Post.objects.filter(pk=self.orphan.pk).delete()
+        self.age(self.orphan.image.name, *self.orphan_thumbnails)
+        self.garbage = f'лишних {len(self.orphan_thumbnails) + 1}'
+
+    @staticmethod
+    def age(*names, hours=48):
+        past = time.time() - hours * 60 * 60
+        for name in names:
+            os.utime(default_storage.path(name), (past, past))
+
+    def collect(self, *args):
+        stdout = StringIO()
+        call_command('collect_media', *args, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_unreferenced_old_files_are_deleted(self):
+        output = self.collect()
+        self.assertIn(self.garbage, output)
+        self.assertFalse(default_storage.exists(self.orphan.image.name))
+        for name in self.orphan_thumbnails:
+            self.assertFalse(default_storage.exists(name))
+        self.assertTrue(default_storage.exists(self.post.image.name))
+        for thumbnail in thumbnails.ready(self.post.image).values():
+            self.assertTrue(default_storage.exists(thumbnail.name))
+        cache.clear()
+        self.assertEqual(thumbnails.ready(self.orphan.image), {})
+
+    def test_grace_period_keeps_recent_files(self):
+        self.age(self.orphan.image.name, hours=1)
+        self.collect()
+        self.assertTrue(default_storage.exists(self.orphan.image.name))
+        self.assertFalse(default_storage.exists(self.orphan_thumbnails[0]))
+
+    def test_dry_run_deletes_nothing(self):
+        output = self.collect('--dry-run')
+        self.assertIn(self.garbage, output)
+        self.assertIn('можно освободить', output)
+        self.assertTrue(default_storage.exists(self.orphan.image.name))
+        for name in self.orphan_thumbnails:
+            self.assertTrue(default_storage.exists(name))
@@ -0,0 +1,177 @@
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from sorl.thumbnail import default
+
+from posts import thumbnails
+from posts.models import Post
+
+User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class ThumbnailTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(ThumbnailTest.user)
+
+    def create_post(self, text='Пост с картинкой'):
+        self.authorized_client.post(reverse('posts:post_create'), {
+            'text': text,
+            'image': SimpleUploadedFile(
+                'small.gif', SMALL_GIF, content_type='image/gif'),
+        })
+        return Post.objects.get(text=text)
+
+    def test_thumbnail_is_generated_on_upload(self):
+        post = self.create_post()
+        ready = thumbnails.ready(post.image)
+        self.assertEqual(set(ready), set(thumbnails.variants()))
+        response = self.client.get(reverse('posts:index'))
+        for thumbnail in ready.values():
+            self.assertContains(response, thumbnail.url)
+        self.assertContains(response, 'sizes=')
+
+    @override_settings(THUMBNAIL_WIDTHS=[100, 200],
+                       THUMBNAIL_FORMATS=['PNG', 'JPEG'])
+    def test_variants_are_rendered_as_srcset(self):
+        post = self.create_post()
+        ready = thumbnails.ready(post.image)
+        self.assertEqual(
+            set(ready),
+            {('PNG', 100), ('PNG', 200), ('JPEG', 100), ('JPEG', 200)})
+        self.assertEqual(ready['PNG', 100].width, 100)
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.pk}))
+        self.assertContains(
+            response,
+            f'<source type="image/png" srcset="{ready["PNG", 100].url} 100w, '
+            f'{ready["PNG", 200].url} 200w"')
+        self.assertContains(response, f'src="{ready["JPEG", 200].url}"')
+
+    def test_missing_thumbnail_renders_placeholder(self):
+        post = Post.objects.create(
+            author=self.user, text='Пост', image='posts/missing.jpg')
+        self.assertIsNone(post.image_width)
+        self.assertEqual(post.image_lqip, '')
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'thumbnail-placeholder.svg')
+        self.assertEqual(
+            thumbnails.failed(['posts/missing.jpg']), {'posts/missing.jpg'})
+        stdout = StringIO()
+        call_command('pregenerate_thumbnails', workers=1, stdout=stdout)
+        self.assertIn('пропущено после неудачи: 1', stdout.getvalue())
+
+    def test_render_does_not_generate_thumbnails(self):
+        post = self.create_post()
+        default.kvstore.clear()
+        cache.clear()
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, post.image_lqip)
+        self.assertEqual(thumbnails.ready(post.image), {})
+
+    def test_backfill_command_creates_missing_thumbnails(self):
+        post = self.create_post()
+        default.kvstore.clear()
+        cache.clear()
+        self.assertEqual(thumbnails.ready(post.image), {})
+        stdout = StringIO()
+        call_command('pregenerate_thumbnails', workers=1, stdout=stdout)
+        self.assertEqual(
+            set(thumbnails.ready(post.image)), set(thumbnails.variants()))
+        self.assertIn('создано 1', stdout.getvalue())
+
+    def test_backfill_command_restores_evicted_thumbnails(self):
+        post = self.create_post()
+        cache.clear()
+        self.assertEqual(thumbnails.ready(post.image), {})
+        stdout = StringIO()
+        call_command('pregenerate_thumbnails', workers=1, stdout=stdout)
+        self.assertIn('создано 0, уже было 1', stdout.getvalue())
+        self.assertEqual(
+            set(thumbnails.ready(post.image)), set(thumbnails.variants()))
+
+    def test_page_thumbnails_are_fetched_at_once(self):
+        posts = [self.create_post(f'Пост {number}') for number in range(5)]
+        expected = {
+            post.image.name: {
+                variant: thumbnail.url
+                for variant, thumbnail in thumbnails.ready(post.image).items()
+            }
+            for post in posts
+        }
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('posts:index'))
+        kvstore_queries = [
+            query for query in context.captured_queries
+            if 'thumbnail_kvstore' in query['sql']
+        ]
+        self.assertEqual(kvstore_queries, [])
+        for urls in expected.values():
+            for url in urls.values():
+                self.assertContains(response, url)
+        found = thumbnails.ready_many(post.image for post in posts)
+        self.assertEqual({
+            name: {variant: file.url for variant, file in files.items()}
+            for name, files in found.items()
+        }, expected)
+
+    def test_image_report_counts_saved_bytes(self):
+        self.create_post()
+        stdout = StringIO()
+        call_command('image_report', viewport=320, dpr=1, stdout=stdout)
+        total = stdout.getvalue().splitlines()[-1].split()
+        self.assertEqual(total[0], 'итого')
+        self.assertGreater(float(total[1]), 0)
+        self.assertLessEqual(float(total[2]), float(total[1]))
+
+    def test_image_metadata_is_stored_on_upload(self):
+        post = self.create_post()
+        self.assertEqual((post.image_width, post.image_height), (2, 1))
+        self.assertEqual(post.image_size, len(SMALL_GIF))
+        self.assertRegex(post.image_color, r'^#[0-9a-f]{6}$')
+        self.assertTrue(post.image_lqip.startswith('data:image/jpeg;base64,'))
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.pk}))
+        self.assertContains(response, 'loading="lazy"')
+        self.assertContains(response, 'width="960" height="339"')
+        self.assertContains(response, post.image_lqip)
+
+    def test_backfill_command_fills_missing_metadata(self):
+        post = self.create_post()
+        Post.objects.filter(pk=post.pk).update(
+            image_width=None, image_height=None, image_color='')
+        call_command('pregenerate_thumbnails', workers=1, stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual((post.image_width, post.image_height), (2, 1))
+        self.assertNotEqual(post.image_color, '')
@@ -0,0 +1,115 @@
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db.models import Q
+from django.test import TestCase, override_settings
+
+from posts import timeline
+from posts.models import Follow, Post, TimelineEntry
+
+User = get_user_model()
+
+
+class TimelineTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='author')
+        cls.old_post = Post.objects.create(
+            author=cls.author, text='Старый пост')
+
+    def test_follow_backfills_and_new_post_is_pushed(self):
+        """Подписка подтягивает старые посты, новый пост раскладывается"""
+        Follow.objects.create(user=self.reader, author=self.author)
+        new_post = Post.objects.create(author=self.author, text='Новый пост')
+        self.assertEqual(
+            set(TimelineEntry.objects.filter(
+                user=self.reader).values_list('post_id', flat=True)),
+            {self.old_post.pk, new_post.pk})
+        self.assertIn(new_post, timeline.feed(self.reader))
+
+    def test_unfollow_prunes_timeline(self):
+        """Отписка удаляет посты автора из ленты"""
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        follow.delete()
+        self.assertFalse(
+            TimelineEntry.objects.filter(user=self.reader).exists())
+        self.assertNotIn(self.old_post, timeline.feed(self.reader))
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_popular_author_is_merged_on_read(self):
+        """Посты популярного автора не раскладываются, а подмешиваются"""
+        other = User.objects.create_user(username='other')
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=other, author=self.author)
+        new_post = Post.objects.create(author=self.author, text='Новый пост')
+        self.assertFalse(
+            TimelineEntry.objects.filter(post=new_post).exists())
+        self.assertIn(new_post, timeline.feed(other))
+        self.assertIn(new_post, timeline.feed(self.reader))
+
+    def test_rebuild_matches_incremental_timeline(self):
+        """Пересборка даёт те же записи, что и сигналы"""
+        Follow.objects.create(user=self.reader, author=self.author)
+        Post.objects.create(author=self.author, text='Новый пост')
+        expected = set(TimelineEntry.objects.values_list('user', 'post'))
+        TimelineEntry.objects.all().delete()
+        self.assertEqual(timeline.rebuild(), len(expected))
+        self.assertEqual(
+            set(TimelineEntry.objects.values_list('user', 'post')), expected)
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_crossing_limit_moves_posts_between_timeline_and_read(self):
+        """Автор выше порога уходит из лент, ниже — раскладывается снова"""
+        other = User.objects.create_user(username='other')
+        Follow.objects.create(user=self.reader, author=self.author)
+        follow = Follow.objects.create(user=other, author=self.author)
+        self.assertFalse(TimelineEntry.objects.exists())
+        new_post = Post.objects.create(author=self.author, text='Новый пост')
+        follow.delete()
+        self.assertEqual(
+            set(TimelineEntry.objects.filter(
+                user=self.reader).values_list('post_id', flat=True)),
+            {self.old_post.pk, new_post.pk})
+        self.assertEqual(
+            list(timeline.feed(self.reader)[:10]), [new_post, self.old_post])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1, TIMELINE_WORKERS=1)
+    def test_refan_below_limit_leaves_request(self):
+        """Раскладка ниже порога ставится в очередь, а не идёт в запросе"""
+        other = User.objects.create_user(username='other')
+        Follow.objects.create(user=self.reader, author=self.author)
+        follow = Follow.objects.create(user=other, author=self.author)
+        with mock.patch.object(timeline, 'submit') as submit, \
+                mock.patch.object(
+                    timeline.transaction, 'on_commit',
+                    side_effect=lambda callback: callback()):
+            follow.delete()
+        submit.assert_called_once_with(self.author.pk)
+        self.assertFalse(TimelineEntry.objects.exists())
+        stdout = StringIO()
+        call_command(
+            'rebuild_timelines', author_id=self.author.pk, stdout=stdout)
+        self.assertIn('Записей в лентах: 1', stdout.getvalue())
+        self.assertEqual(
+            list(TimelineEntry.objects.values_list('user', 'post')),
+            [(self.reader.pk, self.old_post.pk)])
+
+    def test_feed_pages_by_timeline_entries(self):
+        """Страницы ленты идут по записям в порядке (pub_date, id)"""
+        Follow.objects.create(user=self.reader, author=self.author)
+        posts = [self.old_post] + [
+            Post.objects.create(author=self.author, text=f'Пост {number}')
+            for number in range(3)
+        ]
+        feed = timeline.feed(self.reader)
+        self.assertEqual(feed.count(), 4)
+        self.assertEqual(feed[1:3], posts[2:0:-1])
+        cursor = posts[2]
+        older = feed.filter(
+            Q(pub_date__lte=cursor.pub_date)
+            & ~Q(pub_date=cursor.pub_date, pk__gte=cursor.pk))
+        self.assertEqual(list(older), posts[1::-1])
@@ -0,0 +1,119 @@
+import io
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from posts.models import Post
+
+User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+EXIF_ORIENTATION = 0x0112
+
+
+def make_jpeg(width, height, orientation=None):
+    options = {}
+    if orientation:
+        exif = Image.Exif()
+        exif[EXIF_ORIENTATION] = orientation
+        options['exif'] = exif.tobytes()
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), 'red').save(buffer, 'JPEG', **options)
+    return SimpleUploadedFile(
+        'photo.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT,
+    THUMBNAIL_WORKERS=0,
+    UPLOAD_MAX_DIMENSION=200,
+)
+class UploadTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(UploadTest.user)
+
+    def upload(self, image):
+        return self.authorized_client.post(reverse('posts:post_create'), {
+            'text': 'Пост с фото',
+            'image': image,
+        })
+
+    def test_original_is_rotated_downscaled_and_stripped(self):
+        self.upload(make_jpeg(600, 400, orientation=6))
+        post = Post.objects.get()
+        with Image.open(post.image.path) as stored:
+            self.assertEqual(stored.size, (133, 200))
+            self.assertNotIn(EXIF_ORIENTATION, stored.getexif())
+        self.assertEqual((post.image_width, post.image_height), (133, 200))
+
+    def test_small_image_without_exif_is_kept_as_is(self):
+        image = make_jpeg(100, 50)
+        content = image.read()
+        image.seek(0)
+        self.upload(image)
+        post = Post.objects.get()
+        with open(post.image.path, 'rb') as stored:
+            self.assertEqual(stored.read(), content)
+
+    @override_settings(UPLOAD_MAX_PIXELS=1000)
+    def test_too_many_pixels_is_rejected(self):
+        response = self.upload(make_jpeg(100, 100))
+        self.assertFormError(
+            response, 'form', 'image',
+            'Картинка слишком большая: не больше 0.001 Мп.'
+        )
+        self.assertFalse(Post.objects.exists())
+
+    @override_settings(UPLOAD_MAX_SIZE=100)
+    def test_too_large_file_is_rejected(self):
+        response = self.upload(make_jpeg(100, 100))
+        self.assertFormError(
+            response, 'form', 'image',
+            'Файл слишком большой: не больше 100\xa0байт.'
+        )
+
+    def test_bench_compares_modes(self):
+        stdout = StringIO()
+        call_command(
+            'bench_uploads', width=400, height=300, uploads=2, threads=2,
+            stdout=stdout,
+        )
+        output = stdout.getvalue()
+        self.assertIn('naive', output)
+        self.assertIn('150x200', output)
+
+    def test_form_checks_header_and_decodes_once(self):
+        with mock.patch.object(Image.Image, 'verify') as verify:
+            self.upload(make_jpeg(600, 400, orientation=6))
+        verify.assert_not_called()
+        self.assertTrue(Post.objects.exists())
+
+    def test_not_an_image_is_rejected(self):
+        response = self.upload(SimpleUploadedFile(
+            'photo.jpg', b'not an image', content_type='image/jpeg'))
+        self.assertFormError(
+            response, 'form', 'image',
+            'Загрузите правильное изображение. Файл, который вы '
+            'загрузили, поврежден или не является изображением.'
+        )
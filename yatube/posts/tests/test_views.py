@@ -2,13 +2,18 @@ import tempfile
 import shutil
 
 from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django import forms
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.conf import settings
 from posts.models import Post, Group, Comment, Follow
 from django.core.cache import cache
+from django.utils.http import http_date
+from posts import generations
+from posts.utils import count_key
 
 User = get_user_model()
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
@@ -309,7 +314,6 @@ class PaginatorViewsTest(TestCase):
                     kwargs={'username': PaginatorViewsTest.user})
             + '?page=2')
         self.assertEqual(len(response.context['page_obj']), 3)
-        Follow.objects.create(user=PaginatorViewsTest.user, author=follow_user)
         response = self.guest_client.get(
             reverse('posts:profile',
                     kwargs={'username': PaginatorViewsTest.user}))
@@ -319,3 +323,411 @@ class PaginatorViewsTest(TestCase):
                     kwargs={'username': PaginatorViewsTest.user})
             + '?page=2')
         self.assertEqual(len(response.context['page_obj']), 3)
+
+    @override_settings(PAGINATION_MODE='keyset')
+    def test_index_keyset_paginator(self):
+        '''Проверка keyset-пагинации index: переход по курсорам
+        вперёд и назад даёт те же страницы, что и ?page=N'''
+        response = self.client.get(reverse('posts:index'))
+        first_page = response.context['page_obj']
+        self.assertEqual(len(first_page), 10)
+        self.assertFalse(first_page.has_previous())
+        response = self.client.get(
+            reverse('posts:index') + f'?after={first_page.next_cursor}')
+        second_page = response.context['page_obj']
+        self.assertEqual(len(second_page), 3)
+        self.assertFalse(second_page.has_next())
+        self.assertEqual(
+            [post.pk for post in second_page],
+            [post.pk for post in Post.objects.order_by('-pub_date', '-pk')
+             [10:]])
+        response = self.client.get(
+            reverse('posts:index')
+            + f'?before={second_page.previous_cursor}')
+        self.assertEqual(
+            list(response.context['page_obj']), list(first_page))
+
+    def test_keyset_paginator_ignores_broken_cursor(self):
+        '''Битый курсор открывает первую страницу'''
+        response = self.client.get(reverse('posts:index') + '?after=@@@')
+        self.assertEqual(len(response.context['page_obj']), 10)
+
+    def test_index_count_is_cached_until_new_post(self):
+        """Число постов ленты берётся из кэша и сбрасывается новым постом"""
+        key = count_key('all')
+        response = self.client.get(reverse('posts:index'))
+        self.assertEqual(response.context['page_obj'].paginator.count, 13)
+        self.assertEqual(cache.get(key), (13, False))
+        Post.objects.create(
+            text='Ещё пост', group=PaginatorViewsTest.group,
+            author=PaginatorViewsTest.user)
+        self.assertIsNone(cache.get(key))
+        response = self.client.get(reverse('posts:index'))
+        self.assertEqual(response.context['page_obj'].paginator.count, 14)
+
+    @override_settings(COUNT_ESTIMATE_THRESHOLD=5)
+    def test_index_approximate_count(self):
+        """Выше порога число постов оценивается, а страницы за оценкой
+        остаются доступными и уточняют число"""
+        response = self.client.get(reverse('posts:index'))
+        self.assertTrue(response.context['page_obj'].paginator.approximate)
+        self.assertEqual(len(response.context['page_obj']), 10)
+        response = self.client.get(reverse('posts:index') + '?page=2')
+        paginator = response.context['page_obj'].paginator
+        self.assertEqual(len(response.context['page_obj']), 3)
+        self.assertEqual(paginator.count, 13)
+        self.assertFalse(paginator.approximate)
+
+    def test_page_past_the_end_shows_last_page(self):
+        """Номер страницы за концом ленты открывает последнюю страницу,
+        даже если число постов взято из счётчиков"""
+        reader = User.objects.create_user(username='Reader')
+        Follow.objects.create(user=reader, author=PaginatorViewsTest.user)
+        self.authorized_client.force_login(reader)
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_posts',
+                    kwargs={'slug': PaginatorViewsTest.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': PaginatorViewsTest.user}),
+            reverse('posts:follow_index'),
+        ]
+        for url in urls:
+            for page in ('2', '3', '99'):
+                with self.subTest(url=url, page=page):
+                    cache.clear()
+                    response = self.authorized_client.get(
+                        url, {'page': page})
+                    self.assertEqual(response.status_code, 200)
+                    page_obj = response.context['page_obj']
+                    self.assertEqual(page_obj.number, 2)
+                    self.assertEqual(len(page_obj), 3)
+
+
+@override_settings(QUERY_BUDGET_ACTION='raise')
+class QueryBudgetViewsTest(TestCase):
+    """Число запросов view не растёт с числом постов и комментариев"""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.users = [
+            User.objects.create_user(username=f'user{i}') for i in range(12)
+        ]
+        cls.reader = cls.users[0]
+        for user in cls.users:
+            Post.objects.create(author=user, text='Текст', group=cls.group)
+            if user != cls.reader:
+                Follow.objects.create(user=cls.reader, author=user)
+        cls.post = Post.objects.first()
+        for user in cls.users:
+            Comment.objects.create(post=cls.post, author=user, text='Текст')
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(QueryBudgetViewsTest.reader)
+
+    def test_views_stay_within_query_budget(self):
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_posts', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': self.users[1].username}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+            reverse('posts:post_comments', kwargs={'post_id': self.post.pk}),
+        ]
+        for url in urls:
+            for client in (self.client, self.authorized_client):
+                with self.subTest(url=url):
+                    self.assertEqual(client.get(url).status_code, 200)
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(len(response.context['page_obj']), 10)
+
+
+class CommentPaginationTest(TestCase):
+    """Комментарии поста выводятся пачками по курсору"""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.users = [
+            User.objects.create_user(username=f'user{i}') for i in range(5)
+        ]
+        cls.post = Post.objects.create(author=cls.users[0], text='Пост')
+        Comment.objects.bulk_create([
+            Comment(post=cls.post, author=cls.users[i % 5], text=f'К {i}')
+            for i in range(45)
+        ])
+
+    def setUp(self):
+        cache.clear()
+
+    def fragment(self, cursor):
+        return self.client.get(
+            reverse('posts:post_comments', kwargs={'post_id': self.post.pk}),
+            {'after': cursor},
+        )
+
+    def test_comments_are_loaded_in_batches(self):
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}))
+        first = response.context['comments']
+        self.assertEqual(len(first), 20)
+        self.assertContains(
+            response,
+            f'data-fragment="/posts/{self.post.pk}/comments/'
+            f'?after={first.next_cursor}"',
+        )
+        second = self.fragment(first.next_cursor).context['comments']
+        third = self.fragment(second.next_cursor).context['comments']
+        self.assertEqual(len(third), 5)
+        self.assertFalse(third.has_next())
+        self.assertEqual(
+            [comment.pk for comment in [*first, *second, *third]],
+            list(Comment.objects.order_by(
+                '-pub_date', '-pk').values_list('pk', flat=True)),
+        )
+
+    def test_batch_cost_does_not_depend_on_comment_count(self):
+        url = reverse('posts:post_comments', kwargs={'post_id': self.post.pk})
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        Comment.objects.bulk_create([
+            Comment(post=self.post, author=self.users[i % 5], text='Ещё')
+            for i in range(100)
+        ])
+        cache.clear()
+        with self.assertNumQueries(len(queries)):
+            self.client.get(url)
+
+    def test_missing_post_has_no_comments(self):
+        response = self.client.get(
+            reverse('posts:post_comments', kwargs={'post_id': 0}))
+        self.assertEqual(response.status_code, 404)
+
+
+class FragmentCacheTest(TestCase):
+    """Фрагменты лент версионируются поколениями постов"""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+        cls.other_group = Group.objects.create(
+            title='Другая', slug='other', description='Описание')
+        cls.post = Post.objects.create(
+            author=cls.user, group=cls.group, text='Первый пост')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_new_post_shows_without_waiting_for_ttl(self):
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_posts', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user}),
+        ]
+        for url in urls:
+            self.client.get(url)
+        Post.objects.create(
+            author=self.user, group=self.group, text='Свежий пост')
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertContains(self.client.get(url), 'Свежий пост')
+
+    def test_group_change_updates_both_groups(self):
+        old_url = reverse(
+            'posts:group_posts', kwargs={'slug': self.group.slug})
+        new_url = reverse(
+            'posts:group_posts', kwargs={'slug': self.other_group.slug})
+        self.client.get(old_url)
+        self.client.get(new_url)
+        post = Post.objects.get(pk=self.post.pk)
+        post.group = self.other_group
+        post.save()
+        self.assertNotContains(self.client.get(old_url), 'Первый пост')
+        self.assertContains(self.client.get(new_url), 'Первый пост')
+
+    def test_generation_is_scoped(self):
+        group_generation = generations.get(f'group:{self.other_group.pk}')
+        posts_generation = generations.get('posts')
+        Post.objects.create(author=self.user, group=self.group, text='Пост')
+        self.assertEqual(
+            generations.get(f'group:{self.other_group.pk}'),
+            group_generation)
+        self.assertGreater(generations.get('posts'), posts_generation)
+
+
+@override_settings(PAGE_CACHE_ENABLED=True)
+class PageCacheTest(TestCase):
+    """Анонимные страницы кэшируются и сбрасываются по тегам"""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+        cls.post = Post.objects.create(
+            author=cls.author, group=cls.group, text='Пост автора')
+        cls.other_post = Post.objects.create(
+            author=User.objects.create_user(username='other'),
+            text='Другой пост')
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(PageCacheTest.reader)
+        self.post_url = reverse(
+            'posts:post_detail', kwargs={'post_id': self.post.pk})
+        self.other_url = reverse(
+            'posts:post_detail', kwargs={'post_id': self.other_post.pk})
+
+    def page_cache(self, url, client=None):
+        return (client or self.client).get(url)['X-Page-Cache']
+
+    def test_anonymous_pages_are_cached(self):
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_posts', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.author}),
+            self.post_url,
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.page_cache(url), 'MISS')
+                self.assertEqual(self.page_cache(url), 'HIT')
+
+    def test_authorized_requests_bypass_cache(self):
+        self.assertEqual(
+            self.page_cache(self.post_url, self.authorized_client), 'BYPASS')
+
+    def test_comment_purges_only_its_post(self):
+        self.page_cache(self.post_url)
+        self.page_cache(self.other_url)
+        self.authorized_client.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.post.pk}),
+            {'text': 'Новый комментарий'})
+        response = self.client.get(self.post_url)
+        self.assertEqual(response['X-Page-Cache'], 'MISS')
+        self.assertContains(response, 'Новый комментарий')
+        self.assertEqual(self.page_cache(self.other_url), 'HIT')
+
+    def test_follow_purges_author_profile(self):
+        url = reverse('posts:profile', kwargs={'username': self.author})
+        self.page_cache(url)
+        self.authorized_client.get(reverse(
+            'posts:profile_follow', kwargs={'username': self.author}))
+        self.assertContains(self.client.get(url), 'Подписчиков: 1')
+
+    def test_post_edit_purges_feeds(self):
+        url = reverse('posts:index')
+        self.page_cache(url)
+        author_client = Client()
+        author_client.force_login(PageCacheTest.author)
+        author_client.post(
+            reverse('posts:post_edit', kwargs={'post_id': self.post.pk}),
+            {'text': 'Исправленный пост'})
+        self.assertContains(self.client.get(url), 'Исправленный пост')
+
+    def test_group_and_author_edits_purge_their_pages(self):
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_posts', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.author}),
+            self.post_url,
+        ]
+        for url in urls:
+            self.page_cache(url)
+        group = Group.objects.get(pk=self.group.pk)
+        group.title = 'Переименованная группа'
+        group.save()
+        for url in urls[1:]:
+            with self.subTest(url=url):
+                self.assertContains(
+                    self.client.get(url), 'Переименованная группа')
+        author = User.objects.get(pk=self.author.pk)
+        author.first_name = 'Новое'
+        author.last_name = 'Имя'
+        author.save()
+        for url in urls[0], urls[2], urls[3]:
+            with self.subTest(url=url):
+                self.assertContains(self.client.get(url), 'Новое Имя')
+
+    def test_login_keeps_pages_cached(self):
+        url = reverse('posts:index')
+        self.page_cache(url)
+        Client().force_login(PageCacheTest.author)
+        self.assertEqual(self.page_cache(url), 'HIT')
+
+
+class ConditionalGetTest(TestCase):
+    """Ленты и страница поста отвечают 304 на совпавший валидатор"""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+        cls.post = Post.objects.create(
+            author=cls.author, group=cls.group, text='Пост')
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(ConditionalGetTest.author)
+        self.urls = [
+            reverse('posts:index'),
+            reverse('posts:group_posts', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.author}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+        ]
+
+    def test_matching_etag_returns_not_modified(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+
+    def test_change_invalidates_etag(self):
+        etags = {url: self.client.get(url)['ETag'] for url in self.urls}
+        Comment.objects.create(post=self.post, author=self.author, text='К')
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Изменённый пост'
+        post.save()
+        for url, etag in etags.items():
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+
+    def test_last_modified_follows_updated_at(self):
+        post = Post.objects.get(pk=self.post.pk)
+        post.save()
+        url = self.urls[0]
+        response = self.client.get(url)
+        self.assertEqual(
+            response['Last-Modified'], http_date(post.updated_at.timestamp()))
+        response = self.client.get(
+            url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_authorized_validators_are_personal(self):
+        url = self.urls[3]
+        anonymous = self.client.get(url)
+        response = self.authorized_client.get(url)
+        self.assertNotEqual(response['ETag'], anonymous['ETag'])
+        self.assertFalse(response.has_header('Last-Modified'))
+        response = self.authorized_client.get(
+            url, HTTP_IF_NONE_MATCH=anonymous['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_missing_object_is_not_found(self):
+        response = self.client.get(
+            reverse('posts:group_posts', kwargs={'slug': 'missing'}))
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,250 @@
+"""Заблаговременная генерация миниатюр картинок постов.
+
+Миниатюра создаётся не в запросе, который первым показал пост, а в
+фоновом пуле потоков сразу после сохранения картинки. Из картинки
+делается набор вариантов — ширины THUMBNAIL_WIDTHS в форматах
+THUMBNAIL_FORMATS, — из которых шаблон собирает srcset, и клиент
+скачивает самый маленький подходящий вариант. Шаблон берёт готовые
+варианты из хранилища ключей sorl-thumbnail (без чтения исходника) и,
+пока их нет, показывает заглушку; показ ничего не генерирует и не
+пишет. Очередь ограничена THUMBNAIL_QUEUE: лишние задания
+отбрасываются, недостающее досоздаёт manage.py pregenerate_thumbnails.
+Исходники, из которых миниатюру сделать не удалось, запоминаются
+на FAILED_TIMEOUT и до тех пор не генерируются повторно.
+
+Готовые варианты запоминаются в кэше под своими ключами (READY_KEY
+по имени файла миниатюры): для ленты миниатюры всей страницы берутся
+заранее (prefetch) одним get_many, без запросов к БД. Вариант, которого
+нет в кэше, показ считает неготовым; команды (lookup=True) ищут его
+в хранилище ключей sorl и возвращают в кэш.
+
+Исходник читается из хранилища своего поля (image.storage), миниатюры
+пишутся в хранилище sorl-thumbnail.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from PIL import features
+from django.db import connections, transaction
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as default_settings
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile
+
+from . import generations
+
+logger = logging.getLogger('yatube.thumbnails')
+
+# Пропорции карточки поста: 960x339.
+ASPECT = 339 / 960
+OPTIONS = {'crop': 'center', 'upscale': True}
+# Форматы, которым нужна отдельная поддержка в Pillow.
+CODECS = {'WEBP': 'webp'}
+FAILED_KEY = 'thumbnails:failed:{}'
+READY_KEY = 'thumbnails:ready:{}'
+FAILED_TIMEOUT = 24 * 60 * 60
+
+
+class Backend(ThumbnailBackend):
+    def thumbnail_file(self, file_, geometry_string, **options):
+        """Файл миниатюры, который создал бы get_thumbnail().
+
+        Имя считается так же, как в get_thumbnail(), но исходник
+        не открывается и ничего не генерируется.
+        """
+        source = ImageFile(file_)
+        if thumbnail_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(thumbnail_settings, attr)
+            if value != getattr(default_settings, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return ImageFile(name, default.storage)
+
+
+backend = Backend()
+lock = threading.Lock()
+pending = set()
+executor = None
+
+
+def get_executor():
+    global executor
+    with lock:
+        if executor is None:
+            executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails',
+            )
+        return executor
+
+
+def variants():
+    """Варианты миниатюры: {(формат, ширина): (геометрия, опции)}.
+
+    Форматы, которые Pillow не умеет записывать, пропускаются.
+    """
+    result = {}
+    for format_ in settings.THUMBNAIL_FORMATS:
+        codec = CODECS.get(format_)
+        if codec and not features.check(codec):
+            continue
+        for width in settings.THUMBNAIL_WIDTHS:
+            geometry = f'{width}x{round(width * ASPECT)}'
+            result[format_, width] = (geometry, dict(OPTIONS, format=format_))
+    return result
+
+
+def thumbnail_files(image):
+    """Файлы всех вариантов миниатюры картинки.
+
+    image — файл поля (post.image) или ImageFile с хранилищем исходника.
+    """
+    return {
+        variant: backend.thumbnail_file(image, geometry, **options)
+        for variant, (geometry, options) in variants().items()
+    }
+
+
+def remember(thumbnails):
+    """Запоминает готовые варианты (ImageFile с размером) в кэше."""
+    cache.set_many({
+        READY_KEY.format(thumbnail.name): thumbnail.size
+        for thumbnail in thumbnails
+    }, None)
+
+
+def forget(image):
+    """Забывает готовые варианты удалённой картинки."""
+    cache.delete_many([
+        READY_KEY.format(thumbnail.name)
+        for thumbnail in thumbnail_files(image).values()
+    ])
+
+
+def ready_many(images, lookup=False):
+    """Готовые варианты миниатюр картинок.
+
+    Возвращает {имя картинки: {(формат, ширина): ImageFile}}; картинки
+    без единого готового варианта в ответ не попадают. С lookup
+    варианты, которых нет в кэше, ищутся в хранилище ключей sorl —
+    по запросу на вариант, поэтому только для команд.
+    """
+    files = {}
+    for image in images:
+        if not image:
+            continue
+        for variant, thumbnail in thumbnail_files(image).items():
+            files[READY_KEY.format(thumbnail.name)] = (
+                image.name, variant, thumbnail)
+    found = {}
+    sizes = cache.get_many(list(files))
+    recovered = []
+    for key, (name, variant, thumbnail) in files.items():
+        if key in sizes:
+            thumbnail.set_size(sizes[key])
+        elif lookup:
+            thumbnail = default.kvstore.get(thumbnail)
+            if thumbnail is None:
+                continue
+            recovered.append(thumbnail)
+        else:
+            continue
+        found.setdefault(name, {})[variant] = thumbnail
+    remember(recovered)
+    return found
+
+
+def prefetch(posts):
+    """Запоминает в постах их готовые миниатюры для ready()."""
+    posts = list(posts)
+    found = ready_many(post.image for post in posts)
+    for post in posts:
+        post.prefetched_thumbnails = found.get(post.image.name, {})
+
+
+def ready(image):
+    """Готовые варианты миниатюры картинки поста."""
+    post = image.instance
+    if hasattr(post, 'prefetched_thumbnails'):
+        return post.prefetched_thumbnails
+    return ready_many([image]).get(image.name, {})
+
+
+def failed(names):
+    """Картинки из names, миниатюры которых недавно не удалось создать."""
+    keys = {FAILED_KEY.format(name): name for name in names}
+    return {keys[key] for key in cache.get_many(list(keys))}
+
+
+def generate(image, scopes=()):
+    """Создаёт варианты миниатюры и сбрасывает кэш страниц с постом.
+
+    Неудача запоминается (см. failed).
+    """
+    key = FAILED_KEY.format(image.name)
+    if not image.storage.exists(image.name):
+        logger.warning('Картинка %s не найдена', image.name)
+        cache.set(key, True, FAILED_TIMEOUT)
+        return None
+    try:
+        created = {
+            variant: backend.get_thumbnail(image, geometry, **options)
+            for variant, (geometry, options) in variants().items()
+        }
+    except Exception:
+        cache.set(key, True, FAILED_TIMEOUT)
+        raise
+    cache.delete(key)
+    remember(created.values())
+    generations.bump(*scopes)
+    return created
+
+
+def try_generate(image, scopes):
+    """generate(), ошибки которого только пишутся в лог."""
+    try:
+        generate(image, scopes)
+    except Exception:
+        logger.exception('Не удалось создать миниатюру %s', image.name)
+
+
+def run(image, scopes):
+    try:
+        try_generate(image, scopes)
+    finally:
+        with lock:
+            pending.discard(image.name)
+        # У потока пула свои соединения с БД; держать их незачем.
+        connections.close_all()
+
+
+def submit(image, scopes):
+    with lock:
+        if image.name in pending or len(pending) >= settings.THUMBNAIL_QUEUE:
+            return
+        pending.add(image.name)
+    get_executor().submit(run, image, scopes)
+
+
+def schedule(image):
+    """Ставит генерацию миниатюры в очередь после коммита транзакции.
+
+    При THUMBNAIL_WORKERS = 0 миниатюра создаётся сразу, в текущем
+    потоке.
+    """
+    if not image or failed([image.name]):
+        return
+    post = image.instance
+    scopes = generations.scopes_for(post)
+    if not settings.THUMBNAIL_WORKERS:
+        try_generate(image, scopes)
+        return
+    transaction.on_commit(lambda: submit(image, scopes))
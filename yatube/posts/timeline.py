@@ -0,0 +1,397 @@
+"""Материализованная лента подписок (fan-out on write).
+
+Новый пост раскладывается в TimelineEntry всем подписчикам автора,
+подписка подтягивает последние посты автора, отписка их удаляет.
+Авторы, у которых подписчиков больше TIMELINE_FANOUT_LIMIT, в ленты
+не раскладываются: их посты подмешиваются в ленту при чтении.
+
+Когда автор пересекает порог, ленты его подписчиков перекладываются
+(followers_changed): посты уходят из записей или раскладываются заново
+в фоновом потоке (TIMELINE_WORKERS), а не в запросе отписки.
+
+Записи ленты лежат в основной БД, хранят дату поста и ссылаются на
+посты по id; с шардированием (posts.shards) посты страницы читаются
+из всех шардов.
+"""
+import copy
+import heapq
+import itertools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, connections, transaction
+from django.db.models import Q
+
+from . import shards
+from .models import Follow, Post, TimelineEntry, UserStats
+from .utils import count_key
+
+BATCH_SIZE = 1000
+
+logger = logging.getLogger('yatube.timeline')
+lock = threading.Lock()
+pending = set()
+executor = None
+
+
+def get_executor():
+    global executor
+    with lock:
+        if executor is None:
+            executor = ThreadPoolExecutor(
+                max_workers=settings.TIMELINE_WORKERS,
+                thread_name_prefix='timeline',
+            )
+        return executor
+
+
+def fans_out(author_id):
+    """Раскладываются ли посты автора по лентам подписчиков."""
+    return not UserStats.objects.filter(
+        user_id=author_id,
+        followers_count__gt=settings.TIMELINE_FANOUT_LIMIT,
+    ).exists()
+
+
+def push(post):
+    if not fans_out(post.author_id):
+        return
+    followers = list(Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list('user_id', flat=True))
+    _insert(
+        TimelineEntry(user_id=user_id, post_id=post.pk,
+                      pub_date=post.pub_date)
+        for user_id in followers
+    )
+    forget_counts(followers)
+
+
+def latest(author_id):
+    """(id, pub_date) последних TIMELINE_BACKFILL постов автора."""
+    return list(Post.objects.using(shards.for_author(author_id)).filter(
+        author_id=author_id
+    ).values_list('pk', 'pub_date')[:settings.TIMELINE_BACKFILL])
+
+
+def backfill(user_id, author_id):
+    if not fans_out(author_id):
+        return
+    _insert(
+        TimelineEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+        for post_id, pub_date in latest(author_id)
+    )
+    forget_counts([user_id])
+
+
+def prune(user_id, author_id):
+    _delete(TimelineEntry.objects.filter(user_id=user_id), author_id)
+    forget_counts([user_id])
+
+
+def followers_changed(author_id, delta):
+    """Перекладывает ленты, если автор пересёк TIMELINE_FANOUT_LIMIT.
+
+    Вызывается после того, как счётчик подписчиков сдвинут. Выше порога
+    посты автора уходят из лент: их подмешивает чтение. Ниже порога
+    последние посты раскладываются всем подписчикам заново (schedule),
+    иначе посты, написанные выше порога, пропали бы из лент. Порог,
+    пройденный при гонке подписок, чинит rebuild.
+    """
+    followers = UserStats.objects.filter(user_id=author_id).values_list(
+        'followers_count', flat=True).first()
+    limit = settings.TIMELINE_FANOUT_LIMIT
+    if delta > 0 and followers == limit + 1:
+        _delete(TimelineEntry.objects.all(), author_id)
+        forget_counts(Follow.objects.filter(
+            author_id=author_id).values_list('user_id', flat=True))
+    elif delta < 0 and followers == limit:
+        schedule(author_id)
+
+
+def run(author_id):
+    try:
+        rebuild(author_id=author_id)
+    except Exception:
+        logger.exception('Не удалось разложить посты автора %s', author_id)
+    finally:
+        with lock:
+            pending.discard(author_id)
+        # У потока пула свои соединения с БД; держать их незачем.
+        connections.close_all()
+
+
+def submit(author_id):
+    with lock:
+        if author_id in pending:
+            return
+        pending.add(author_id)
+    get_executor().submit(run, author_id)
+
+
+def schedule(author_id):
+    """Ставит раскладку постов автора по лентам в очередь после коммита.
+
+    До TIMELINE_FANOUT_LIMIT × TIMELINE_BACKFILL записей — не для
+    запроса отписки. При TIMELINE_WORKERS = 0 раскладывает сразу.
+    """
+    if not settings.TIMELINE_WORKERS:
+        rebuild(author_id=author_id)
+        return
+    transaction.on_commit(lambda: submit(author_id))
+
+
+def remove(post):
+    """Убирает удалённый пост из лент."""
+    entries = TimelineEntry.objects.filter(post_id=post.pk)
+    forget_counts(entries.values_list('user_id', flat=True))
+    entries.delete()
+
+
+def forget_counts(user_ids):
+    """Сбрасывает кэш числа записей в лентах пользователей."""
+    cache.delete_many([count_key('timeline', pk) for pk in user_ids])
+
+
+def read_time_authors(user):
+    """Авторы из подписок, чьи посты подмешиваются при чтении.
+
+    Пары (id автора, число его постов).
+    """
+    # От подписок читателя по индексу (user, author), а не перебором
+    # счётчиков всех пользователей.
+    return Follow.objects.filter(
+        user=user,
+        author__stats__followers_count__gt=settings.TIMELINE_FANOUT_LIMIT,
+    ).values_list('author_id', 'author__stats__posts_count')
+
+
+def feed(user):
+    """Посты ленты подписок пользователя."""
+    return Feed(user.pk, dict(read_time_authors(user)))
+
+
+def rebuild(user_id=None, author_id=None):
+    """Пересобирает ленты одним INSERT ... SELECT.
+
+    Последние TIMELINE_BACKFILL постов каждого автора выбираются
+    оконной функцией, поэтому объём работы не зависит от числа
+    запросов к БД, а только от числа записей в лентах. Посты шардов
+    выбираются тем же запросом в каждом шарде и вставляются пачками.
+    С user_id пересобирается лента одного читателя, с author_id —
+    записи постов одного автора во всех лентах.
+    """
+    tables = {
+        'entry': TimelineEntry._meta.db_table,
+        'follow': Follow._meta.db_table,
+        'post': Post._meta.db_table,
+        'stats': UserStats._meta.db_table,
+    }
+    tables = {key: connection.ops.quote_name(name)
+              for key, name in tables.items()}
+    params = [settings.TIMELINE_BACKFILL, settings.TIMELINE_FANOUT_LIMIT]
+    only_user = only_author = posts_where = ''
+    if user_id is not None:
+        only_user = 'AND f.user_id = %s'
+        params.append(user_id)
+    if author_id is not None:
+        posts_where = 'WHERE author_id = %s'
+        only_author = 'AND f.author_id = %s'
+        params = [author_id, *params, author_id]
+    entries = TimelineEntry.objects.all()
+    if user_id is not None:
+        entries = entries.filter(user_id=user_id)
+    select = f'''
+            SELECT f.user_id, p.id, p.pub_date
+            FROM {tables['follow']} f
+            JOIN (
+                SELECT id, author_id, pub_date, ROW_NUMBER() OVER (
+                    PARTITION BY author_id ORDER BY pub_date DESC, id DESC
+                ) AS position
+                FROM {tables['post']}
+                {posts_where}
+            ) p ON p.author_id = f.author_id
+            LEFT JOIN {tables['stats']} s ON s.user_id = f.author_id
+            WHERE p.position <= %s
+              AND COALESCE(s.followers_count, 0) <= %s
+              {only_user}
+              {only_author}
+    '''
+    readers = Follow.objects.values_list('user_id', flat=True).distinct()
+    if user_id is not None:
+        readers = [user_id]
+    elif author_id is not None:
+        readers = readers.filter(author_id=author_id)
+    forget_counts(readers)
+    with transaction.atomic(), connection.cursor() as cursor:
+        if author_id is None:
+            entries.delete()
+        else:
+            _delete(entries, author_id)
+        if not shards.sharded():
+            cursor.execute(
+                f"INSERT INTO {tables['entry']} (user_id, post_id, pub_date) "
+                f"{select}", params)
+            return cursor.rowcount
+        created = 0
+        for alias in shards.shards():
+            with connections[alias].cursor() as shard_cursor:
+                shard_cursor.execute(select, params)
+                rows = shard_cursor.fetchall()
+            _insert(
+                TimelineEntry(user_id=reader, post_id=post_id,
+                              pub_date=pub_date)
+                for reader, post_id, pub_date in rows
+            )
+            created += len(rows)
+        return created
+
+
+def _delete(entries, author_id):
+    """Удаляет из entries записи постов автора."""
+    if not shards.sharded():
+        entries.filter(post__author_id=author_id).delete()
+        return
+    # Посты в шарде автора: id записей выбираются там, запросом
+    # к присоединённой таблице лент.
+    posts = list(Post.objects.using(shards.for_author(author_id)).filter(
+        author_id=author_id, pk__in=entries.values('post_id'),
+    ).values_list('pk', flat=True))
+    for start in range(0, len(posts), BATCH_SIZE):
+        entries.filter(post_id__in=posts[start:start + BATCH_SIZE]).delete()
+
+
+def _insert(entries):
+    batch = []
+    for entry in entries:
+        batch.append(entry)
+        if len(batch) == BATCH_SIZE:
+            TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def _entry_lookup(lookup):
+    """Условие на пост — условие на запись ленты: pk -> post_id."""
+    name, separator, rest = lookup.partition('__')
+    if name in ('pk', 'id'):
+        name = 'post_id'
+    return name + separator + rest
+
+
+def _entry_q(query):
+    clone = copy.copy(query)
+    clone.children = [
+        _entry_q(child) if isinstance(child, Q)
+        else (_entry_lookup(child[0]), child[1])
+        for child in query.children
+    ]
+    return clone
+
+
+class Feed:
+    """Лента подписок читателя для пагинаторов posts.utils.
+
+    Страница выбирается из записей ленты по индексу (user, pub_date,
+    post), без сортировки, и только потом посты страницы читаются по
+    id — из всех шардов. Посты авторов, которые подмешиваются при
+    чтении, сливаются с записями по (pub_date, id), как выборки шардов
+    в shards.MergedQuerySet. Поддерживает только сортировку по
+    (pub_date, pk) и условия на эти поля.
+    """
+    ordered = True
+
+    def __init__(self, user_id, authors, entries=None, posts=None,
+                 related=(), ordering=('-pub_date', '-pk')):
+        self.user_id = user_id
+        # id автора -> число его постов.
+        self.authors = authors
+        if entries is None:
+            entries = TimelineEntry.objects.filter(user_id=user_id)
+        if posts is None:
+            posts = Post.objects.filter(author_id__in=list(authors))
+        self.entries = entries
+        self.posts = posts
+        self.related = related
+        self.ordering = ordering
+
+    def _clone(self, **changes):
+        options = {
+            'entries': self.entries, 'posts': self.posts,
+            'related': self.related, 'ordering': self.ordering,
+        }
+        options.update(changes)
+        return Feed(self.user_id, self.authors, **options)
+
+    def filter(self, *args, **kwargs):
+        return self._clone(
+            entries=self.entries.filter(
+                *[_entry_q(arg) for arg in args],
+                **{_entry_lookup(key): value
+                   for key, value in kwargs.items()}),
+            posts=self.posts.filter(*args, **kwargs),
+        )
+
+    def select_related(self, *fields):
+        return self._clone(related=self.related + fields)
+
+    def order_by(self, *fields):
+        if fields not in (('-pub_date', '-pk'), ('pub_date', 'pk')):
+            raise ValueError(
+                'Ленту можно сортировать только по (pub_date, pk).')
+        return self._clone(ordering=fields)
+
+    def count(self):
+        """Записей в ленте и постов подмешиваемых авторов.
+
+        Число записей кэшируется до изменения ленты; посты авторов
+        берутся из счётчиков, поэтому число — оценка.
+        """
+        key = count_key('timeline', self.user_id)
+        entries = cache.get(key)
+        if entries is None:
+            entries = TimelineEntry.objects.filter(
+                user_id=self.user_id).count()
+            cache.set(key, entries, settings.COUNT_CACHE_TIMEOUT)
+        return entries + sum(self.authors.values())
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice) or key.step is not None:
+            raise TypeError('Ленту можно только срезать.')
+        start, stop = key.start or 0, key.stop
+        descending = self.ordering[0].startswith('-')
+        entries = self.entries.order_by(*[
+            name.replace('pk', 'post_id') for name in self.ordering
+        ]).values_list('pub_date', 'post_id')
+        if not self.authors:
+            keys = list(entries[start:stop])
+        else:
+            streams = [entries] + shards.spread(
+                self.posts.order_by(*self.ordering).values_list(
+                    'pub_date', 'pk'))
+            if stop is not None:
+                streams = [stream[:stop] for stream in streams]
+            rows = heapq.merge(*streams, reverse=descending)
+            # Записи, оставшиеся от автора до порога, совпадают
+            # с его постами: соседние одинаковые ключи склеиваются.
+            keys = list(itertools.islice(
+                (row for row, _ in itertools.groupby(rows)), start, stop))
+        posts = self._fetch([pk for _, pk in keys])
+        return [posts[pk] for _, pk in keys if pk in posts]
+
+    def _fetch(self, ids):
+        """Посты по id из всех шардов; пропавших в ответе нет."""
+        if not ids:
+            return {}
+        queryset = Post.objects.select_related(*self.related).filter(
+            pk__in=ids).order_by()
+        return {
+            post.pk: post
+            for part in shards.spread(queryset) for post in part
+        }
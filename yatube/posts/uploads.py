@@ -0,0 +1,193 @@
+"""Обработка картинок постов при загрузке.
+
+Загруженный файл проверяется на размер, формат и число пикселей по
+заголовку — до того, как картинка раскодирована, поэтому «бомба»
+декомпрессии отклоняется, не заняв память; check() — валидация поля
+картинки в форме поста (posts.forms). Затем картинка
+поворачивается по EXIF, метаданные EXIF (в том числе координаты
+съёмки) отбрасываются, а оригинал уменьшается до UPLOAD_MAX_DIMENSION
+по большей стороне. JPEG раскодируется сразу в уменьшенном масштабе
+(draft), так что полноразмерный кадр в памяти не появляется.
+
+Одновременно обрабатывается не больше UPLOAD_CONCURRENCY картинок на
+процесс: пиковая память ограничена этим числом, умноженным на размер
+одного кадра, сколько бы загрузок ни пришло разом. Большие загрузки
+Django и так держит во временном файле (FILE_UPLOAD_MAX_MEMORY_SIZE),
+результат тоже пишется в SpooledTemporaryFile.
+"""
+import logging
+import math
+import tempfile
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import UploadedFile
+from django.template.defaultfilters import filesizeformat
+from PIL import Image, ImageOps
+
+logger = logging.getLogger('yatube.uploads')
+
+CONTENT_TYPES = {
+    'JPEG': 'image/jpeg',
+    'MPO': 'image/jpeg',
+    'PNG': 'image/png',
+    'GIF': 'image/gif',
+    'WEBP': 'image/webp',
+}
+# Форматы, которые сохраняются в другом: MPO — JPEG с телефонов.
+SAVE_AS = {'MPO': 'JPEG'}
+DRAFT_FORMATS = ('JPEG', 'MPO')
+JPEG_MODES = ('RGB', 'L', 'CMYK')
+
+lock = threading.Lock()
+semaphore = None
+
+
+def get_semaphore():
+    global semaphore
+    with lock:
+        if semaphore is None:
+            semaphore = threading.BoundedSemaphore(
+                settings.UPLOAD_CONCURRENCY)
+        return semaphore
+
+
+def check_size(upload):
+    if upload.size > settings.UPLOAD_MAX_SIZE:
+        raise ValidationError(
+            'Файл слишком большой: не больше '
+            f'{filesizeformat(settings.UPLOAD_MAX_SIZE)}.',
+            code='file_too_large',
+        )
+
+
+def check(upload):
+    """Отклоняет загрузку по размеру файла и заголовку картинки.
+
+    Картинка не раскодируется: Image.open читает только заголовок.
+    """
+    check_size(upload)
+    upload.seek(0)
+    try:
+        with Image.open(upload) as image:
+            check_image(image)
+    except (OSError, ValueError, Image.DecompressionBombError) as error:
+        logger.warning('Не удалось прочитать %s: %s', upload.name, error)
+        raise ValidationError(
+            'Загрузите правильное изображение. Файл, который вы '
+            'загрузили, поврежден или не является изображением.',
+            code='invalid_image',
+        )
+    finally:
+        upload.seek(0)
+
+
+def check_image(image):
+    """Отклоняет открытую картинку по заголовку, не раскодируя её."""
+    if image.format not in CONTENT_TYPES:
+        raise ValidationError(
+            'Поддерживаются картинки JPEG, PNG, GIF и WEBP.',
+            code='invalid_format',
+        )
+    width, height = image.size
+    frames = getattr(image, 'n_frames', 1)
+    if width * height * frames > settings.UPLOAD_MAX_PIXELS:
+        raise ValidationError(
+            'Картинка слишком большая: не больше '
+            f'{settings.UPLOAD_MAX_PIXELS / 1_000_000:g} Мп.',
+            code='too_many_pixels',
+        )
+    if frames > 1 and max(width, height) > settings.UPLOAD_MAX_DIMENSION:
+        raise ValidationError(
+            'Анимация должна быть не больше '
+            f'{settings.UPLOAD_MAX_DIMENSION}px по большей стороне.',
+            code='animation_too_large',
+        )
+
+
+def needs_processing(image):
+    """Нужно ли перекодировать картинку.
+
+    Картинку без EXIF и не больше предела незачем перекодировать с
+    потерей качества; анимации сохраняются как есть.
+    """
+    if getattr(image, 'is_animated', False):
+        return False
+    return (
+        max(image.size) > settings.UPLOAD_MAX_DIMENSION
+        or 'exif' in image.info
+        or image.format in SAVE_AS
+    )
+
+
+def transform(image):
+    """Повёрнутая по EXIF и уменьшенная копия картинки."""
+    limit = settings.UPLOAD_MAX_DIMENSION
+    if image.format in DRAFT_FORMATS:
+        ratio = min(limit / max(image.size), 1)
+        image.draft(
+            image.mode if image.mode in JPEG_MODES else 'RGB',
+            tuple(math.ceil(side * ratio) for side in image.size),
+        )
+    # Сначала уменьшение на месте, потом поворот уже маленькой копии.
+    image.thumbnail((limit, limit), Image.LANCZOS)
+    return ImageOps.exif_transpose(image)
+
+
+def save(image, format_, info):
+    """Записывает картинку без EXIF во временный файл."""
+    options = {}
+    if info.get('icc_profile'):
+        options['icc_profile'] = info['icc_profile']
+    if format_ == 'JPEG':
+        if image.mode not in JPEG_MODES:
+            image = image.convert('RGB')
+        options.update(quality=settings.UPLOAD_JPEG_QUALITY, optimize=True)
+    elif 'transparency' in info and image.mode in ('P', 'L', 'RGB'):
+        options['transparency'] = info['transparency']
+    output = tempfile.SpooledTemporaryFile(
+        max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+    image.save(output, format_, **options)
+    return output
+
+
+def normalize(upload):
+    upload.seek(0)
+    try:
+        with Image.open(upload) as image:
+            check_image(image)
+            if not needs_processing(image):
+                upload.seek(0)
+                return upload
+            format_ = SAVE_AS.get(image.format, image.format)
+            info = dict(image.info)
+            output = save(transform(image), format_, info)
+    except (OSError, ValueError, Image.DecompressionBombError) as error:
+        logger.warning('Не удалось обработать %s: %s', upload.name, error)
+        raise ValidationError(
+            'Не удалось обработать картинку.', code='invalid_image')
+    size = output.tell()
+    output.seek(0)
+    return UploadedFile(
+        output, upload.name, CONTENT_TYPES[format_], size)
+
+
+def process(upload):
+    """Проверенная и нормализованная картинка вместо загруженной.
+
+    Единственное место, где картинка раскодируется. Возвращает сам
+    upload, если менять в нём нечего; иначе — новый файл с тем же
+    именем. Ошибки — ValidationError формы.
+    """
+    check_size(upload)
+    slots = get_semaphore()
+    if not slots.acquire(timeout=settings.UPLOAD_WAIT):
+        raise ValidationError(
+            'Сервер занят обработкой картинок, попробуйте ещё раз.',
+            code='busy',
+        )
+    try:
+        return normalize(upload)
+    finally:
+        slots.release()
@@ -1,9 +1,245 @@
-from django.core.paginator import Paginator
+import base64
+import binascii
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import EmptyPage, Page, Paginator
+from django.db.models import Max, Min, Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
 from yatube.settings import PER_PAGE
 
+COUNT_KEY = 'posts:count:{}'
+
 
-def paginate_page(request, posts):
-    paginator = Paginator(posts, PER_PAGE)
+def paginate_page(request, posts, count_key=None, count=None):
+    if (
+        settings.PAGINATION_MODE == 'keyset'
+        or 'after' in request.GET
+        or 'before' in request.GET
+    ):
+        return paginate_keyset(request, posts, count_key, count)
+    paginator = CountingPaginator(
+        posts, PER_PAGE, count_key=count_key, count=count)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
     return page_obj
+
+
+def paginate_keyset(request, posts, count_key=None, count=None):
+    """Страница ленты по курсору из ?after= / ?before=."""
+    paginator = KeysetPaginator(
+        posts, PER_PAGE, count_key=count_key, count=count)
+    return paginator.get_page(
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
+
+
+def count_key(*scope):
+    """Ключ кэша числа объектов выборки, например ('all',)."""
+    return COUNT_KEY.format(':'.join(str(part) for part in scope))
+
+
+def invalidate_counts(post):
+    """Сбрасывает кэш числа всех постов.
+
+    Числа постов группы и автора берутся из денормализованных
+    счётчиков (posts.counters) и в кэше не хранятся.
+    """
+    cache.delete(count_key('all'))
+
+
+class CountingPaginator(Paginator):
+    """Paginator, который берёт число объектов из кэша.
+
+    Если кэш пуст, COUNT(*) ограничивается COUNT_ESTIMATE_THRESHOLD
+    строками; выше порога число считается оценкой (approximate).
+    Оценка уточняется по ходу: страница читается с запасом в одну
+    строку, и последняя страница даёт точное число.
+
+    Число, известное заранее (например, из счётчиков), передаётся
+    в count и тоже считается оценкой: счётчики могут расходиться
+    с данными до пересчёта.
+    """
+
+    def __init__(self, object_list, per_page, count_key=None, count=None,
+                 **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_key = count_key
+        if count is not None:
+            self.__dict__['_counted'] = (count, True)
+
+    @cached_property
+    def _counted(self):
+        if self.count_key is not None:
+            cached = cache.get(self.count_key)
+            if cached is not None:
+                return cached
+        counted = self._count()
+        if self.count_key is not None:
+            cache.set(self.count_key, counted, settings.COUNT_CACHE_TIMEOUT)
+        return counted
+
+    @property
+    def count(self):
+        return self._counted[0]
+
+    @property
+    def approximate(self):
+        return self._counted[1]
+
+    def _count(self):
+        threshold = settings.COUNT_ESTIMATE_THRESHOLD
+        # Выборка со всех шардов (posts.shards) считается по частям.
+        parts = getattr(self.object_list, 'parts', [self.object_list])
+        count = sum(
+            part.order_by()[:threshold + 1].count() for part in parts)
+        if count <= threshold:
+            return count, False
+        queryset = self.object_list.order_by()
+        # У шардов свои диапазоны id: оценка по ним только для одной БД.
+        if len(parts) == 1 and not queryset.query.where:
+            # Без фильтров размер таблицы оценивается по диапазону id.
+            bounds = queryset.aggregate(low=Min('pk'), high=Max('pk'))
+            return bounds['high'] - bounds['low'] + 1, True
+        return count, True
+
+    def validate_number(self, number):
+        if not self.approximate:
+            return super().validate_number(number)
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            return super().validate_number(number)
+        if number < 1:
+            raise EmptyPage('That page number is less than 1')
+        return number
+
+    def get_page(self, number):
+        try:
+            return super().get_page(number)
+        except EmptyPage:
+            # Страница за оценкой пуста, и page() уже узнал точное
+            # число: как и Paginator, отдаём последнюю страницу.
+            return self.page(self.num_pages)
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if not self.approximate:
+            return super().page(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not rows and number > 1:
+            # Оценка оказалась завышена: узнаём точное число.
+            self._set_count(self.object_list.count(), approximate=False)
+            raise EmptyPage('That page contains no results')
+        if len(rows) > self.per_page:
+            self._set_count(
+                max(self.count, bottom + len(rows)), approximate=True)
+        else:
+            self._set_count(bottom + len(rows), approximate=False)
+        return self._get_page(rows[:self.per_page], number, self)
+
+    def _set_count(self, count, approximate):
+        self.__dict__['_counted'] = (count, approximate)
+        self.__dict__.pop('num_pages', None)
+        if self.count_key is not None and not approximate:
+            cache.set(
+                self.count_key, (count, False), settings.COUNT_CACHE_TIMEOUT)
+
+
+def encode_cursor(obj):
+    """Непрозрачный токен курсора для пары (pub_date, id)."""
+    raw = f'{obj.pub_date.isoformat()}|{obj.pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Возвращает (pub_date, id) или ValueError для битого токена."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        pub_date, pk = raw.decode().split('|')
+        pub_date = parse_datetime(pub_date)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as error:
+        raise ValueError('Некорректный курсор') from error
+    if pub_date is None:
+        raise ValueError('Некорректный курсор')
+    return pub_date, pk
+
+
+class KeysetPage(Page):
+    """Страница без номера: навигация только по курсорам соседей."""
+    is_keyset = True
+
+    def __init__(self, object_list, paginator, next_cursor=None,
+                 previous_cursor=None, cursor=''):
+        super().__init__(object_list, None, paginator)
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.cursor = cursor
+
+    def __repr__(self):
+        return f'<Keyset page {self.cursor or "first"}>'
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+class KeysetPaginator(CountingPaginator):
+    """Пагинация по (pub_date, id) без OFFSET и COUNT(*).
+
+    Время выборки страницы не зависит от её глубины: запрос идёт
+    по индексу от позиции курсора и читает per_page + 1 строк.
+    Число объектов считается, только если его запросили, и берётся
+    из кэша, как в CountingPaginator.
+    """
+    ordering = ('-pub_date', '-pk')
+
+    def get_page(self, after=None, before=None):
+        try:
+            if before:
+                return self._page_before(decode_cursor(before), before)
+            if after:
+                return self._page_after(decode_cursor(after), after)
+        except ValueError:
+            pass
+        return self._page_after(None, '')
+
+    def _page_after(self, cursor, token):
+        queryset = self.object_list.order_by(*self.ordering)
+        if cursor is not None:
+            pub_date, pk = cursor
+            queryset = queryset.filter(
+                Q(pub_date__lte=pub_date) & ~Q(pub_date=pub_date, pk__gte=pk)
+            )
+        rows = list(queryset[:self.per_page + 1])
+        objects = rows[:self.per_page]
+        next_cursor = None
+        if len(rows) > self.per_page:
+            next_cursor = encode_cursor(objects[-1])
+        previous_cursor = None
+        if cursor is not None:
+            previous_cursor = encode_cursor(objects[0]) if objects else token
+        return KeysetPage(objects, self, next_cursor, previous_cursor, token)
+
+    def _page_before(self, cursor, token):
+        pub_date, pk = cursor
+        queryset = self.object_list.order_by('pub_date', 'pk').filter(
+            Q(pub_date__gte=pub_date) & ~Q(pub_date=pub_date, pk__lte=pk)
+        )
+        rows = list(queryset[:self.per_page + 1])
+        objects = rows[:self.per_page][::-1]
+        if len(rows) <= self.per_page:
+            # Дошли до начала ленты: отдаём первую страницу целиком.
+            return self._page_after(None, '')
+        return KeysetPage(
+            objects, self,
+            next_cursor=token,
+            previous_cursor=encode_cursor(objects[0]),
+            cursor=token,
+        )
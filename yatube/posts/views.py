@@ -1,73 +1,190 @@
 from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.decorators import login_required
-from .models import Post, Group, Follow
+from .models import Comment, Post, Group, Follow
 from django.shortcuts import redirect
 from django.contrib.auth import get_user_model
 from .forms import PostForm, CommentForm
-from .utils import paginate_page
+from .utils import KeysetPaginator, count_key, paginate_page
+from . import counters, generations, search, shards, timeline
+from .conditional import conditional
+from .pagecache import page_cache, tag
+from core.db.router import replica_reads
+from core.querybudget import query_budget
+from django.utils.http import urlencode
+from yatube.settings import COMMENTS_PER_PAGE, PER_PAGE
 
 
 User = get_user_model()
 
 
+def index_scopes(request):
+    return ['posts']
+
+
+def group_scopes(request, slug):
+    pk = Group.objects.filter(slug=slug).values_list('pk', flat=True).first()
+    return None if pk is None else [f'group:{pk}']
+
+
+def profile_scopes(request, username):
+    pk = User.objects.filter(
+        username=username).values_list('pk', flat=True).first()
+    return None if pk is None else [f'author:{pk}']
+
+
+def post_scopes(request, post_id):
+    author_id = shards.author_of(post_id)
+    if author_id is None:
+        return None
+    return [f'post:{post_id}', f'author:{author_id}']
+
+
+@replica_reads
+@conditional(index_scopes)
+@page_cache
+@query_budget(6)
 def index(request):
     template = 'posts/index.html'
-    posts = Post.objects.select_related('group').all()
-    page_obj = paginate_page(request, posts)
+    tag(request, 'posts')
+    posts = shards.merged(Post.objects.select_related('author', 'group'))
+    page_obj = paginate_page(request, posts, count_key('all'))
     context = {
         'page_obj': page_obj,
+        'generation': generations.get('posts'),
     }
     return render(request, template, context)
 
 
+@replica_reads
+@conditional(group_scopes)
+@page_cache
+@query_budget(6)
 def group_posts(request, slug):
     template = 'posts/group_list.html'
-    group = get_object_or_404(Group, slug=slug)
-    posts = group.post_set.all()
-    posts_count = posts.count()
-    page_obj = paginate_page(request, posts)
+    group = get_object_or_404(Group.objects.select_related('stats'), slug=slug)
+    tag(request, f'group:{group.pk}')
+    posts = shards.merged(group.post_set.select_related('author', 'group'))
+    stats = counters.stats_for(group)
+    page_obj = paginate_page(request, posts, count=stats.posts_count)
     context = {
         'page_obj': page_obj,
         'group': group,
-        'posts_count': posts_count
+        'posts_count': page_obj.paginator.count,
+        'generation': generations.get(f'group:{group.pk}'),
     }
     return render(request, template, context)
 
 
+@replica_reads
+@conditional(profile_scopes)
+@page_cache
+@query_budget(7)
 def profile(request, username):
     template = 'posts/profile.html'
-    author = get_object_or_404(User, username=username)
-    posts = author.posts.all()
-    posts_count = posts.count()
+    author = get_object_or_404(
+        User.objects.select_related('stats'), username=username)
+    tag(request, f'author:{author.pk}')
+    posts = author.posts.select_related('author', 'group')
     following = False
     if request.user.is_authenticated:
         if Follow.objects.filter(
             user=request.user, author=author
-        ):
+        ).exists():
             following = True
-    page_obj = paginate_page(request, posts)
+    stats = counters.stats_for(author)
+    page_obj = paginate_page(request, posts, count=stats.posts_count)
     context = {
         'page_obj': page_obj,
-        'posts_count': posts_count,
+        'posts_count': page_obj.paginator.count,
+        'stats': stats,
         'author': author,
-        'following': following
+        'following': following,
+        'generation': generations.get(f'author:{author.pk}'),
     }
     return render(request, template, context)
 
 
+@replica_reads
+@conditional(post_scopes)
+@page_cache
+@query_budget(6)
 def post_detail(request, post_id):
     template = 'posts/post_detail.html'
-    post = get_object_or_404(Post, pk=post_id)
-    comments = post.comments.all()
+    tag(request, f'post:{post_id}')
+    post = get_object_or_404(
+        Post.objects.using(shards.for_post(post_id)).select_related(
+            'author__stats', 'group', 'stats'),
+        pk=post_id)
+    tag(request, f'author:{post.author_id}')
     form = CommentForm(request.POST or None)
     context = {
         'post': post,
-        'comments': comments,
+        'author_stats': counters.stats_for(post.author),
+        'post_stats': counters.stats_for(post),
+        'comments': comments_page(request, post.pk),
         'form': form
     }
     return render(request, template, context)
 
 
+def comments_page(request, post_id):
+    """Пачка комментариев поста после курсора ?after=, новые сверху."""
+    comments = Comment.objects.using(shards.for_post(post_id)).filter(
+        post_id=post_id).select_related('author')
+    paginator = KeysetPaginator(comments, COMMENTS_PER_PAGE)
+    return paginator.get_page(after=request.GET.get('after'))
+
+
+@replica_reads
+@conditional(post_scopes)
+@page_cache
+@query_budget(5)
+def post_comments(request, post_id):
+    """HTML следующей пачки комментариев для догрузки на странице поста."""
+    template = 'posts/includes/comments.html'
+    tag(request, f'post:{post_id}')
+    get_object_or_404(
+        Post.objects.using(shards.for_post(post_id)).only('pk'), pk=post_id)
+    context = {
+        'post_id': post_id,
+        'comments': comments_page(request, post_id),
+    }
+    return render(request, template, context)
+
+
+@replica_reads
+@conditional(index_scopes)
+@page_cache
+@query_budget(7)
+def post_search(request):
+    template = 'posts/search.html'
+    tag(request, 'posts')
+    query = request.GET.get('q', '').strip()
+    filters = {'q': query}
+    group_id = author_id = None
+    slug = request.GET.get('group')
+    if slug:
+        filters['group'] = slug
+        group_id = Group.objects.filter(
+            slug=slug).values_list('pk', flat=True).first() or 0
+    username = request.GET.get('author')
+    if username:
+        filters['author'] = username
+        author_id = User.objects.filter(
+            username=username).values_list('pk', flat=True).first() or 0
+    page_obj = search.search_page(
+        query, PER_PAGE, group_id, author_id,
+        after=request.GET.get('after', ''),
+    )
+    context = {
+        'page_obj': page_obj,
+        'query': query,
+        'filters': filters,
+        'filters_query': urlencode(filters),
+    }
+    return render(request, template, context)
+
+
 @login_required
 def post_create(request):
     template = 'posts/post_create.html'
@@ -88,7 +205,8 @@ def post_create(request):
 def post_edit(request, post_id):
     template = 'posts/post_create.html'
     is_edit = True
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_object_or_404(
+        Post.objects.using(shards.for_post(post_id)), pk=post_id)
     if post.author != request.user:
         return redirect('posts:post_detail', post_id=post_id)
     form = PostForm(
@@ -110,7 +228,8 @@ def post_edit(request, post_id):
 
 @login_required
 def add_comment(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_object_or_404(
+        Post.objects.using(shards.for_post(post_id)), pk=post_id)
     form = CommentForm(
         request.POST or None)
     if form.is_valid():
@@ -121,10 +240,12 @@ def add_comment(request, post_id):
     return redirect('posts:post_detail', post_id=post_id)
 
 
+@replica_reads
 @login_required
+@query_budget(7)
 def follow_index(request):
-    posts = Post.objects.filter(author__following__user=request.user)
-    page_obj = paginate_page(request, posts)
+    posts = timeline.feed(request.user).select_related('author', 'group')
+    page_obj = paginate_page(request, posts, count=posts.count())
     context = {
         'page_obj': page_obj,
     }
@@ -1,6 +1,49 @@
 import os
 
 PER_PAGE = 10
+# Комментариев на странице поста и в каждой догружаемой пачке.
+COMMENTS_PER_PAGE = 20
+# 'offset' — ?page=N, 'keyset' — курсоры ?after= / ?before=
+PAGINATION_MODE = 'offset'
+# Посты авторов, у которых подписчиков больше лимита, не раскладываются
+# по лентам подписчиков, а подмешиваются при чтении.
+TIMELINE_FANOUT_LIMIT = 1000
+# Сколько последних постов автора попадает в ленту при подписке.
+TIMELINE_BACKFILL = 500
+# Потоков для фоновой раскладки постов автора, опустившегося
+# до TIMELINE_FANOUT_LIMIT (0 — раскладывать сразу).
+TIMELINE_WORKERS = 1
+# Число постов в выборке кэшируется до создания или удаления поста.
+COUNT_CACHE_TIMEOUT = 60 * 60
+# Выше порога точный COUNT(*) не считается, используется оценка.
+COUNT_ESTIMATE_THRESHOLD = 10_000
+# Потоков для фоновой генерации миниатюр (0 — генерировать сразу)
+# и сколько заданий может ждать в очереди.
+THUMBNAIL_WORKERS = 2
+THUMBNAIL_QUEUE = 100
+# Ширины и форматы вариантов картинки поста для srcset. Последний
+# формат — запасной для <img>, остальные идут в <source>; WEBP
+# пропускается, если Pillow собран без его поддержки.
+THUMBNAIL_WIDTHS = [320, 640, 960]
+THUMBNAIL_FORMATS = ['WEBP', 'JPEG']
+# Загрузка картинок постов (posts.uploads): предельный вес файла,
+# число пикселей (защита от «бомб» декомпрессии), большая сторона
+# сохраняемого оригинала, качество перекодированного JPEG, сколько
+# картинок процесс обрабатывает одновременно и сколько секунд
+# загрузка ждёт своей очереди.
+UPLOAD_MAX_SIZE = 10 * 1024 * 1024
+UPLOAD_MAX_PIXELS = 40_000_000
+UPLOAD_MAX_DIMENSION = 2560
+UPLOAD_JPEG_QUALITY = 85
+UPLOAD_CONCURRENCY = 2
+UPLOAD_WAIT = 10
+# Что делать при превышении бюджета запросов view или N+1:
+# 'log', 'warn', 'raise'; None отключает учёт запросов.
+QUERY_BUDGET_ACTION = 'log'
+# Бюджет для view без декоратора query_budget (None — без бюджета).
+QUERY_BUDGET_DEFAULT = None
+# Сколько одинаковых по форме запросов считается N+1.
+QUERY_REPEAT_THRESHOLD = 5
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -8,6 +51,11 @@ SECRET_KEY = 'd@i*1!9hsxtm3#&c6*w3p#n%t1kdynpvj1!4b=-yirv7j4k9a*'
 
 DEBUG = True
 
+# Кэш целых страниц для анонимных посетителей (posts.pagecache).
+# В тестах выключен (core.testing).
+PAGE_CACHE_ENABLED = os.environ.get('PAGE_CACHE_ENABLED', '1') == '1'
+PAGE_CACHE_TIMEOUT = 60 * 60
+
 ALLOWED_HOSTS = [
     'localhost',
     '127.0.0.1',
@@ -31,6 +79,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.querybudget.QueryBudgetMiddleware',
+    'core.db.router.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -60,15 +110,56 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'yatube.wsgi.application'
 
+TEST_RUNNER = 'core.testing.TestRunner'
+
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        # WAL, PRAGMA и BEGIN IMMEDIATE для нескольких воркеров.
+        'ENGINE': 'core.db.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # У SQLite нет сервера, который закрывал бы простаивающие
+        # соединения: соединение живёт, пока жив поток воркера.
+        'CONN_MAX_AGE': None,
     }
 }
 
+# Реплика для view только на чтение (core.db.router). Локально её
+# заменяет копия основной БД: manage.py sync_replica --interval 5.
+REPLICA_DATABASE = 'replica'
+DATABASES[REPLICA_DATABASE] = {
+    'ENGINE': 'core.db.sqlite3',
+    'NAME': os.path.join(BASE_DIR, 'replica.sqlite3'),
+    'CONN_MAX_AGE': None,
+    'TEST': {'MIRROR': 'default'},
+}
+# С реплики, отстающей больше чем на столько секунд, не читаем.
+REPLICA_MAX_LAG = 30
+
+# Шарды постов и комментариев (posts.shards): авторы распределяются по
+# перечисленным БД, первая — 'default'. С одной БД шардирования нет.
+# Список только дополняется: номер SHARD в настройках БД задаёт
+# диапазон id её постов. Чтобы включить второй шард:
+# POST_SHARDS = ['default', 'shard_1'] и manage.py migrate --database
+# shard_1; авторов между шардами переносит manage.py rebalance.
+POST_SHARDS = ['default']
+DATABASES['shard_1'] = {
+    'ENGINE': 'core.db.sqlite3',
+    'NAME': os.path.join(BASE_DIR, 'shard_1.sqlite3'),
+    'CONN_MAX_AGE': None,
+    'SHARD': 1,
+    # В шарде только посты и комментарии; пользователи, группы
+    # и счётчики читаются из присоединённой основной БД.
+    'OPTIONS': {'attach': {'primary': 'default'}},
+}
+# Сколько секунд запись автора ждёт конца переноса его постов.
+SHARD_MOVE_WAIT = 10
+DATABASE_ROUTERS = [
+    'posts.shards.ShardRouter',
+    'core.db.router.ReplicaRouter',
+]
+
 LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'posts:index'
 
@@ -113,8 +204,16 @@ CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Общий для всех воркеров кэш в файле (core.cache): поколения, карта
+# шардов и отметка sync_replica видны всем процессам. Тесты заменяют
+# его на LocMemCache (core.testing).
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100_000,
+            'MAX_SIZE': 256 * 2 ** 20,
+        },
     }
 }